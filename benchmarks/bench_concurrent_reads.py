@@ -0,0 +1,99 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_concurrent_reads.py:
+
+Benchmark the read throughput of Settings.get_setting() across reader
+thread counts while a writer thread updates the settings, with and
+without copy-on-write mode.
+
+Usage:
+
+python -m benchmarks.bench_concurrent_reads
+
+"""
+
+import os
+import tempfile
+import threading
+import time
+import yaml
+
+from newskylabs.utils.settings import Settings
+
+from benchmarks.generators import make_settings_tree, leaf_keychains
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(settings, keychains, threads, duration=1.0, writes_per_second=100):
+    stop = threading.Event()
+    counts = [0] * threads
+
+    def read(i):
+        get_setting = settings.get_setting
+        n = 0
+        while not stop.is_set():
+            for keychain in keychains:
+                get_setting(keychain)
+            n += len(keychains)
+        counts[i] = n
+
+    def write():
+        i = 0
+        while not stop.wait(1 / writes_per_second):
+            settings.set_setting(keychains[i % len(keychains)], i)
+            i += 1
+
+    readers = [threading.Thread(target=read, args=(i,))
+               for i in range(threads)]
+    writer = threading.Thread(target=write)
+    for thread in readers + [writer]:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in readers + [writer]:
+        thread.join()
+
+    return sum(counts) / duration
+
+def main():
+    tree = make_settings_tree(10000)
+    keychains = leaf_keychains(tree)[:1000]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, 'settings.yaml')
+        with open(settings_file, 'w') as fh:
+            yaml.dump(tree, fh,
+                      Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+
+        for copy_on_write in (False, True):
+            settings = Settings(settings_file, None,
+                                copy_on_write=copy_on_write)
+            for threads in (1, 2, 4, 8):
+                reads = bench(settings, keychains, threads)
+                print('copy-on-write {!s:>5} {} threads: '
+                      '{:10.0f} reads/s'.format(
+                          copy_on_write, threads, reads))
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,108 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_diff.py:
+
+Benchmark diff_settings() between two large settings trees with a few
+changed leaves against comparing their flattened keychains:
+
+- two versions of copy-on-write settings sharing unchanged subtrees,
+- two separately loaded settings using cached fingerprints and
+- two separately loaded settings without fingerprints.
+
+Usage:
+
+python -m benchmarks.bench_diff
+
+"""
+
+import os
+import tempfile
+import timeit
+
+from newskylabs.utils.diff import diff_settings
+from newskylabs.utils.generic import flatten_recursively
+from newskylabs.utils.settings import Settings
+
+from benchmarks.generators import (
+    make_settings,
+    leaf_keychains,
+    write_settings_file,
+)
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def flat_diff(old, new):
+    """Diff two settings by comparing all their leaves."""
+
+    old = dict(flatten_recursively(old))
+    new = dict(flatten_recursively(new))
+
+    return [
+        keychain for keychain in old.keys() | new.keys()
+        if not isinstance(new.get(keychain), (dict, list))
+        and old.get(keychain) != new.get(keychain)
+    ]
+
+def bench(depth, fanout, changes=10):
+    tree = make_settings(depth, fanout)
+    leaves = leaf_keychains(tree)
+    keychains = leaves[::len(leaves) // changes]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, 'settings.yaml')
+        write_settings_file(tree, settings_file)
+        old = Settings(settings_file, None, copy_on_write=True)
+        new = Settings(settings_file, None, copy_on_write=True)
+
+    old_settings = old.get_settings()
+    new.set_settings({keychain: 'changed' for keychain in keychains})
+    old.set_settings({keychain: 'changed' for keychain in keychains})
+    versioned = old.get_settings()
+    old.set_settings({keychain: 'x' for keychain in keychains})
+    old.fingerprint()
+    new.fingerprint()
+
+    def run(diff):
+        return min(timeit.repeat(diff, number=1, repeat=5)) * 1e3
+
+    t_flat = run(lambda: flat_diff(old.get_settings(), new.get_settings()))
+    t_shared = run(lambda: diff_settings(old_settings, versioned))
+    t_cached = run(lambda: old.diff_settings(new))
+    t_plain = run(lambda: diff_settings(old.get_settings(),
+                                        new.get_settings()))
+
+    assert len(old.diff_settings(new)) == len(keychains)
+
+    print('{:>8} leaves, {} changes: flattened {:8.2f} ms, '
+          'shared subtrees {:6.2f} ms, cached fingerprints {:6.2f} ms, '
+          'deep {:8.2f} ms'.format(
+              len(leaves), len(keychains),
+              t_flat, t_shared, t_cached, t_plain))
+
+def main():
+    for depth, fanout in ((3, 10), (5, 10)):
+        bench(depth, fanout)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
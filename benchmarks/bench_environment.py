@@ -0,0 +1,94 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_environment.py:
+
+Benchmark refreshing the settings overwritten by environment variables
+with Settings.refresh_environment() against scanning the whole
+environment and calling set_setting() for every matching variable.
+
+Usage:
+
+python -m benchmarks.bench_environment
+
+"""
+
+import os
+import tempfile
+import timeit
+
+import yaml
+
+from newskylabs.utils.settings import Settings
+from newskylabs.utils.settings_env import EnvironmentOverlay
+
+from benchmarks.generators import make_settings, write_settings_file
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def scan_environment(settings, environ, prefix):
+    """Scan the whole environment and set the matching settings."""
+
+    for name, value in environ.items():
+        if name.startswith(prefix):
+            keychain = name[len(prefix):].lower().replace('__', '.')
+            settings.set_setting(keychain, yaml.safe_load(value))
+
+def bench(variables, matching, refreshes=100):
+    environ = {'VAR{}'.format(i): str(i) for i in range(variables)}
+    environ.update(
+        ('APP__KEY{}__KEY{}'.format(i % 5, i), str(i))
+        for i in range(matching))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, 'settings.yaml')
+        write_settings_file(make_settings(3, 5), settings_file)
+        settings = Settings(
+            settings_file, None,
+            environment=EnvironmentOverlay('APP__', environ=environ))
+
+    def refresh():
+        # Change one variable per refresh
+        for i in range(refreshes):
+            environ['APP__KEY0__KEY0'] = str(i)
+            settings.refresh_environment()
+
+    def scan():
+        for i in range(refreshes):
+            environ['APP__KEY0__KEY0'] = str(i)
+            scan_environment(settings, environ, 'APP__')
+
+    t_scan = min(timeit.repeat(scan, number=1, repeat=5)) / refreshes
+    t_refresh = min(timeit.repeat(refresh, number=1, repeat=5)) / refreshes
+
+    print('{:>6} variables, {:>4} matching: scan + set_setting {:8.1f} us, '
+          'refresh_environment {:8.1f} us, speedup {:6.1f}x'.format(
+              variables + matching, matching,
+              t_scan * 1e6, t_refresh * 1e6, t_scan / t_refresh))
+
+def main():
+    for variables, matching in ((100, 10), (10000, 10), (10000, 500)):
+        bench(variables, matching)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,96 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_fingerprint.py:
+
+Benchmark change detection of a settings subtree with
+Settings.fingerprint() against a deep comparison with '=='.
+
+Usage:
+
+python -m benchmarks.bench_fingerprint
+
+"""
+
+import copy
+import os
+import tempfile
+import timeit
+
+from newskylabs.utils.settings import Settings
+
+from benchmarks.generators import (
+    make_settings,
+    leaf_keychains,
+    write_settings_file,
+)
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(depth, fanout, checks=1000):
+    tree = {'db': make_settings(depth, fanout), 'other': {'x': 0}}
+    db_keychain = leaf_keychains(tree['db'], 'db')[0]
+    leaves = len(leaf_keychains(tree['db']))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, 'settings.yaml')
+        write_settings_file(tree, settings_file)
+        settings = Settings(settings_file, None)
+
+    old_db = copy.deepcopy(settings.get_setting('db'))
+
+    t_first = min(timeit.repeat(
+        lambda: (settings._fingerprints.clear(), settings.fingerprint('db')),
+        number=1, repeat=5))
+
+    def compare():
+        for i in range(checks):
+            settings.set_setting('other.x', i)
+            settings.get_setting('db') == old_db
+
+    def unchanged():
+        for i in range(checks):
+            settings.set_setting('other.x', i)
+            settings.fingerprint('db')
+
+    def changed():
+        for i in range(checks):
+            settings.set_setting(db_keychain, i)
+            settings.fingerprint('db')
+
+    t_compare = min(timeit.repeat(compare, number=1, repeat=5)) / checks
+    t_unchanged = min(timeit.repeat(unchanged, number=1, repeat=5)) / checks
+    t_changed = min(timeit.repeat(changed, number=1, repeat=5)) / checks
+
+    print('{:>8} leaves: first fingerprint {:8.1f} ms, '
+          'set + == {:9.1f} us, set + fingerprint: unchanged {:6.1f} us, '
+          'changed {:6.1f} us'.format(
+              leaves, t_first * 1e3, t_compare * 1e6,
+              t_unchanged * 1e6, t_changed * 1e6))
+
+def main():
+    for depth, fanout in ((3, 10), (4, 10), (5, 10)):
+        bench(depth, fanout)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
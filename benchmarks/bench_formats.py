@@ -0,0 +1,120 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_formats.py:
+
+Benchmark the parse time of Settings.load_settings_file() for the
+registered settings formats on equivalent settings trees.
+
+Usage:
+
+python -m benchmarks.bench_formats
+
+"""
+
+import json
+import os
+import tempfile
+import timeit
+
+from newskylabs.utils.settings import Settings, YAML_BACKEND
+from newskylabs.utils.settings_formats import (
+    TOML_FORMAT,
+    write_settings_file,
+)
+
+from benchmarks.generators import make_settings
+
+## =========================================================
+## TOML
+## ---------------------------------------------------------
+
+def without_none(settings):
+    """Replace the None values which cannot be represented in toml."""
+
+    return {
+        key: without_none(value) if isinstance(value, dict)
+        else 'none' if value is None else value
+        for key, value in settings.items()
+    }
+
+def write_toml_file(settings, settings_file):
+    """Write settings without lists as a toml file."""
+
+    lines = []
+    stack = [((), settings)]
+    while stack:
+        path, table = stack.pop()
+        if path:
+            lines.append('[{}]'.format('.'.join(path)))
+        for key, value in table.items():
+            if isinstance(value, dict):
+                stack.append((path + (key,), value))
+            elif isinstance(value, bool):
+                lines.append('{} = {}'.format(key, str(value).lower()))
+            elif isinstance(value, str):
+                lines.append('{} = {}'.format(key, json.dumps(value)))
+            else:
+                lines.append('{} = {!r}'.format(key, value))
+
+    with open(settings_file, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(depth, fanout):
+    settings = without_none(make_settings(depth, fanout))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_files = []
+        for suffix in ('.yaml', '.json', '.marshal'):
+            settings_file = os.path.join(tmpdir, 'settings' + suffix)
+            write_settings_file(settings, settings_file)
+            settings_files.append(settings_file)
+        if TOML_FORMAT is not None:
+            settings_file = os.path.join(tmpdir, 'settings.toml')
+            write_toml_file(settings, settings_file)
+            settings_files.append(settings_file)
+
+        results = []
+        for settings_file in settings_files:
+            assert Settings.load_settings_file(settings_file) == settings
+            t = min(timeit.repeat(
+                lambda: Settings.load_settings_file(settings_file),
+                number=1, repeat=5))
+            results.append((os.path.splitext(settings_file)[1][1:],
+                            os.path.getsize(settings_file), t))
+
+    t_yaml = results[0][2]
+    print('{:>8} leaves:'.format(fanout ** depth))
+    for name, size, t in results:
+        print('    {:<8} {:>10} bytes {:10.2f} ms {:8.1f}x'.format(
+            name, size, t * 1e3, t_yaml / t))
+
+def main():
+    print('Active yaml backend: {}'.format(YAML_BACKEND))
+    for depth, fanout in ((3, 10), (5, 10)):
+        bench(depth, fanout)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,114 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_freeze.py:
+
+Benchmark the memory used by frozen settings (see
+newskylabs.utils.frozen.freeze()) against the plain dictionaries
+loaded from YAML.
+
+Usage:
+
+python -m benchmarks.bench_freeze
+
+"""
+
+import gc
+import tracemalloc
+import yaml
+
+from newskylabs.utils.frozen import freeze
+from newskylabs.utils.settings import YAML_LOADER
+from benchmarks.generators import make_settings_tree
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def make_tenant_settings(tenant, leaves):
+    """Make the settings of a tenant.
+
+    All tenants share the structure of their settings and most of
+    their values.
+
+    """
+
+    settings = make_settings_tree(leaves)
+    settings['tenant'] = {
+        'name': 'tenant{}'.format(tenant),
+        'db': {'host': 'db{}'.format(tenant % 10), 'port': 5432},
+        'features': ['a', 'b', 'c'],
+    }
+    return settings
+
+def allocated(make):
+    """Return the memory allocated for the value made by make()."""
+
+    gc.collect()
+    tracemalloc.start()
+    value = make()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del value
+    gc.collect()
+    return size
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(tenants, leaves):
+    documents = [
+        yaml.dump(make_tenant_settings(tenant, leaves)) for tenant in range(tenants)
+    ]
+
+    def load(document):
+        return yaml.load(document, Loader=YAML_LOADER)
+
+    plain_size = allocated(
+        lambda: [load(document) for document in documents])
+
+    # Freeze the settings of all tenants with a shared memo;
+    # the memo is dropped after freezing
+    def freeze_shared():
+        memo = {}
+        return [freeze(load(document), memo) for document in documents]
+
+    shared_size = allocated(freeze_shared)
+
+    # Freeze the settings of every tenant on its own
+    unshared_size = allocated(
+        lambda: [freeze(load(document)) for document in documents])
+
+    print('{:>6} tenants x {:>5} leaves: plain {:7.2f} MB, '
+          'frozen per tenant {:7.2f} MB ({:5.1f}%), '
+          'frozen with shared memo {:7.2f} MB ({:5.1f}%)'.format(
+              tenants, leaves,
+              plain_size / 2**20,
+              unshared_size / 2**20, 100 * unshared_size / plain_size,
+              shared_size / 2**20, 100 * shared_size / plain_size))
+
+def main():
+    for tenants, leaves in ((1, 10000), (1000, 100), (100, 1000)):
+        bench(tenants, leaves)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,170 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_get_setting.py:
+
+Benchmark Settings.get_setting() (using the keychain index) against
+the tree walk of get_recursively() - and the batched lookups of
+Settings.get_settings_many() against the prefix trie walk of
+get_recursively_many() - and reading single settings in a tight loop
+with Settings.accessor().
+
+Usage:
+
+python -m benchmarks.bench_get_setting
+
+"""
+
+import os
+import tempfile
+import timeit
+import yaml
+
+from newskylabs.utils.generic import (
+    get_recursively,
+    get_recursively_many,
+    compile_keychains,
+)
+from newskylabs.utils.settings import Settings
+
+from benchmarks.generators import make_settings_tree, leaf_keychains
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(leaves, lookups=100000):
+    tree = make_settings_tree(leaves)
+    keychains = leaf_keychains(tree)
+    keychains = (keychains * (lookups // len(keychains) + 1))[:lookups]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, 'settings.yaml')
+        with open(settings_file, 'w') as fh:
+            yaml.dump(tree, fh,
+                      Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+        settings = Settings(settings_file, None)
+
+    get_setting = settings.get_setting
+    settings_tree = settings.get_settings()
+
+    t_walk = min(timeit.repeat(
+        lambda: [get_recursively(settings_tree, k) for k in keychains],
+        number=1, repeat=5))
+    t_index = min(timeit.repeat(
+        lambda: [get_setting(k) for k in keychains],
+        number=1, repeat=5))
+
+    print('{:>8} leaves: tree walk {:8.1f} ns/get, index {:8.1f} ns/get, '
+          'speedup {:5.2f}x'.format(
+              leaves,
+              t_walk / lookups * 1e9,
+              t_index / lookups * 1e9,
+              t_walk / t_index))
+
+def bench_many(leaves, batch_size=50, lookups=100000):
+    tree = make_settings_tree(leaves)
+    keychains = leaf_keychains(tree)[-batch_size:]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, 'settings.yaml')
+        with open(settings_file, 'w') as fh:
+            yaml.dump(tree, fh,
+                      Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+        settings = Settings(settings_file, None)
+
+    get_setting = settings.get_setting
+    settings_tree = settings.get_settings()
+    batch = compile_keychains(keychains)
+    batches = lookups // len(keychains)
+
+    def run(get_many):
+        return min(timeit.repeat(
+            lambda: [get_many() for _ in range(batches)],
+            number=1, repeat=5)) / (batches * len(keychains)) * 1e9
+
+    t_single = run(lambda: {k: get_setting(k) for k in keychains})
+    t_many = run(lambda: settings.get_settings_many(batch))
+    t_list = run(lambda: settings.get_settings_many(keychains))
+    t_walk = run(lambda: [get_recursively(settings_tree, k) for k in keychains])
+    t_trie = run(lambda: get_recursively_many(settings_tree, batch))
+
+    print('{:>8} leaves, {} keys/batch: get_setting {:6.1f} ns/key, '
+          'get_settings_many {:6.1f} ns/key ({:6.1f} ns/key with a list), '
+          'tree walk {:6.1f} ns/key, trie walk {:6.1f} ns/key'.format(
+              leaves, len(keychains), t_single, t_many, t_list,
+              t_walk, t_trie))
+
+def bench_accessor(leaves, keychains=5, lookups=1000000):
+    tree = make_settings_tree(leaves)
+    keychains = leaf_keychains(tree)[-keychains:]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, 'settings.yaml')
+        with open(settings_file, 'w') as fh:
+            yaml.dump(tree, fh,
+                      Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+        settings = Settings(settings_file, None)
+
+    get_setting = settings.get_setting
+    accessors = [settings.accessor(k) for k in keychains]
+    loops = lookups // len(keychains)
+
+    def run(read):
+        return min(timeit.repeat(read, number=1, repeat=5)) \
+            / (loops * len(keychains)) * 1e9
+
+    def read_get_setting():
+        for _ in range(loops):
+            for keychain in keychains:
+                get_setting(keychain)
+
+    def read_accessors():
+        for _ in range(loops):
+            for accessor in accessors:
+                accessor()
+
+    def read_changing():
+        # A new version every loop
+        for i in range(loops // 100):
+            settings.set_setting(keychains[0], i)
+            for _ in range(100):
+                for accessor in accessors:
+                    accessor()
+
+    t_get = run(read_get_setting)
+    t_accessor = run(read_accessors)
+    t_changing = run(read_changing)
+
+    print('{:>8} leaves: get_setting {:6.1f} ns/get, accessor {:6.1f} ns/get, '
+          'accessor with a change every 100 loops {:6.1f} ns/get'.format(
+              leaves, t_get, t_accessor, t_changing))
+
+def main():
+    for leaves in (10, 1000, 100000):
+        bench(leaves)
+    for leaves in (1000, 100000):
+        bench_many(leaves)
+    for leaves in (1000, 100000):
+        bench_accessor(leaves)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
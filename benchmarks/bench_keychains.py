@@ -0,0 +1,98 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_keychains.py:
+
+Benchmark get_recursively() with plain and with compiled keychains
+(see newskylabs.utils.generic.compile_keychain()) against the original
+implementation splitting the keychain on every lookup - for working
+sets smaller and larger than the keychain cache.
+
+Usage:
+
+python -m benchmarks.bench_keychains
+
+"""
+
+import timeit
+
+from newskylabs.utils.generic import (
+    KEYCHAIN_CACHE_SIZE,
+    compile_keychain,
+    get_recursively,
+)
+from benchmarks.generators import make_settings_tree, leaf_keychains
+
+## =========================================================
+## The original implementation
+## ---------------------------------------------------------
+
+def get_recursively_split(structure, keychain):
+    """get_recursively() splitting the keychain on every lookup."""
+
+    val = structure
+
+    for key in keychain.split('.'):
+        if isinstance(val, dict) and key in val:
+            val = val[key]
+        elif key.isdigit() and isinstance(val, list) and int(key) < len(val):
+            val = val[int(key)]
+        else:
+            return None
+
+    return val
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(leaves, lookups=200000):
+    tree = make_settings_tree(leaves)
+    keychains = leaf_keychains(tree)
+    keychains = (keychains * (lookups // len(keychains) + 1))[:lookups]
+
+    # Compiled by the caller once - every lookup is a cache hit
+    compiled = [compile_keychain(keychain) for keychain in keychains]
+
+    def run(get, keychains):
+        return min(timeit.repeat(
+            lambda: [get(tree, keychain) for keychain in keychains],
+            number=1, repeat=5)) / lookups * 1e9
+
+    t_split = run(get_recursively_split, keychains)
+    t_plain = run(get_recursively, keychains)
+    t_compiled = run(get_recursively, compiled)
+    t_compile = run(lambda tree, keychain:
+                    get_recursively(tree, compile_keychain(keychain)),
+                    keychains)
+
+    print('{:>7} leaves (cache {}): split {:6.1f} ns/get, '
+          'plain {:6.1f} ns/get, compiled {:6.1f} ns/get, '
+          'compile_keychain() + compiled {:6.1f} ns/get'.format(
+              leaves, KEYCHAIN_CACHE_SIZE,
+              t_split, t_plain, t_compiled, t_compile))
+
+def main():
+    for leaves in (100, 1000, 100000):
+        bench(leaves)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,111 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_load_settings_file.py:
+
+Benchmark Settings.load_settings_file() with the libyaml and the pure
+Python yaml backend - and loading only a small section of a large
+settings file with the 'prefixes' option.
+
+Usage:
+
+python -m benchmarks.bench_load_settings_file
+
+"""
+
+import os
+import tempfile
+import timeit
+import tracemalloc
+import yaml
+
+from newskylabs.utils.settings import Settings, YAML_BACKEND
+
+from benchmarks.generators import make_settings_tree
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(name, leaves, loaders, tmpdir):
+    settings_file = os.path.join(tmpdir, '{}.yaml'.format(name))
+    with open(settings_file, 'w') as fh:
+        yaml.dump(make_settings_tree(leaves), fh,
+                  Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+    size = os.path.getsize(settings_file)
+
+    for backend, loader in loaders:
+        t = min(timeit.repeat(
+            lambda: Settings.load_settings_file(settings_file, loader),
+            number=1, repeat=3))
+        print('{:>6} ({:>10} bytes) {:>7}: {:10.2f} ms'.format(
+            name, size, backend, t * 1e3))
+
+def peak_memory(load):
+    """Return the peak memory allocated while loading."""
+
+    tracemalloc.start()
+    load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def bench_partial(routes, loaders, tmpdir):
+    settings = {
+        'service': {'db': {'host': 'db1', 'port': 5432}, 'workers': 8},
+        'routes': make_settings_tree(routes),
+    }
+    settings_file = os.path.join(tmpdir, 'routes.yaml')
+    with open(settings_file, 'w') as fh:
+        yaml.dump(settings, fh,
+                  Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+    size = os.path.getsize(settings_file)
+
+    for backend, loader in loaders:
+        for name, prefixes in [('full', None), ('partial', ['service'])]:
+            def load():
+                return Settings.load_settings_file(
+                    settings_file, loader, prefixes=prefixes)
+            t = min(timeit.repeat(load, number=1, repeat=3))
+            print('{:>7} ({:>10} bytes) {:>7}: {:10.2f} ms, '
+                  'peak memory {:8.1f} MB'.format(
+                      name, size, backend, t * 1e3,
+                      peak_memory(load) / 2**20))
+
+def main():
+    print('Active backend: {}'.format(YAML_BACKEND))
+
+    loaders = [('python', yaml.SafeLoader)]
+    if hasattr(yaml, 'CSafeLoader'):
+        loaders.insert(0, ('libyaml', yaml.CSafeLoader))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, leaves in [
+                ('small',  100),
+                ('medium', 10000),
+                ('large',  100000),
+        ]:
+            bench(name, leaves, loaders, tmpdir)
+
+        bench_partial(100000, loaders, tmpdir)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
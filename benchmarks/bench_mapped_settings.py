@@ -0,0 +1,138 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_mapped_settings.py:
+
+Benchmark the memory of forked workers reading the settings from a
+settings tree inherited from their parent process against reading them
+from a mapped settings file (see newskylabs.utils.settings_mmap) - and
+the time of the lookups.
+
+Linux only.
+
+Usage:
+
+python -m benchmarks.bench_mapped_settings
+
+"""
+
+import gc
+import multiprocessing
+import os
+import tempfile
+import timeit
+
+from newskylabs.utils.generic import get_recursively
+from newskylabs.utils.settings_mmap import write_mapped_settings, MappedSettings
+from benchmarks.generators import make_settings_tree, leaf_keychains
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def private_dirty_memory():
+    """Return the private dirty memory of the process in kB."""
+
+    with open('/proc/self/smaps_rollup') as fh:
+        for line in fh:
+            if line.startswith('Private_Dirty:'):
+                return int(line.split()[1])
+
+def read_settings(get_setting, leaves, connection):
+    """Read all settings in a forked worker and report the memory used."""
+
+    keychains = leaf_keychains(make_settings_tree(leaves))
+
+    before = private_dirty_memory()
+    for keychain in keychains:
+        get_setting(keychain)
+    connection.send(private_dirty_memory() - before)
+    connection.close()
+
+def worker_memory(workers, get_setting, leaves):
+    """Return the memory used by forked workers reading all settings."""
+
+    context = multiprocessing.get_context('fork')
+    gc.freeze()
+
+    connections = []
+    processes = []
+    for _ in range(workers):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=read_settings, args=(get_setting, leaves, sender))
+        process.start()
+        connections.append(receiver)
+        processes.append(process)
+
+    memory = [connection.recv() for connection in connections]
+    for process in processes:
+        process.join()
+
+    gc.unfreeze()
+    return sum(memory)
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(leaves):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        mapped_file = os.path.join(tmpdir, 'settings.map')
+
+        settings = make_settings_tree(leaves)
+        keychains = leaf_keychains(settings)
+        write_mapped_settings(settings, mapped_file)
+
+        print('{} leaves, mapped settings file {:.1f} MB'.format(
+            leaves, os.path.getsize(mapped_file) / 2**20))
+
+        with MappedSettings(mapped_file) as mapped:
+            t_tree = min(timeit.repeat(
+                lambda: [get_recursively(settings, k) for k in keychains],
+                number=1, repeat=3)) / len(keychains)
+            t_mapped = min(timeit.repeat(
+                lambda: [mapped.get_setting(k) for k in keychains],
+                number=1, repeat=3)) / len(keychains)
+            print('  lookup: tree walk {:.0f} ns/get, mapped {:.0f} ns/get'
+                  .format(t_tree * 1e9, t_mapped * 1e9))
+
+            for workers in (1, 2, 4, 8):
+                plain = worker_memory(
+                    workers,
+                    lambda keychain: get_recursively(settings, keychain),
+                    leaves)
+                print('  {} workers: inherited tree {:8.1f} MB'.format(
+                    workers, plain / 2**10))
+
+            del settings
+            gc.collect()
+
+            for workers in (1, 2, 4, 8):
+                memory = worker_memory(workers, mapped.get_setting, leaves)
+                print('  {} workers: mapped file    {:8.1f} MB'.format(
+                    workers, memory / 2**10))
+
+def main():
+    bench(100000)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,101 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_merge_settings.py:
+
+Benchmark the iterative Settings.merge_settings() against the former
+recursive implementation on synthetic trees of varying depth and
+fan-out.
+
+Usage:
+
+python -m benchmarks.bench_merge_settings
+
+"""
+
+import timeit
+
+from newskylabs.utils.settings import Settings
+
+from benchmarks.generators import make_tree
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def recursive_merge_settings(defaults, overwrite):
+    """The former recursive implementation of Settings.merge_settings()."""
+
+    if isinstance(overwrite, dict) \
+       and isinstance(defaults, dict):
+        merged = defaults
+        for key, value in overwrite.items():
+            if key in defaults:
+                merged[key] = recursive_merge_settings(merged[key], value)
+            else:
+                merged[key] = value
+    else:
+        merged = overwrite
+
+    return merged
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(depth, fanout, repeat=5):
+
+    results = []
+    for merge_settings in [recursive_merge_settings,
+                           Settings.merge_settings,
+                           Settings.merged_settings]:
+        times = []
+        for _ in range(repeat):
+            # merge_settings() is destructive - use fresh trees
+            defaults  = make_tree(depth, fanout, 1)
+            overwrite = make_tree(depth, fanout, 2)
+            try:
+                times.append(timeit.timeit(
+                    lambda: merge_settings(defaults, overwrite), number=1))
+            except RecursionError:
+                break
+        results.append(
+            '{:8.2f} ms'.format(min(times) * 1e3) if times
+            else 'RecursionError')
+
+    print('depth {:>5} fan-out {:>3} ({:>6} leaves): recursive {:>14}, '
+          'iterative {:>14}, non-destructive {:>14}'.format(
+              depth, fanout, fanout ** depth, *results))
+
+def main():
+    for depth, fanout in [
+            (2, 300),
+            (3, 50),
+            (5, 10),
+            (10, 3),
+            (17, 2),
+            (100, 1),
+            (10000, 1),
+    ]:
+        bench(depth, fanout)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
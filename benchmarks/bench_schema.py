@@ -0,0 +1,177 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_schema.py:
+
+Benchmark the compiled validators of a Schema against a naive
+recursive validator interpreting the schema for every value - both
+for validating a large settings tree at once and for validating every
+setting when it is accessed.
+
+Usage:
+
+python -m benchmarks.bench_schema
+
+"""
+
+import os
+import tempfile
+import timeit
+
+from newskylabs.utils.generic import compile_keychain
+from newskylabs.utils.schema import Schema, Field, SchemaError, WILDCARD
+from newskylabs.utils.settings import Settings
+
+from benchmarks.generators import (
+    make_settings,
+    make_schema,
+    leaf_keychains,
+    write_settings_file,
+)
+
+## =========================================================
+## Naive validator
+## ---------------------------------------------------------
+
+def naive_validate(spec, value):
+    """Validate a value by interpreting the schema recursively."""
+
+    field = spec if isinstance(spec, Field) else Field(spec)
+    spec = field.spec
+
+    if value is None and field.nullable:
+        return None
+
+    if isinstance(spec, dict):
+        if not isinstance(value, dict):
+            raise SchemaError('expected a dictionary')
+        validated = {}
+        for key, child in value.items():
+            child_spec = spec.get(key, spec.get(WILDCARD))
+            validated[key] = child if child_spec is None \
+                else naive_validate(child_spec, child)
+        for key, child_spec in spec.items():
+            if key == WILDCARD or key in value:
+                continue
+            if isinstance(child_spec, Field) \
+               and not child_spec.required:
+                validated[key] = child_spec.default
+            else:
+                raise SchemaError('missing required setting', key)
+        return validated
+
+    if isinstance(spec, list):
+        if not isinstance(value, list):
+            raise SchemaError('expected a list')
+        return [naive_validate(spec[0], item) for item in value]
+
+    if spec is bool:
+        if not isinstance(value, bool):
+            raise SchemaError('expected a boolean')
+    elif spec in (int, float, str):
+        try:
+            value = spec(value)
+        except (ValueError, TypeError):
+            raise SchemaError('invalid value')
+    elif isinstance(spec, type) and not isinstance(value, spec):
+        raise SchemaError('invalid value')
+
+    if field.minimum is not None and value < field.minimum:
+        raise SchemaError('value too small')
+    if field.maximum is not None and value > field.maximum:
+        raise SchemaError('value too large')
+
+    return value
+
+def naive_get_setting(settings, spec, keychain):
+    """Get a setting and validate it when accessed."""
+
+    value = settings.get_setting(keychain)
+    for key in compile_keychain(keychain).keys:
+        spec = spec.spec if isinstance(spec, Field) else spec
+        spec = spec.get(key, spec.get(WILDCARD))
+
+    return naive_validate(spec, value)
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench_validate(depth, fanout, list_size=0):
+    tree = make_settings(depth, fanout, list_size)
+    spec = make_schema(tree)
+    schema = Schema(spec)
+    leaves = len(leaf_keychains(tree))
+
+    assert schema.validate(tree) == naive_validate(spec, tree)
+
+    t_naive = min(timeit.repeat(
+        lambda: naive_validate(spec, tree), number=1, repeat=5))
+    t_compiled = min(timeit.repeat(
+        lambda: schema.validate(tree), number=1, repeat=5))
+
+    print('{:>8} leaves: naive {:8.1f} ms, compiled {:8.1f} ms, '
+          'speedup {:5.2f}x'.format(
+              leaves, t_naive * 1e3, t_compiled * 1e3, t_naive / t_compiled))
+
+def bench_access(depth, fanout, lookups=100000):
+    tree = make_settings(depth, fanout)
+    spec = make_schema(tree)
+    keychains = leaf_keychains(tree)
+    keychains = (keychains * (lookups // len(keychains) + 1))[:lookups]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, 'settings.yaml')
+        write_settings_file(tree, settings_file)
+        t_compile = min(timeit.repeat(
+            lambda: Schema(spec), number=1, repeat=5))
+        t_load = min(timeit.repeat(
+            lambda: Settings(settings_file, None),
+            number=1, repeat=5))
+        t_load_schema = min(timeit.repeat(
+            lambda: Settings(settings_file, None, schema=spec),
+            number=1, repeat=5))
+        plain = Settings(settings_file, None)
+        validated = Settings(settings_file, None, schema=spec)
+
+    get_setting = validated.get_setting
+    t_naive = min(timeit.repeat(
+        lambda: [naive_get_setting(plain, spec, k) for k in keychains],
+        number=1, repeat=5))
+    t_compiled = min(timeit.repeat(
+        lambda: [get_setting(k) for k in keychains],
+        number=1, repeat=5))
+
+    print('{:>8} leaves: compile {:6.1f} ms, load {:6.1f} ms, '
+          'load+validate {:6.1f} ms, validate per get {:7.1f} ns/get, '
+          'pre-validated {:7.1f} ns/get'.format(
+              len(leaf_keychains(tree)), t_compile * 1e3, t_load * 1e3,
+              t_load_schema * 1e3,
+              t_naive / lookups * 1e9, t_compiled / lookups * 1e9))
+
+def main():
+    for depth, fanout, list_size in ((3, 10, 0), (5, 10, 0), (3, 20, 10)):
+        bench_validate(depth, fanout, list_size)
+    for depth, fanout in ((3, 10), (5, 10)):
+        bench_access(depth, fanout)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
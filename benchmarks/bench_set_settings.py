@@ -0,0 +1,78 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_set_settings.py:
+
+Benchmark applying many overrides with Settings.set_settings() against
+calling Settings.set_setting() for every override.
+
+Usage:
+
+python -m benchmarks.bench_set_settings
+
+"""
+
+import os
+import tempfile
+import timeit
+import yaml
+
+from newskylabs.utils.settings import Settings
+from benchmarks.generators import make_settings_tree, leaf_keychains
+
+## =========================================================
+## Benchmark
+## ---------------------------------------------------------
+
+def bench(leaves, overrides, copy_on_write):
+    tree = make_settings_tree(leaves)
+    keychains = leaf_keychains(tree)[:overrides]
+    assignments = [(keychain, -1) for keychain in keychains]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, 'settings.yaml')
+        with open(settings_file, 'w') as fh:
+            yaml.dump(tree, fh,
+                      Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+        settings = Settings(settings_file, None, copy_on_write=copy_on_write)
+
+    def set_one_by_one():
+        for keychain, value in assignments:
+            settings.set_setting(keychain, value)
+
+    t_single = min(timeit.repeat(set_one_by_one, number=1, repeat=3))
+    t_batch = min(timeit.repeat(
+        lambda: settings.set_settings(assignments), number=1, repeat=3))
+
+    print('{:>8} leaves, {:>5} overrides, copy-on-write {!s:>5}: '
+          'set_setting {:8.2f} ms, set_settings {:8.2f} ms, '
+          'speedup {:6.2f}x'.format(
+              leaves, overrides, copy_on_write,
+              t_single * 1e3, t_batch * 1e3, t_single / t_batch))
+
+def main():
+    for leaves, overrides in ((10000, 100), (10000, 3000), (100000, 3000)):
+        bench(leaves, overrides, copy_on_write=False)
+    for leaves, overrides in ((10000, 100), (10000, 1000), (100000, 3000)):
+        bench(leaves, overrides, copy_on_write=True)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
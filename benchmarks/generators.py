@@ -0,0 +1,182 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/generators.py:
+
+Generators of synthetic settings for the benchmarks.
+
+"""
+
+import yaml
+
+from newskylabs.utils.generic import flatten_recursively
+from newskylabs.utils.schema import Field
+
+# Use the fast libyaml based dumper when available
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+## =========================================================
+## Settings trees
+## ---------------------------------------------------------
+
+def make_settings_tree(leaves, fanout=10):
+    """Make a settings tree with the given number of leaves."""
+
+    tree = {}
+    for i in range(leaves):
+        node = tree
+        # Distribute the leaves over a tree with the given fan-out
+        n = i // fanout
+        path = []
+        while n:
+            path.append('node{}'.format(n % fanout))
+            n //= fanout
+        for key in path:
+            node = node.setdefault(key, {})
+        node['leaf{}'.format(i)] = i
+    return tree
+
+def make_tree(depth, fanout, value):
+    """Make a complete tree of the given depth and fan-out."""
+
+    tree = {}
+    stack = [(tree, depth)]
+    while stack:
+        node, depth = stack.pop()
+        for i in range(fanout):
+            key = 'key{}'.format(i)
+            if depth == 1:
+                node[key] = value
+            else:
+                node[key] = {}
+                stack.append((node[key], depth - 1))
+
+    return tree
+
+def make_settings(depth, fanout, list_size=0):
+    """Make a complete settings tree with mixed values.
+
+    Parameters
+    ----------
+    depth
+        The depth of the dictionaries.
+    fanout
+        The number of keys of every dictionary.
+    list_size
+        When not 0 every innermost dictionary has an additional key
+        'items' with a list of this many small dictionaries.
+
+    """
+
+    values = [
+        lambda i: i,
+        lambda i: 'value{}'.format(i),
+        lambda i: i / 8,
+        lambda i: i % 2 == 0,
+        lambda i: None,
+    ]
+
+    settings = {}
+    count = 0
+    stack = [(settings, depth)]
+    while stack:
+        node, depth = stack.pop()
+        for i in range(fanout):
+            key = 'key{}'.format(i)
+            if depth == 1:
+                node[key] = values[count % len(values)](count)
+                count += 1
+            else:
+                node[key] = {}
+                stack.append((node[key], depth - 1))
+        if depth == 1 and list_size:
+            node['items'] = [
+                {'id': i, 'name': 'item{}'.format(i)}
+                for i in range(list_size)
+            ]
+
+    return settings
+
+def leaf_keychains(tree, prefix=None):
+    """Return the keychains of all leaves of a settings tree."""
+
+    return [
+        keychain for keychain, value in flatten_recursively(tree, prefix)
+        if not isinstance(value, (dict, list))
+    ]
+
+## =========================================================
+## Schemas
+## ---------------------------------------------------------
+
+def make_schema(settings):
+    """Make a schema of settings made by make_settings()."""
+
+    if isinstance(settings, dict):
+        return {key: make_schema(value) for key, value in settings.items()}
+    if isinstance(settings, list):
+        return [{'id': int, 'name': str}]
+    if settings is None:
+        return Field(str, nullable=True)
+    if type(settings) in (int, float):
+        return Field(type(settings), minimum=0)
+    return type(settings)
+
+## =========================================================
+## Settings files
+## ---------------------------------------------------------
+
+def write_settings_file(settings, settings_file):
+    """Write settings to a yaml settings file."""
+
+    with open(settings_file, 'w') as fh:
+        yaml.dump(settings, fh, Dumper=YAML_DUMPER)
+
+def make_settings_file(settings_file, size, depth=3, fanout=5, list_size=0):
+    """Write a yaml settings file of about the given size.
+
+    The settings file consists of sections made by make_settings()
+    with the given depth, fan-out and list size.
+
+    Parameters
+    ----------
+    settings_file
+        The path of the settings file.
+    size
+        The approximate size of the settings file in bytes.
+
+    Returns
+    -------
+    The settings written to the file.
+
+    """
+
+    section = make_settings(depth, fanout, list_size)
+    section_size = len(yaml.dump(section, Dumper=YAML_DUMPER))
+    sections = max(1, round(size / section_size))
+
+    settings = {
+        'section{}'.format(i): make_settings(depth, fanout, list_size)
+        for i in range(sections)
+    }
+    write_settings_file(settings, settings_file)
+
+    return settings
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,424 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/suite.py:
+
+A benchmark suite for loading, merging, getting and setting settings.
+
+The results of a run are written to a JSON file; two result files can
+be compared to find regressions.
+
+Usage:
+
+python -m benchmarks.suite run [-o results.json] [-k pattern] [--repeat n]
+python -m benchmarks.suite compare old.json new.json [--threshold 0.1]
+
+The exit status of 'compare' is 1 when a benchmark got slower by more
+than the threshold.
+
+"""
+
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from newskylabs.utils.generic import (
+    compile_keychain,
+    get_recursively,
+    set_recursively,
+)
+from newskylabs.utils.settings import Settings, YAML_BACKEND
+from newskylabs.utils.schema import Schema
+
+from benchmarks.generators import (
+    make_settings,
+    make_schema,
+    make_settings_file,
+    write_settings_file,
+    leaf_keychains,
+)
+
+# Format version of the result files
+RESULTS_FORMAT_VERSION = 1
+
+## =========================================================
+## Benchmarks
+## ---------------------------------------------------------
+
+# The registered benchmarks as (name, params, make) triples
+BENCHMARKS = []
+
+def benchmark(name, *params_list):
+    """Register a benchmark for every dictionary of parameters.
+
+    The decorated function is called with a temporary directory and
+    the parameters and returns a triple of
+
+    - a setup function returning the state for a single run,
+    - a function running the benchmark with the state and
+    - the number of operations of a run.
+
+    Only the run function is timed.
+
+    """
+
+    def register(make):
+        for params in params_list:
+            BENCHMARKS.append((name, params, make))
+        return make
+
+    return register
+
+def benchmark_id(name, params):
+    """Return the id of a benchmark with the given parameters."""
+
+    return '{}[{}]'.format(name, ','.join(
+        '{}={}'.format(key, value) for key, value in sorted(params.items())
+    ))
+
+@benchmark('load_settings_file',
+           {'size': 10000},
+           {'size': 1000000},
+           {'size': 1000000, 'list_size': 10})
+def bench_load_settings_file(tmpdir, size, list_size=0):
+    settings_file = os.path.join(tmpdir, 'settings.yaml')
+    make_settings_file(settings_file, size, list_size=list_size)
+
+    def run(_):
+        Settings.load_settings_file(settings_file)
+
+    return (lambda: None), run, 1
+
+@benchmark('merge_settings',
+           {'depth': 2, 'fanout': 300},
+           {'depth': 5, 'fanout': 10},
+           {'depth': 17, 'fanout': 2},
+           {'depth': 3, 'fanout': 20, 'list_size': 10})
+def bench_merge_settings(tmpdir, depth, fanout, list_size=0):
+    defaults  = make_settings(depth, fanout, list_size)
+    overwrite = make_settings(depth, fanout, list_size)
+
+    # merge_settings() is destructive - use fresh trees for every run
+    def setup():
+        return copy.deepcopy(defaults), copy.deepcopy(overwrite)
+
+    def run(state):
+        Settings.merge_settings(*state)
+
+    return setup, run, 1
+
+@benchmark('merged_settings',
+           {'depth': 5, 'fanout': 10})
+def bench_merged_settings(tmpdir, depth, fanout):
+    defaults  = make_settings(depth, fanout)
+    overwrite = make_settings(depth, fanout)
+
+    def run(_):
+        Settings.merged_settings(defaults, overwrite)
+
+    return (lambda: None), run, 1
+
+@benchmark('get_recursively',
+           {'depth': 3, 'fanout': 20},
+           {'depth': 8, 'fanout': 4},
+           {'depth': 2, 'fanout': 10, 'list_size': 100})
+def bench_get_recursively(tmpdir, depth, fanout, list_size=0):
+    settings = make_settings(depth, fanout, list_size)
+    keychains = leaf_keychains(settings)
+
+    def run(_):
+        for keychain in keychains:
+            get_recursively(settings, keychain)
+
+    return (lambda: None), run, len(keychains)
+
+@benchmark('get_recursively_compiled',
+           {'depth': 3, 'fanout': 20},
+           {'depth': 8, 'fanout': 4})
+def bench_get_recursively_compiled(tmpdir, depth, fanout):
+    settings = make_settings(depth, fanout)
+    keychains = [
+        compile_keychain(keychain) for keychain in leaf_keychains(settings)
+    ]
+
+    def run(_):
+        for keychain in keychains:
+            get_recursively(settings, keychain)
+
+    return (lambda: None), run, len(keychains)
+
+@benchmark('set_recursively',
+           {'depth': 3, 'fanout': 20},
+           {'depth': 8, 'fanout': 4})
+def bench_set_recursively(tmpdir, depth, fanout):
+    keychains = leaf_keychains(make_settings(depth, fanout))
+
+    def run(settings):
+        for keychain in keychains:
+            set_recursively(settings, keychain, 1)
+
+    return dict, run, len(keychains)
+
+@benchmark('get_setting',
+           {'depth': 3, 'fanout': 20})
+def bench_get_setting(tmpdir, depth, fanout):
+    settings = make_settings(depth, fanout)
+    keychains = leaf_keychains(settings)
+
+    settings_file = os.path.join(tmpdir, 'settings.yaml')
+    write_settings_file(settings, settings_file)
+    get_setting = Settings(settings_file, None).get_setting
+
+    def run(_):
+        for keychain in keychains:
+            get_setting(keychain)
+
+    return (lambda: None), run, len(keychains)
+
+@benchmark('validate_schema',
+           {'depth': 3, 'fanout': 20, 'list_size': 10},
+           {'depth': 5, 'fanout': 10})
+def bench_validate_schema(tmpdir, depth, fanout, list_size=0):
+    settings = make_settings(depth, fanout, list_size)
+    schema = Schema(make_schema(settings))
+
+    def run(_):
+        schema.validate(settings)
+
+    return (lambda: None), run, 1
+
+@benchmark('accessor',
+           {'depth': 3, 'fanout': 20})
+def bench_accessor(tmpdir, depth, fanout):
+    settings = make_settings(depth, fanout)
+    keychains = leaf_keychains(settings)
+
+    settings_file = os.path.join(tmpdir, 'settings.yaml')
+    write_settings_file(settings, settings_file)
+    settings = Settings(settings_file, None)
+    accessors = [settings.accessor(keychain) for keychain in keychains]
+
+    def run(_):
+        for accessor in accessors:
+            accessor()
+
+    return (lambda: None), run, len(accessors)
+
+## =========================================================
+## Running the benchmarks
+## ---------------------------------------------------------
+
+def run_benchmark(name, params, make, repeat):
+    """Run a benchmark and return its result."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup, run, operations = make(tmpdir, **params)
+        times = time_benchmark(setup, run, operations, repeat)
+
+    return {
+        'name':       name,
+        'params':     params,
+        'operations': operations,
+        'repeat':     repeat,
+        'min':        min(times),
+        'median':     statistics.median(times),
+    }
+
+def time_benchmark(setup, run, operations, repeat):
+    """Return the times per operation of the runs of a benchmark."""
+
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append((time.perf_counter() - start) / operations)
+
+    return times
+
+def run_suite(pattern=None, repeat=5, output=sys.stdout):
+    """Run the benchmarks and return the results.
+
+    Parameters
+    ----------
+    pattern
+        Only run the benchmarks whose id contains the pattern.
+    repeat
+        The number of runs of every benchmark.
+
+    """
+
+    results = {}
+    for name, params, make in BENCHMARKS:
+        key = benchmark_id(name, params)
+        if pattern is not None and not pattern in key:
+            continue
+        result = results[key] = run_benchmark(name, params, make, repeat)
+        print('{:<60} {:>14}'.format(key, format_time(result['min'])),
+              file=output)
+
+    return {
+        'format': RESULTS_FORMAT_VERSION,
+        'metadata': {
+            'created':        datetime.datetime.now().isoformat(),
+            'python':         platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform':       platform.platform(),
+            'yaml_backend':   YAML_BACKEND,
+        },
+        'results': results,
+    }
+
+def format_time(seconds):
+    """Format a time per operation."""
+
+    for unit, factor in [('s', 1), ('ms', 1e3), ('us', 1e6)]:
+        if seconds >= 1 / factor:
+            return '{:.2f} {}/op'.format(seconds * factor, unit)
+
+    return '{:.1f} ns/op'.format(seconds * 1e9)
+
+## =========================================================
+## Comparing results
+## ---------------------------------------------------------
+
+def compare_results(old, new, threshold=0.1):
+    """Compare the results of two runs.
+
+    The fastest runs of the benchmarks are compared.
+
+    Parameters
+    ----------
+    old, new
+        The results of the runs as returned by run_suite().
+    threshold
+        The relative slowdown from which on a benchmark is flagged
+        as regression.
+
+    Returns
+    -------
+    A list of (benchmark id, old time, new time, ratio, status) tuples; the
+    status is one of 'regression', 'improvement', 'ok', 'new' and
+    'removed'.
+
+    """
+
+    old_results = old['results']
+    new_results = new['results']
+
+    comparison = []
+    for key in sorted(set(old_results) | set(new_results)):
+        if not key in new_results:
+            comparison.append(
+                (key, old_results[key]['min'], None, None, 'removed'))
+            continue
+        if not key in old_results:
+            comparison.append(
+                (key, None, new_results[key]['min'], None, 'new'))
+            continue
+
+        old_time = old_results[key]['min']
+        new_time = new_results[key]['min']
+        ratio = new_time / old_time
+
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold):
+            status = 'improvement'
+        else:
+            status = 'ok'
+
+        comparison.append((key, old_time, new_time, ratio, status))
+
+    return comparison
+
+def print_comparison(comparison, output=sys.stdout):
+    """Print the comparison of two runs."""
+
+    for key, old_time, new_time, ratio, status in comparison:
+        print('{:<60} {:>14} {:>14} {:>7} {}'.format(
+            key,
+            format_time(old_time) if old_time is not None else '-',
+            format_time(new_time) if new_time is not None else '-',
+            '{:.2f}x'.format(ratio) if ratio is not None else '-',
+            status.upper() if status == 'regression' else status,
+        ), file=output)
+
+## =========================================================
+## Main
+## ---------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.suite', description=__doc__.split('\n')[2])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument(
+        '-o', '--output', help='write the results to this JSON file')
+    run_parser.add_argument(
+        '-k', dest='pattern',
+        help='only run the benchmarks whose id contains this pattern')
+    run_parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of runs of every benchmark (default: %(default)s)')
+
+    compare_parser = commands.add_parser(
+        'compare', help='compare the results of two runs')
+    compare_parser.add_argument('old', help='results of the old run')
+    compare_parser.add_argument('new', help='results of the new run')
+    compare_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='relative slowdown flagged as regression (default: %(default)s)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run_suite(args.pattern, args.repeat)
+        if args.output:
+            with open(args.output, 'w') as fh:
+                json.dump(results, fh, indent=2)
+        return 0
+
+    with open(args.old) as fh:
+        old = json.load(fh)
+    with open(args.new) as fh:
+        new = json.load(fh)
+
+    comparison = compare_results(old, new, args.threshold)
+    print_comparison(comparison)
+
+    regressions = [c for c in comparison if c[4] == 'regression']
+    if regressions:
+        print('{} regression(s) beyond {:.0%}'.format(
+            len(regressions), args.threshold))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,221 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/diff.py:
+
+Structural diff and patch of settings.
+
+"""
+
+from newskylabs.utils.generic import compile_keychain, set_recursively
+
+# The operations of a delta
+ADD     = 'add'
+REMOVE  = 'remove'
+REPLACE = 'replace'
+
+# Marker for missing values
+_MISSING = object()
+
+## =========================================================
+## Diff
+## ---------------------------------------------------------
+
+def _is_keychain_key(key):
+    """Check if a dictionary key can be part of a keychain."""
+
+    return isinstance(key, str) and not '.' in key
+
+def _same_fingerprint(fingerprints, keys, old, new):
+    """Check if the cached fingerprints of two nodes are the same."""
+
+    keychain = '.'.join(keys)
+    old_cached = fingerprints[0].get(keychain)
+    new_cached = fingerprints[1].get(keychain)
+
+    return old_cached is not None and new_cached is not None \
+        and old_cached[0] is old and new_cached[0] is new \
+        and old_cached[1] == new_cached[1]
+
+def diff_changes(old, new, fingerprints=None, missing=_MISSING):
+    """Find the changes between two settings dictionaries.
+
+    Only the highest changed nodes are returned.  Identical subtrees -
+    the same objects or subtrees with the same cached fingerprints -
+    are skipped without comparing them.  Dictionaries with keys which
+    cannot be part of a keychain are compared as a whole and lists are
+    always compared as a whole.
+
+    Parameters
+    ----------
+    old, new
+        The settings dictionaries.  When one of them is not a
+        dictionary the settings are replaced as a whole.
+    fingerprints
+        An optional pair of the fingerprint caches of the old and the
+        new settings (see newskylabs.utils.fingerprint).  Only the
+        fingerprints which are already cached are used.
+    missing
+        The marker used as value of removed nodes.
+
+    Returns
+    -------
+    A list of (keys, old value, new value) triples; the old values of
+    added nodes and the new values of removed nodes are 'missing'.
+
+    """
+
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        # Settings which are not dictionaries - as the None loaded
+        # from an empty settings file - are replaced as a whole
+        if old is new or type(old) is type(new) and old == new:
+            return []
+        return [((), old, new)]
+
+    changes = []
+
+    # Use an explicit stack instead of recursion
+    stack = [((), old, new)]
+    while stack:
+        keys, old, new = stack.pop()
+
+        if not all(_is_keychain_key(key) for key in old) \
+           or not all(_is_keychain_key(key) for key in new):
+            if old != new:
+                changes.append((keys, old, new))
+            continue
+
+        for key, old_value in old.items():
+            if not key in new:
+                changes.append((keys + (key,), old_value, missing))
+
+        for key, value in new.items():
+            old_value = old.get(key, _MISSING)
+            if old_value is value:
+                continue
+            if old_value is _MISSING:
+                changes.append((keys + (key,), missing, value))
+            elif isinstance(old_value, dict) and isinstance(value, dict):
+                if fingerprints is None or not _same_fingerprint(
+                        fingerprints, keys + (key,), old_value, value):
+                    stack.append((keys + (key,), old_value, value))
+            elif type(old_value) is not type(value) or old_value != value:
+                changes.append((keys + (key,), old_value, value))
+
+    return changes
+
+def diff_settings(old, new, fingerprints=None):
+    """Compute the delta between two settings dictionaries.
+
+    The delta is a minimal list of operations on the keychains of the
+    highest changed nodes:
+
+    - (ADD, keychain, value) - a setting has been added,
+    - (REMOVE, keychain, None) - a setting has been removed,
+    - (REPLACE, keychain, value) - the value of a setting has changed.
+
+    Lists and dictionaries with keys which cannot be part of a
+    keychain are replaced as a whole; when this is the case for the
+    settings themselves - or they are not a dictionary - the keychain
+    is None.  The values are shared
+    with the new settings.
+
+    Parameters
+    ----------
+    old, new
+        The settings dictionaries.
+    fingerprints
+        An optional pair of the fingerprint caches of the old and the
+        new settings - see diff_changes().
+
+    Returns
+    -------
+    The list of operations.
+
+    """
+
+    delta = []
+    for keys, old_value, value in diff_changes(old, new, fingerprints):
+        keychain = '.'.join(keys) if keys else None
+        if old_value is _MISSING:
+            delta.append((ADD, keychain, value))
+        elif value is _MISSING:
+            delta.append((REMOVE, keychain, None))
+        else:
+            delta.append((REPLACE, keychain, value))
+
+    return delta
+
+## =========================================================
+## Patch
+## ---------------------------------------------------------
+
+def delta_changes(delta, missing=_MISSING):
+    """Convert a delta into a list of (keys, value) pairs.
+
+    The values of removed settings are 'missing'; the keys of the
+    settings themselves are ().
+
+    """
+
+    changes = []
+    for op, keychain, value in delta:
+        if op == REMOVE:
+            value = missing
+        elif op != ADD and op != REPLACE:
+            raise ValueError('Invalid operation: {!r}'.format(op))
+        if keychain is None:
+            if value is missing:
+                raise ValueError('The settings cannot be removed!')
+            keys = ()
+        else:
+            keys = compile_keychain(keychain).keys
+        changes.append((keys, value))
+
+    return changes
+
+def patch_settings(settings, delta):
+    """Apply a delta computed by diff_settings() to settings.
+
+    The settings are changed in place.  Added and replaced settings
+    are set like by set_recursively(); removed settings which are
+    already missing are ignored.
+
+    Returns
+    -------
+    The patched settings - a new dictionary when the settings have
+    been replaced as a whole.
+
+    """
+
+    for keys, value in delta_changes(delta):
+        if not keys:
+            settings = value
+        elif value is not _MISSING:
+            set_recursively(settings, '.'.join(keys), value)
+        else:
+            node = settings
+            for key in keys[:-1]:
+                node = node.get(key) if isinstance(node, dict) else None
+            if isinstance(node, dict):
+                node.pop(keys[-1], None)
+
+    return settings
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,191 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/fingerprint.py:
+
+Merkle fingerprints of settings.
+
+"""
+
+import hashlib
+
+from newskylabs.utils.frozen import FrozenDict
+
+# The size of the fingerprints in bytes
+FINGERPRINT_SIZE = 16
+
+_DICT_TYPES = (dict, FrozenDict)
+_LIST_TYPES = (list, tuple)
+_CONTAINER_TYPES = _DICT_TYPES + _LIST_TYPES
+
+# Marker for nodes without keychain which are not cached
+_UNCACHED = object()
+
+## =========================================================
+## Fingerprints
+## ---------------------------------------------------------
+
+def _digest(tag, data):
+    return hashlib.blake2b(
+        data, digest_size=FINGERPRINT_SIZE, person=tag).digest()
+
+def _encode(value):
+    """Encode a value which is not a container."""
+
+    if type(value) is str:
+        # Fast path for the most common keys and values
+        return b'str:' + value.encode('utf-8', 'surrogatepass')
+
+    if isinstance(value, (set, frozenset)):
+        # Sets are not ordered
+        data = ','.join(sorted(map(repr, value)))
+    else:
+        data = repr(value)
+
+    return '{}:{}'.format(type(value).__name__, data).encode('utf-8')
+
+def _frame(data):
+    """Frame encoded data to be unambiguously concatenated."""
+
+    return b'\0' + len(data).to_bytes(4, 'little') + data
+
+def fingerprint(settings, cache=None, keychain=None):
+    """Compute the fingerprint of settings.
+
+    The fingerprint of a dictionary or list is the hash of the keys
+    and values of its items - where dictionaries and lists are
+    represented by their fingerprints - i.e. the settings are hashed
+    as a Merkle tree.  Settings with the same fingerprint are equal;
+    while settings which are equal but have values of different types
+    (e.g. 1 and 1.0) have different fingerprints.
+
+    The fingerprints of the dictionaries and lists can be cached in a
+    dictionary mapping their keychains to pairs of the dictionary or
+    list and its fingerprint.  A cached fingerprint is only used when
+    the dictionary or list at the keychain is still the same object.
+    Objects which have been changed in place have to be removed from
+    the cache - together with all their ancestors.  This way after a
+    change only the fingerprints along the path of the change are
+    computed again.
+
+    Parameters
+    ----------
+    settings
+        The settings.
+    cache
+        An optional dictionary used to cache the fingerprints.
+    keychain
+        The keychain of the settings used as prefix of the keychains
+        in the cache.
+
+    Returns
+    -------
+    The fingerprint as bytes.
+
+    """
+
+    if not isinstance(settings, _CONTAINER_TYPES):
+        return _digest(b'leaf', _encode(settings))
+
+    if cache is None:
+        cache = {}
+
+    # The fingerprints of the visited dictionaries and lists
+    fingerprints = []
+
+    # Use an explicit stack instead of recursion:
+    # the children of a node are visited before the node itself
+    stack = [(settings, keychain, None, None)]
+    while stack:
+        node, keychain, parts, slots = stack.pop()
+
+        if parts is None:
+            cached = None if keychain is _UNCACHED else cache.get(keychain)
+            if cached is not None and cached[0] is node:
+                fingerprints.append(cached[1])
+                continue
+
+            if isinstance(node, _DICT_TYPES):
+                items = sorted((_encode(key), key) for key in node)
+            else:
+                items = [(None, index) for index in range(len(node))]
+
+            # The encoded keys and values of the node - the slots are
+            # the positions of the fingerprints of the children which
+            # are dictionaries or lists themselves
+            parts = []
+            slots = []
+            children = []
+            for encoded_key, key in items:
+                if encoded_key is not None:
+                    parts.append(_frame(encoded_key))
+                value = node[key]
+                if not isinstance(value, _CONTAINER_TYPES):
+                    parts.append(_frame(_encode(value)))
+                    continue
+                if keychain is _UNCACHED \
+                   or encoded_key is not None \
+                   and (not isinstance(key, str) or '.' in key):
+                    child_keychain = _UNCACHED
+                elif keychain is None:
+                    child_keychain = str(key)
+                else:
+                    child_keychain = keychain + '.' + str(key)
+                slots.append(len(parts))
+                parts.append(None)
+                children.append((value, child_keychain, None, None))
+
+            # Visit the children first
+            stack.append((node, keychain, parts, slots))
+            stack.extend(reversed(children))
+            continue
+
+        # The fingerprints of the children are on top of the stack
+        if slots:
+            for slot, child in zip(slots, fingerprints[-len(slots):]):
+                parts[slot] = b'\1' + child
+            del fingerprints[-len(slots):]
+
+        digest = _digest(
+            b'dict' if isinstance(node, _DICT_TYPES) else b'list',
+            b''.join(parts))
+
+        if keychain is not _UNCACHED:
+            cache[keychain] = (node, digest)
+        fingerprints.append(digest)
+
+    return fingerprints[0]
+
+def invalidate_fingerprints(cache, keys):
+    """Remove the cached fingerprints of a setting and its ancestors.
+
+    Parameters
+    ----------
+    cache
+        The dictionary used to cache the fingerprints.
+    keys
+        The keys of the setting.
+
+    """
+
+    cache.pop(None, None)
+    for depth in range(1, len(keys) + 1):
+        cache.pop('.'.join(keys[:depth]), None)
+
+## =========================================================
+## =========================================================
+
+## fin.
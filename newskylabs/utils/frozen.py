@@ -0,0 +1,353 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/frozen.py:
+
+A compact immutable representation of settings trees.
+
+"""
+
+import datetime
+import sys
+
+from collections.abc import Mapping
+
+# Markers for the memo keys of frozen dictionaries and lists
+# and of the shapes of frozen dictionaries
+_NODE = object()
+_SHAPE = object()
+
+## =========================================================
+## Shapes
+## ---------------------------------------------------------
+
+# Shapes with more keys have a dictionary mapping the keys to the
+# positions of their values; smaller shapes are searched linearly
+LINEAR_SEARCH_MAX_KEYS = 16
+
+class _Shape:
+    """The keys of a frozen dictionary.
+
+    Frozen dictionaries with the same keys in the same order can share
+    a single shape.
+
+    """
+
+    __slots__ = ('keys', 'positions')
+
+    def __init__(self, keys):
+        self.keys = tuple(
+            sys.intern(key) if type(key) is str else key for key in keys
+        )
+        if len(keys) > LINEAR_SEARCH_MAX_KEYS:
+            self.positions = {
+                key: position for position, key in enumerate(self.keys)
+            }
+        else:
+            self.positions = None
+
+    def position(self, key, default=None):
+        """Return the position of the value of a key."""
+
+        if self.positions is not None:
+            return self.positions.get(key, default)
+
+        try:
+            return self.keys.index(key)
+        except ValueError:
+            return default
+
+## =========================================================
+## Class FrozenDict
+## ---------------------------------------------------------
+
+class FrozenDict(Mapping):
+    """An immutable and compact dictionary.
+
+    A frozen dictionary only consists of a reference to its shape -
+    which can be shared with other frozen dictionaries having the same
+    keys - and a tuple with its values.  Frozen dictionaries are hashable when
+    their values are hashable.
+
+    """
+
+    __slots__ = ('_shape', '_values', '_hash')
+
+    def __init__(self, items=()):
+        """
+        Parameters
+        ----------
+        items
+            A mapping or an iterable of (key, value) pairs.
+
+        """
+
+        items = dict(items)
+        self._shape = _Shape(tuple(items))
+        self._values = tuple(items.values())
+        self._hash = None
+
+    @classmethod
+    def _make(cls, shape, values):
+        """Make a frozen dictionary from a shape and a tuple of values."""
+
+        frozen = cls.__new__(cls)
+        frozen._shape = shape
+        frozen._values = values
+        frozen._hash = None
+        return frozen
+
+    def __getitem__(self, key):
+        position = self._shape.position(key)
+        if position is None:
+            raise KeyError(key)
+        return self._values[position]
+
+    def __contains__(self, key):
+        return self._shape.position(key) is not None
+
+    def __iter__(self):
+        return iter(self._shape.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        position = self._shape.position(key)
+        if position is None:
+            return default
+        return self._values[position]
+
+    def keys(self):
+        return self._shape.keys
+
+    def values(self):
+        return self._values
+
+    def items(self):
+        return zip(self._shape.keys, self._values)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, FrozenDict) \
+           and self._shape.keys == other._shape.keys:
+            return self._values == other._values
+        return Mapping.__eq__(self, other)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self.items()))
+        return self._hash
+
+    def __reduce__(self):
+        return (FrozenDict, (tuple(self.items()),))
+
+    def __repr__(self):
+        return 'FrozenDict({!r})'.format(dict(self.items()))
+
+## =========================================================
+## Freezing and thawing settings
+## ---------------------------------------------------------
+
+# Types whose equal values are identical
+_EXACT_TYPES = (str, bytes, int, bool, type(None), datetime.date)
+
+def _exact_key(value):
+    """Return a key identifying a value exactly or None.
+
+    Equal values are not always identical: 1 == 1.0 == True,
+    0.0 == -0.0 and (1, 2) == (1.0, 2).  The key of a value includes
+    the types of the value and of its elements and the sign of floats.
+    None is returned for values which cannot be identified this way.
+
+    """
+
+    cls = type(value)
+
+    if cls in _EXACT_TYPES:
+        return (cls, value)
+    if cls is float:
+        return (cls, value.hex())
+    if cls is datetime.datetime:
+        return (cls, value, value.tzinfo)
+    if cls is tuple or cls is frozenset:
+        keys = cls(map(_exact_key, value))
+        if None in keys:
+            return None
+        return (cls, keys)
+
+    return None
+
+def _freeze_leaf(value, memo):
+    """Freeze a leaf value.
+
+    Returns the frozen value and whether it is the canonical value
+    stored in the memo.
+
+    """
+
+    if isinstance(value, (set, frozenset)):
+        value = frozenset(value)
+
+    try:
+        key = _exact_key(value)
+        if key is None:
+            # Values which cannot be identified exactly
+            # are not deduplicated
+            return value, False
+        return memo.setdefault(key, value), True
+    except TypeError:
+        # Unhashable values are not deduplicated
+        return value, False
+
+def freeze(settings, memo=None):
+    """Convert a settings tree into a compact immutable representation.
+
+    Dictionaries are converted into FrozenDicts, lists into tuples and
+    sets into frozensets.  Dictionary keys are interned.  Identical
+    leaf values, identical subtrees and the keys of dictionaries with
+    the same keys are only stored once.
+
+    The frozen settings can be read with get_recursively() and the
+    other utilities of newskylabs.utils.generic.
+
+    Parameters
+    ----------
+    settings
+        The settings tree.
+    memo
+        An optional dictionary used to find identical values and
+        subtrees.  When the same memo is used to freeze several
+        settings trees their identical values and subtrees are shared.
+        The memo keeps all values stored in it alive.
+
+    Returns
+    -------
+    The frozen settings.
+
+    """
+
+    if memo is None:
+        memo = {}
+
+    if not isinstance(settings, (dict, list)):
+        return _freeze_leaf(settings, memo)[0]
+
+    # Maps the ids of the already frozen dictionaries and lists
+    # to their frozen values and whether these are canonical
+    frozen = {}
+    pending = set()
+
+    # Freeze the children before their parents
+    # using an explicit stack instead of recursion
+    stack = [(settings, False)]
+    while stack:
+        node, children_frozen = stack.pop()
+        children = node.values() if isinstance(node, dict) else node
+
+        if not children_frozen:
+            if id(node) in frozen:
+                continue
+            if id(node) in pending:
+                raise ValueError('Recursive settings cannot be frozen!')
+            pending.add(id(node))
+            stack.append((node, True))
+            stack.extend(
+                (child, False) for child in children
+                if isinstance(child, (dict, list)) and not id(child) in frozen
+            )
+            continue
+
+        values = []
+        canonical = True
+        for child in children:
+            if isinstance(child, (dict, list)):
+                value, is_canonical = frozen[id(child)]
+            else:
+                value, is_canonical = _freeze_leaf(child, memo)
+            values.append(value)
+            canonical = canonical and is_canonical
+        values = tuple(values)
+
+        if isinstance(node, dict):
+            keys = tuple(node)
+            # Keys equal to other keys - as True and 1 - only share
+            # the shapes with identical keys
+            shape_key = _exact_key(keys)
+            if shape_key is None:
+                shape = _Shape(keys)
+            else:
+                shape = memo.get((_SHAPE, shape_key))
+                if shape is None:
+                    shape = memo[(_SHAPE, shape_key)] = _Shape(keys)
+            value = FrozenDict._make(shape, values)
+        else:
+            shape = tuple
+            value = values
+
+        if canonical:
+            # The values are canonical and kept alive by the memo;
+            # so their ids identify them
+            key = (_NODE, shape, tuple(map(id, values)))
+            value = memo.setdefault(key, value)
+
+        frozen[id(node)] = (value, canonical)
+        pending.discard(id(node))
+
+    return frozen[id(settings)][0]
+
+def thaw(settings):
+    """Convert frozen settings back into plain dictionaries and lists.
+
+    Parameters
+    ----------
+    settings
+        The frozen settings.
+
+    Returns
+    -------
+    A new settings tree.
+
+    """
+
+    def thaw_node(node):
+        if isinstance(node, FrozenDict):
+            return dict(node.items())
+        if isinstance(node, tuple):
+            return list(node)
+        return node
+
+    thawed = thaw_node(settings)
+    if not isinstance(thawed, (dict, list)):
+        return thawed
+
+    # Use an explicit stack instead of recursion
+    stack = [thawed]
+    while stack:
+        node = stack.pop()
+        items = node.items() if isinstance(node, dict) else enumerate(node)
+        for key, value in list(items):
+            if isinstance(value, (FrozenDict, tuple)):
+                value = node[key] = thaw_node(value)
+                stack.append(value)
+
+    return thawed
+
+## =========================================================
+## =========================================================
+
+## fin.
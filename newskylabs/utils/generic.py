@@ -20,39 +20,342 @@ Generic utilities...
 
 """
 
+import contextlib
+import functools
+import os
+import secrets
+
+from newskylabs.utils.frozen import FrozenDict
+
+## =========================================================
+## Compiled keychains
+## ---------------------------------------------------------
+
+# Maximal number of compiled keychains cached by compile_keychain()
+KEYCHAIN_CACHE_SIZE = 4096
+
+def _parse_index(key):
+    """Parse a key into a list index or return None."""
+
+    if key.isdigit():
+        try:
+            return int(key)
+        except ValueError:
+            # Digits which are not decimal digits as '²'
+            pass
+
+    return None
+
+class Keychain(str):
+    """A compiled keychain.
+
+    A keychain string with its keys already split and the keys which
+    can be used as list indices already parsed.  As Keychain is a
+    subclass of str it can be used everywhere a keychain string is
+    expected.
+
+    """
+
+    def __init__(self, keychain):
+        self.keys  = tuple(self.split('.'))
+        self.steps = tuple((key, _parse_index(key)) for key in self.keys)
+
+    def __repr__(self):
+        return 'Keychain({})'.format(str.__repr__(self))
+
+_compile_keychain = functools.lru_cache(maxsize=KEYCHAIN_CACHE_SIZE)(Keychain)
+
+def compile_keychain(keychain):
+    """Compile a keychain.
+
+    Compiled keychains are cached in a bounded LRU cache.
+
+    Parameters
+    ----------
+    keychain
+        A keychain as 'servers.0.port'.
+
+    Returns
+    -------
+    The compiled Keychain.
+
+    """
+
+    if isinstance(keychain, Keychain):
+        return keychain
+
+    return _compile_keychain(keychain)
+
+class KeychainBatch:
+    """A compiled set of keychains.
+
+    The keychains are compiled once and arranged in a prefix trie so
+    that get_recursively_many() follows every prefix shared by several
+    keychains only once.  A KeychainBatch can be reused for any number
+    of lookups.
+
+    """
+
+    def __init__(self, keychains):
+        """
+        Parameters
+        ----------
+        keychains
+            An iterable of keychains as 'servers.0.port'.
+
+        """
+
+        self.keychains = tuple(map(compile_keychain, keychains))
+
+        # Every trie node is a pair of a dictionary mapping the steps
+        # of the keychains to the child nodes and a list with the
+        # keychains ending in the node
+        self.trie = ({}, [])
+        for keychain in self.keychains:
+            node = self.trie
+            for step in keychain.steps:
+                child = node[0].get(step)
+                if child is None:
+                    child = node[0][step] = ({}, [])
+                node = child
+            node[1].append(keychain)
+
+    def __iter__(self):
+        return iter(self.keychains)
+
+    def __len__(self):
+        return len(self.keychains)
+
+def compile_keychains(keychains):
+    """Compile a set of keychains into a reusable KeychainBatch.
+
+    Parameters
+    ----------
+    keychains
+        An iterable of keychains or a KeychainBatch.
+
+    Returns
+    -------
+    The KeychainBatch.
+
+    """
+
+    if isinstance(keychains, KeychainBatch):
+        return keychains
+
+    return KeychainBatch(keychains)
+
 ## =========================================================
 ## Utilities for python dictionaries
 ## ---------------------------------------------------------
 
+# The types of the dictionaries and lists which can be read - including
+# the frozen settings created by newskylabs.utils.frozen.freeze()
+_DICT_TYPES = (dict, FrozenDict)
+_LIST_TYPES = (list, tuple)
+_CONTAINER_TYPES = _DICT_TYPES + _LIST_TYPES
+
 def set_recursively(structure, path, value):
     """Set a value in a recursive structure."""
 
-    path = path.split('.')
-    lastkey = path.pop()
+    # Keychains compiled by the caller are used as they are; plain
+    # strings are split instead of being compiled and cached - a cache
+    # miss would cost more than splitting
+    keys = path.keys if isinstance(path, Keychain) else path.split('.')
 
-    for key in path:
+    for key in keys[:-1]:
         if not key in structure or not isinstance(structure[key], dict):
             structure[key] = {}
         structure = structure[key]
 
-    structure[lastkey] = value
+    structure[keys[-1]] = value
     
 def get_recursively(structure, keychain):
     """Get a value from a recursive structure."""
 
     val = structure
 
+    if not isinstance(keychain, Keychain):
+        # Plain strings are split instead of being compiled and cached
+        # - a cache miss would cost more than splitting
+        for key in keychain.split('.'):
+            if isinstance(val, _DICT_TYPES) and key in val:
+                val = val[key]
+            elif isinstance(val, _LIST_TYPES):
+                index = _parse_index(key)
+                if index is None or index >= len(val):
+                    return None
+                val = val[index]
+            else:
+                return None
+
+        return val
+
     # Follow the key chain to recursively find the value
-    for key in keychain.split('.'):
-        if isinstance(val, dict) and key in val:
+    for key, index in keychain.steps:
+        if isinstance(val, _DICT_TYPES) and key in val:
             val = val[key]
-        elif key.isdigit() and isinstance(val, list) and int(key) < len(val):
-            val = val[int(key)]
+        elif index is not None and isinstance(val, _LIST_TYPES) \
+             and index < len(val):
+            val = val[index]
         else:
             return None
 
     return val
 
+def get_recursively_many(structure, keychains):
+    """Get many values from a recursive structure.
+
+    The keychains are arranged in a prefix trie and every prefix
+    shared by several keychains is followed only once.
+
+    Parameters
+    ----------
+    structure
+        The recursive structure.
+    keychains
+        An iterable of keychains or a KeychainBatch.
+
+    Returns
+    -------
+    A dictionary mapping the keychains to their values.  The values of
+    undefined keychains are None - as for get_recursively().
+
+    """
+
+    batch = compile_keychains(keychains)
+
+    values = dict.fromkeys(batch.keychains)
+
+    stack = [(structure, batch.trie)]
+    while stack:
+        val, (children, keychains) = stack.pop()
+
+        for keychain in keychains:
+            values[keychain] = val
+
+        for (key, index), child in children.items():
+            if isinstance(val, _DICT_TYPES) and key in val:
+                stack.append((val[key], child))
+            elif index is not None and isinstance(val, _LIST_TYPES) \
+                 and index < len(val):
+                stack.append((val[index], child))
+
+    return values
+
+def flatten_recursively(structure, prefix=None):
+    """Iterate over all (keychain, value) pairs of a recursive structure.
+
+    For every node reachable with get_recursively() a pair of its
+    keychain and its value is generated - including the nodes which
+    are dictionaries or lists themselves.  Dictionary keys which
+    cannot be part of a keychain (keys which are not strings or which
+    contain a '.') are skipped.
+
+    Parameters
+    ----------
+    structure
+        The recursive structure.
+    prefix
+        An optional keychain which is prepended to all keychains.
+
+    """
+
+    # Use an explicit stack instead of recursion
+    # to be safe with deeply nested structures
+    stack = [(prefix, structure)]
+    while stack:
+        keychain, val = stack.pop()
+
+        if isinstance(val, _DICT_TYPES):
+            items = (
+                (key, value) for key, value in val.items()
+                if isinstance(key, str) and not '.' in key
+            )
+        elif isinstance(val, _LIST_TYPES):
+            items = ((str(i), value) for i, value in enumerate(val))
+        else:
+            continue
+
+        for key, value in items:
+            if keychain is not None:
+                key = keychain + '.' + key
+            yield key, value
+            if isinstance(value, _CONTAINER_TYPES):
+                stack.append((key, value))
+
+## =========================================================
+## Utilities for files
+## ---------------------------------------------------------
+
+def _create_temporary_file(directory, mode):
+    """Create a new temporary file in a directory.
+
+    Unlike tempfile.mkstemp() - creating files only readable by their
+    owner - the file is created with the given permissions; as with
+    open() the kernel removes the bits of the umask.  Returns the file
+    descriptor and the path of the file.
+
+    """
+
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+
+    while True:
+        tmp_file = os.path.join(
+            directory, '.tmp-' + secrets.token_hex(8))
+        try:
+            return os.open(tmp_file, flags, mode), tmp_file
+        except FileExistsError:
+            continue
+
+@contextlib.contextmanager
+def atomic_write(path, mode=None, fsync=False):
+    """Open a file to be written atomically.
+
+    The data is written to a temporary file in the same directory
+    which replaces the file when the with statement is left without an
+    exception - otherwise the temporary file is removed.  Readers see
+    either the old or the new file; processes which have opened the
+    old file keep reading it.
+
+        with atomic_write(path) as fh:
+            fh.write(data)
+
+    Parameters
+    ----------
+    path
+        The path of the file.
+    mode
+        The permissions of the file; by default the permissions of
+        files created by open(): 0o666 without the bits of the umask.
+    fsync
+        When True the data is flushed to the disk before the file is
+        replaced.
+
+    Returns
+    -------
+    A context manager yielding the binary file object to write to.
+
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+
+    fd, tmp_file = _create_temporary_file(
+        directory, 0o666 if mode is None else mode)
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            if mode is not None:
+                # Explicit permissions are not restricted by the umask
+                os.chmod(tmp_file, mode)
+            yield fh
+            if fsync:
+                fh.flush()
+                os.fsync(fh.fileno())
+        os.replace(tmp_file, path)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+
 ## =========================================================
 ## =========================================================
 
@@ -0,0 +1,259 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/instrumentation.py:
+
+Access instrumentation for Settings.
+
+"""
+
+import collections
+import itertools
+import time
+
+## =========================================================
+## Class SettingsInstrumentation
+## ---------------------------------------------------------
+
+class SettingsInstrumentation:
+    """Count and time the accesses to the settings of a Settings object.
+
+    While a Settings object is instrumented its get_setting(),
+    get_settings_many(), set_setting() and patch_settings() methods
+    and the commit of transactions - used by set_settings(),
+    transaction() and refresh_environment() as well - are replaced by
+    instrumented versions counting the reads, writes and misses -
+    reads returning None - per keychain.  Optionally every n-th read
+    is timed.  Reloaded settings files are not counted as writes.
+
+    The instrumented methods are installed as attributes of the
+    Settings object; Settings objects which are not instrumented use
+    the methods of their class without any overhead.
+
+    Counting is not synchronized; when several threads access the
+    settings concurrently a few counts might get lost.
+
+    """
+
+    def __init__(self, sample_interval=0):
+        """
+        Parameters
+        ----------
+        sample_interval
+            When not 0 the latency of every sample_interval-th call of
+            get_setting() is measured.
+
+        """
+
+        self.sample_interval = sample_interval
+
+        self.reads  = collections.Counter()
+        self.writes = collections.Counter()
+        self.misses = collections.Counter()
+
+        # Maps keychains to [samples, total ns, maximal ns]
+        self.latencies = {}
+
+        self._settings = None
+        self._installed = False
+
+    def instrument(self, settings):
+        """Install the instrumented methods on a Settings object."""
+
+        if self._installed:
+            raise RuntimeError('The instrumentation is already installed!')
+        self._settings = settings
+        self._installed = True
+
+        cls = type(settings)
+        get_setting = cls.get_setting.__get__(settings)
+        get_settings_many = cls.get_settings_many.__get__(settings)
+        set_setting = cls.set_setting.__get__(settings)
+        commit_changes = cls._commit_changes.__get__(settings)
+        patch_settings = cls.patch_settings.__get__(settings)
+
+        reads = self.reads
+        writes = self.writes
+        misses = self.misses
+        latencies = self.latencies
+        perf_counter_ns = time.perf_counter_ns
+
+        if self.sample_interval:
+            calls = itertools.count(1)
+            interval = self.sample_interval
+
+            def instrumented_get_setting(keychain):
+                reads[keychain] += 1
+                if next(calls) % interval:
+                    value = get_setting(keychain)
+                else:
+                    start = perf_counter_ns()
+                    value = get_setting(keychain)
+                    latency = perf_counter_ns() - start
+                    sample = latencies.get(keychain)
+                    if sample is None:
+                        latencies[keychain] = [1, latency, latency]
+                    else:
+                        sample[0] += 1
+                        sample[1] += latency
+                        if latency > sample[2]:
+                            sample[2] = latency
+                if value is None:
+                    misses[keychain] += 1
+                return value
+
+        else:
+            def instrumented_get_setting(keychain):
+                reads[keychain] += 1
+                value = get_setting(keychain)
+                if value is None:
+                    misses[keychain] += 1
+                return value
+
+        def instrumented_get_settings_many(keychains):
+            values = get_settings_many(keychains)
+            reads.update(values.keys())
+            misses.update(
+                keychain for keychain, value in values.items() if value is None
+            )
+            return values
+
+        def instrumented_set_setting(keychain, value):
+            writes[keychain] += 1
+            return set_setting(keychain, value)
+
+        def instrumented_commit_changes(changes):
+            commit_changes(changes)
+            writes.update('.'.join(keys) for keys, _ in changes)
+
+        def instrumented_patch_settings(delta):
+            delta = list(delta)
+            patch_settings(delta)
+            writes.update(keychain or '' for _, keychain, _ in delta)
+
+        settings.get_setting = instrumented_get_setting
+        settings.get_settings_many = instrumented_get_settings_many
+        settings.set_setting = instrumented_set_setting
+        settings._commit_changes = instrumented_commit_changes
+        settings.patch_settings = instrumented_patch_settings
+
+    def uninstrument(self):
+        """Remove the instrumented methods from the Settings object.
+
+        The Settings object is still referenced by the instrumentation
+        to report the settings which have never been read.
+
+        """
+
+        if not self._installed:
+            return
+        self._installed = False
+
+        for name in ['get_setting', 'get_settings_many', 'set_setting',
+                     '_commit_changes', 'patch_settings']:
+            self._settings.__dict__.pop(name, None)
+
+    def reset(self):
+        """Reset all counters and latencies."""
+
+        self.reads.clear()
+        self.writes.clear()
+        self.misses.clear()
+        self.latencies.clear()
+
+    def never_read(self, settings=None):
+        """Return the keychains of the settings which have never been read.
+
+        A setting counts as read when it or one of its ancestors has
+        been read.  Only the leaves of the settings - settings which
+        are neither dictionaries nor lists - are returned.
+
+        Parameters
+        ----------
+        settings
+            The Settings object; by default the instrumented one -
+            even when the instrumentation has been removed.
+
+        """
+
+        if settings is None:
+            settings = self._settings
+
+        reads = self.reads
+
+        never_read = []
+        for keychain, value in settings.snapshot().index.items():
+            if isinstance(value, (dict, list)):
+                continue
+            keys = keychain.split('.')
+            if not any('.'.join(keys[:depth]) in reads
+                       for depth in range(1, len(keys) + 1)):
+                never_read.append(keychain)
+
+        return sorted(never_read)
+
+    def report(self, top=10):
+        """Return a report of the accesses to the settings.
+
+        Parameters
+        ----------
+        top
+            The number of keychains listed as hot keys and misses.
+
+        Returns
+        -------
+        A dictionary with
+
+        - 'reads', 'writes' and 'misses': the total numbers of reads,
+          writes and misses,
+        - 'miss_rate': the fraction of the reads returning None,
+        - 'hot_keys', 'hot_writes' and 'missed_keys': the most read,
+          written and missed keychains as (keychain, count) pairs,
+        - 'never_read': the keychains of the settings which have never
+          been read (see never_read()),
+        - 'latencies': a dictionary mapping the keychains with sampled
+          reads to dictionaries with the number of 'samples' and the
+          'mean_ns' and 'max_ns' latency of the sampled reads.
+
+        """
+
+        reads = sum(self.reads.values())
+        misses = sum(self.misses.values())
+
+        return {
+            'reads':       reads,
+            'writes':      sum(self.writes.values()),
+            'misses':      misses,
+            'miss_rate':   misses / reads if reads else 0.0,
+            'hot_keys':    self.reads.most_common(top),
+            'hot_writes':  self.writes.most_common(top),
+            'missed_keys': self.misses.most_common(top),
+            'never_read':  self.never_read()
+                           if self._settings is not None else [],
+            'latencies': {
+                keychain: {
+                    'samples': samples,
+                    'mean_ns': total / samples,
+                    'max_ns':  maximum,
+                } for keychain, (samples, total, maximum)
+                in self.latencies.items()
+            },
+        }
+
+## =========================================================
+## =========================================================
+
+## fin.
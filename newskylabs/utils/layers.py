@@ -0,0 +1,236 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/layers.py:
+
+Layered settings resolved lazily through a nested overlay.
+
+"""
+
+from newskylabs.utils.generic import compile_keychain
+
+# Marker for missing values
+_MISSING = object()
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def _merge_values(values):
+    """Merge the values of a node in a list of layers.
+
+    'values' are the values defined by the layers ordered from the
+    highest to the lowest layer.  The result is the same as merging
+    them with Settings.merge_settings() from the lowest to the highest
+    layer - but without modifying any of them.  Unmerged subtrees are
+    shared with the layers.
+
+    """
+
+    if not values:
+        return None
+
+    # Only the dictionaries in the higher layers up to the first value
+    # which is not a dictionary contribute to the merged value
+    dicts = []
+    for value in values:
+        if not isinstance(value, dict):
+            if not dicts:
+                return value
+            break
+        dicts.append(value)
+
+    if len(dicts) == 1:
+        return dicts[0]
+
+    # Start with the keys of the lowest layer
+    # to preserve the key order of merge_settings()
+    dicts.reverse()
+    keys = {}
+    for dic in dicts:
+        keys.update(dict.fromkeys(dic))
+    dicts.reverse()
+
+    return {
+        key: _merge_values([dic[key] for dic in dicts if key in dic])
+        for key in keys
+    }
+
+## =========================================================
+## Class LayeredSettings
+## ---------------------------------------------------------
+
+class LayeredSettings:
+    """Settings composed of an ordered list of named layers.
+
+    The layers - for example 'defaults', 'site', 'user', 'environment'
+    and 'command-line' - are ordered from the lowest to the highest
+    priority.  The settings are the same as when merging the layers
+    with Settings.merge_settings() in this order; but instead of
+    materializing the merged settings, get_setting() probes the layers
+    from the top down following the keychain.  Only when a setting is
+    a dictionary defined by several layers it is merged - and cached
+    until the layers are changed.  This way replacing a layer, as the
+    highest layer for every request, is cheap.
+
+    Layers are not modified.  Merged dictionaries share their unmerged
+    subtrees with the layers and should not be modified either.
+
+    Layers which are None - as loaded from a missing settings file -
+    are ignored.
+
+    """
+
+    def __init__(self, layers=()):
+        """
+        Parameters
+        ----------
+        layers
+            A list of (name, settings) pairs
+            ordered from the lowest to the highest layer.
+
+        """
+
+        self._names  = []
+        self._layers = []
+        self._changed()
+
+        for name, settings in layers:
+            self.set_layer(name, settings)
+
+    def layer_names(self):
+        """Return the names of the layers from the lowest to the highest."""
+
+        return list(self._names)
+
+    def get_layer(self, name):
+        """Return the settings of a layer."""
+
+        return self._layers[self._names.index(name)]
+
+    def set_layer(self, name, settings):
+        """Replace a layer or add it as new highest layer."""
+
+        if name in self._names:
+            self._layers[self._names.index(name)] = settings
+        else:
+            self._names.append(name)
+            self._layers.append(settings)
+
+        self._changed()
+
+    def remove_layer(self, name):
+        """Remove a layer."""
+
+        i = self._names.index(name)
+        del self._names[i]
+        del self._layers[i]
+
+        self._changed()
+
+    def new_child(self, name, settings):
+        """Return new layered settings with an additional highest layer.
+
+        The layers are shared with the original LayeredSettings - only
+        the lists of layers are copied.
+
+        """
+
+        child = LayeredSettings()
+        child._names  = self._names + [name]
+        child._layers = self._layers + [settings]
+        child._changed()
+        return child
+
+    def _changed(self):
+        """Forget all merged settings after a layer has been changed."""
+
+        # Defined layers from the highest to the lowest
+        self._top_down = [
+            layer for layer in reversed(self._layers) if layer is not None
+        ]
+
+        # Merged dictionaries indexed by their keychain
+        self._merged = {}
+
+    def get_settings(self):
+        """Retrive the dictionary with all settings."""
+
+        merged = self._merged.get(None, _MISSING)
+        if merged is _MISSING:
+            merged = self._merged[None] = _merge_values(self._top_down)
+
+        return merged
+
+    def get_setting(self, keychain):
+        """Retrive a setting"""
+
+        keychain = compile_keychain(keychain)
+
+        # The values of the current node in all layers
+        # contributing to its merged value
+        values = self._top_down
+
+        for key, index in keychain.steps:
+            if not values:
+                return None
+            node = values[0]
+
+            if isinstance(node, dict):
+                next_values = []
+                for node in values:
+                    if not isinstance(node, dict):
+                        # Layers which are not dictionaries overwrite
+                        # all lower layers
+                        break
+                    value = node.get(key, _MISSING)
+                    if value is _MISSING:
+                        # Not defined in this layer
+                        continue
+                    if not isinstance(value, dict):
+                        # Values which are not dictionaries overwrite
+                        # all lower layers but are overwritten by
+                        # dictionaries in the higher layers
+                        if not next_values:
+                            next_values.append(value)
+                        break
+                    next_values.append(value)
+
+                if not next_values:
+                    return None
+                values = next_values
+
+            elif index is not None and isinstance(node, list) \
+                 and index < len(node):
+                values = [node[index]]
+
+            else:
+                return None
+
+        if len(values) == 1:
+            return values[0]
+
+        # A dictionary defined in several layers
+        merged = self._merged.get(keychain)
+        if merged is None:
+            merged = self._merged[keychain] = _merge_values(values)
+
+        return merged
+
+## =========================================================
+## =========================================================
+
+## fin.
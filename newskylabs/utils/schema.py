@@ -0,0 +1,469 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/schema.py:
+
+Declarative schemas for settings compiled into validator functions.
+
+"""
+
+import copy
+
+# Marker for missing values
+_MISSING = object()
+
+# Key of the schema of all keys of a dictionary not in its schema
+WILDCARD = '*'
+
+## =========================================================
+## Class SchemaError
+## ---------------------------------------------------------
+
+class SchemaError(ValueError):
+    """A setting does not match the schema."""
+
+    def __init__(self, message, keychain=None):
+        """
+        Parameters
+        ----------
+        message
+            The error message.
+        keychain
+            The keychain of the setting.
+
+        """
+
+        super().__init__(message, keychain)
+        self.message = message
+        self.keychain = keychain
+
+    def __str__(self):
+        if self.keychain is None:
+            return self.message
+        return '{}: {}'.format(self.keychain, self.message)
+
+    def prefixed(self, keychain):
+        """Return the error with a keychain prefixed to its keychain."""
+
+        if not keychain:
+            return self
+        if self.keychain is not None:
+            keychain = keychain + '.' + self.keychain
+        return SchemaError(self.message, keychain)
+
+## =========================================================
+## Class Field
+## ---------------------------------------------------------
+
+class Field:
+    """The schema of a setting with options.
+
+    Schemas are made of
+
+    - dictionaries mapping keys to the schemas of their values - the
+      schema of all other keys can be given with the key '*',
+    - lists with the schema of their items as single element,
+    - the types int, float, str and bool - the values are converted to
+      the type when possible (e.g. '8080' to 8080),
+    - other types - the values have to be instances of the type,
+    - functions converting the values - raising a ValueError or a
+      TypeError for invalid values,
+    - None - any value is accepted,
+    - Fields for settings with options.
+
+    """
+
+    def __init__(self, spec, default=_MISSING, required=None,
+                 nullable=False, choices=None, minimum=None, maximum=None):
+        """
+        Parameters
+        ----------
+        spec
+            The schema of the setting.
+        default
+            The default value used when the setting is missing.
+        required
+            Whether the setting is required; by default settings
+            without default value are required.
+        nullable
+            Whether the setting can be None.
+        choices
+            An optional collection of the valid values.
+        minimum, maximum
+            Optional bounds of the valid values.
+
+        """
+
+        self.spec     = spec
+        self.default  = default
+        self.required = default is _MISSING if required is None else required
+        self.nullable = nullable
+        self.choices  = choices
+        self.minimum  = minimum
+        self.maximum  = maximum
+
+## =========================================================
+## Coercers
+## ---------------------------------------------------------
+
+_TRUE  = frozenset(['true', 'yes', 'on', '1'])
+_FALSE = frozenset(['false', 'no', 'off', '0'])
+
+def _type_name(value):
+    return type(value).__name__
+
+def _coerce_int(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value.strip(), 10)
+        except ValueError:
+            pass
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise SchemaError(
+        'expected an integer, got {!r}'.format(value)
+        if isinstance(value, (str, float))
+        else 'expected an integer, got {}'.format(_type_name(value)))
+
+def _coerce_float(value):
+    if type(value) is float:
+        return value
+    if type(value) is int:
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            raise SchemaError('expected a number, got {!r}'.format(value))
+    raise SchemaError('expected a number, got {}'.format(_type_name(value)))
+
+def _coerce_str(value):
+    if type(value) is str:
+        return value
+    if type(value) in (int, float):
+        # As version numbers parsed as numbers
+        return str(value)
+    raise SchemaError('expected a string, got {}'.format(_type_name(value)))
+
+def _coerce_bool(value):
+    if type(value) is bool:
+        return value
+    if isinstance(value, (str, int)):
+        normalized = str(value).strip().lower()
+        if normalized in _TRUE:
+            return True
+        if normalized in _FALSE:
+            return False
+    raise SchemaError('expected a boolean, got {!r}'.format(value))
+
+_COERCERS = {
+    int:   _coerce_int,
+    float: _coerce_float,
+    str:   _coerce_str,
+    bool:  _coerce_bool,
+}
+
+## =========================================================
+## Compiling schemas
+## ---------------------------------------------------------
+
+class _Node:
+    """A compiled schema node."""
+
+    __slots__ = ('validate', 'children', 'wildcard', 'default', 'required')
+
+def _instance_validator(cls):
+    def validate(value):
+        if not isinstance(value, cls):
+            raise SchemaError('expected {}, got {}'.format(
+                cls.__name__, _type_name(value)))
+        return value
+    return validate
+
+def _function_validator(function):
+    def validate(value):
+        try:
+            return function(value)
+        except (ValueError, TypeError) as error:
+            if isinstance(error, SchemaError):
+                raise
+            raise SchemaError('invalid value {!r}: {}'.format(value, error))
+    return validate
+
+def _dict_validator(children, wildcard):
+    fields = tuple(
+        (key, node.validate, node.default, node.required)
+        for key, node in children.items()
+    )
+    validate_wildcard = wildcard.validate if wildcard is not None else None
+
+    def validate(value):
+        if not isinstance(value, dict):
+            raise SchemaError(
+                'expected a dictionary, got {}'.format(_type_name(value)))
+
+        # Only copy the dictionary when it is changed
+        validated = value
+
+        for key, validate_child, default, required in fields:
+            child = value.get(key, _MISSING)
+            if child is _MISSING:
+                if default is not _MISSING:
+                    new_child = copy.deepcopy(default)
+                elif required:
+                    raise SchemaError('missing required setting', key)
+                else:
+                    continue
+            else:
+                try:
+                    new_child = validate_child(child)
+                except SchemaError as error:
+                    raise error.prefixed(key) from None
+                if new_child is child:
+                    continue
+            if validated is value:
+                validated = dict(value)
+            validated[key] = new_child
+
+        if validate_wildcard is not None:
+            for key, child in value.items():
+                if key in children:
+                    continue
+                try:
+                    new_child = validate_wildcard(child)
+                except SchemaError as error:
+                    raise error.prefixed(str(key)) from None
+                if new_child is not child:
+                    if validated is value:
+                        validated = dict(value)
+                    validated[key] = new_child
+
+        return validated
+
+    return validate
+
+def _list_validator(item):
+    validate_item = item.validate
+
+    def validate(value):
+        if not isinstance(value, list):
+            raise SchemaError(
+                'expected a list, got {}'.format(_type_name(value)))
+
+        validated = value
+        for index, child in enumerate(value):
+            try:
+                new_child = validate_item(child)
+            except SchemaError as error:
+                raise error.prefixed(str(index)) from None
+            if new_child is not child:
+                if validated is value:
+                    validated = list(value)
+                validated[index] = new_child
+
+        return validated
+
+    return validate
+
+def _constrained_validator(validate, field):
+    choices = field.choices
+    minimum = field.minimum
+    maximum = field.maximum
+
+    def constrained_validate(value):
+        value = validate(value)
+        if choices is not None and not value in choices:
+            raise SchemaError('{!r} is not one of {!r}'.format(value, choices))
+        if minimum is not None and value < minimum:
+            raise SchemaError('{!r} is less than {!r}'.format(value, minimum))
+        if maximum is not None and value > maximum:
+            raise SchemaError('{!r} is greater than {!r}'.format(value, maximum))
+        return value
+
+    return constrained_validate
+
+def _nullable_validator(validate):
+    def nullable_validate(value):
+        if value is None:
+            return None
+        return validate(value)
+
+    return nullable_validate
+
+def _compile(spec):
+    """Compile a schema into a _Node."""
+
+    field = spec if isinstance(spec, Field) else Field(spec)
+    spec = field.spec
+
+    node = _Node()
+    node.children = None
+    node.wildcard = None
+
+    if isinstance(spec, dict):
+        node.children = {
+            key: _compile(child) for key, child in spec.items()
+            if key != WILDCARD
+        }
+        if WILDCARD in spec:
+            node.wildcard = _compile(spec[WILDCARD])
+        validate = _dict_validator(node.children, node.wildcard)
+    elif isinstance(spec, list):
+        if len(spec) != 1:
+            raise TypeError(
+                'The schema of a list has to contain exactly one schema!')
+        validate = _list_validator(_compile(spec[0]))
+    elif spec is None:
+        validate = lambda value: value
+    elif isinstance(spec, type) and spec in _COERCERS:
+        validate = _COERCERS[spec]
+    elif isinstance(spec, type):
+        validate = _instance_validator(spec)
+    elif callable(spec):
+        validate = _function_validator(spec)
+    else:
+        raise TypeError('Invalid schema: {!r}'.format(spec))
+
+    if field.choices is not None \
+       or field.minimum is not None or field.maximum is not None:
+        validate = _constrained_validator(validate, field)
+
+    if field.nullable:
+        validate = _nullable_validator(validate)
+
+    node.validate = validate
+    node.required = field.required
+    node.default = field.default
+    if node.default is not _MISSING:
+        # Defaults have to match the schema as well
+        node.default = validate(node.default)
+
+    return node
+
+## =========================================================
+## Class Schema
+## ---------------------------------------------------------
+
+class Schema:
+    """A compiled schema of settings.
+
+    The schema is compiled once into nested validator functions
+    specialized for every node of the schema.  Validating settings
+    converts the values to the types of the schema and adds the
+    default values of missing settings.  The validated settings are
+    returned - only the dictionaries and lists which had to be changed
+    are copied; the validated settings are not changed.
+
+    See Field for the format of schemas.
+
+    """
+
+    def __init__(self, spec):
+        """
+        Parameters
+        ----------
+        spec
+            The schema.
+
+        """
+
+        self.spec = spec
+        self._root = _compile(spec)
+
+    def validate(self, settings):
+        """Validate settings.
+
+        Returns
+        -------
+        The validated settings.
+
+        Raises
+        ------
+        SchemaError
+            When the settings do not match the schema.
+
+        """
+
+        return self._root.validate(settings)
+
+    def _node(self, keys):
+        """Return the compiled node of a setting or None."""
+
+        node = self._root
+        for key in keys:
+            if node.children is None:
+                return None
+            child = node.children.get(key)
+            node = child if child is not None else node.wildcard
+            if node is None:
+                return None
+
+        return node
+
+    def validation_point(self, keys):
+        """Return the keys of the node a setting is validated with.
+
+        Nodes of the schema without children - as settings validated
+        by a type, a function or a Field with choices or a range - can
+        only be validated as a whole.  For settings inside of such a
+        node the keys of the node are returned, otherwise the keys
+        themselves.
+
+        """
+
+        node = self._root
+        for depth, key in enumerate(keys):
+            if node.children is None:
+                return keys[:depth]
+            child = node.children.get(key)
+            node = child if child is not None else node.wildcard
+            if node is None:
+                break
+
+        return keys
+
+    def validate_setting(self, keys, value):
+        """Validate a single setting.
+
+        Parameters
+        ----------
+        keys
+            The keys of the setting.  All settings along the keys are
+            supposed to be dictionaries.
+        value
+            The value of the setting.
+
+        Returns
+        -------
+        The validated value.
+
+        """
+
+        node = self._node(keys)
+        if node is None:
+            return value
+
+        try:
+            return node.validate(value)
+        except SchemaError as error:
+            raise error.prefixed('.'.join(keys)) from None
+
+## =========================================================
+## =========================================================
+
+## fin.
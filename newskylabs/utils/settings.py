@@ -20,25 +20,663 @@ Utilities to manage project settings.
 
 """
 
+import asyncio
+import copy
 import errno
+import functools
+import itertools
+import logging
 import os
+import threading
 import yaml
 
-from newskylabs.utils.generic import set_recursively, get_recursively
+from newskylabs.utils.generic import (
+    compile_keychain,
+    get_recursively,
+    get_recursively_many,
+    flatten_recursively,
+)
+from newskylabs.utils.instrumentation import SettingsInstrumentation
+from newskylabs.utils.settings_cache import SettingsCache
+from newskylabs.utils.schema import Schema
+from newskylabs.utils.settings_env import EnvironmentOverlay
+from newskylabs.utils.fingerprint import fingerprint, invalidate_fingerprints
+from newskylabs.utils.diff import diff_changes, diff_settings, delta_changes
+from newskylabs.utils.settings_dir import list_settings_dir, load_settings_dir
+from newskylabs.utils.settings_formats import (
+    YAML_LOADER,
+    YAML_BACKEND,
+    YAML_FORMAT,
+    get_settings_format,
+)
+from newskylabs.utils.settings_mmap import write_mapped_settings
+from newskylabs.utils.settings_partial import (
+    load_partial_settings,
+    select_settings,
+)
+
+logger = logging.getLogger(__name__)
+
+# Marker for missing values
+_MISSING = object()
+
+# Marker for values overwritten by an ancestor
+_SHADOWED = object()
+
+# Marker for keychains not changed by the delta of an index
+_UNCHANGED = object()
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def _stat_settings_file(settings_file):
+    """Return the stat data used to detect changes of a settings file.
+
+    The stat data of a settings directory is the stat data of all its
+    settings files.  Files removed while the directory is scanned are
+    skipped.
+
+    """
+
+    if settings_file == None:
+        return None
+
+    try:
+        if os.path.isdir(settings_file):
+            stats = []
+            for path in list_settings_dir(settings_file):
+                stat = _stat_settings_file(path)
+                if stat is not None:
+                    stats.append((path,) + stat)
+            return tuple(stats)
+        stat = os.stat(settings_file)
+    except FileNotFoundError:
+        return None
+
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def _diff_settings(old, new):
+    """Find the changes between two settings dictionaries.
+
+    Returns a list of (keys, value) pairs: the keys of the keychains
+    of the highest changed nodes and their new value - or _MISSING
+    when removed.  Identical subtrees are skipped.  Dictionaries with
+    keys which cannot be part of a keychain are compared as a whole.
+
+    """
+
+    return [
+        (keys, value)
+        for keys, _, value in diff_changes(old, new, missing=_MISSING)
+    ]
+
+def _unshare_settings(settings):
+    """Copy the dictionaries and lists shared by several paths.
+
+    Yaml anchors, aliases and merge keys share a dictionary or list
+    between several paths of the settings.  As set_setting() changes
+    the settings in place, a change made through one path would be
+    seen through the others - but not by their entries in the index.
+    Every dictionary or list reached a second time is replaced by a
+    copy.  The settings are changed in place.
+
+    """
+
+    if not isinstance(settings, (dict, list)):
+        return
+
+    # Use an explicit stack instead of recursion
+    seen = {id(settings)}
+    stack = [settings]
+    while stack:
+        node = stack.pop()
+        items = list(node.items() if isinstance(node, dict)
+                     else enumerate(node))
+        for key, value in items:
+            if not isinstance(value, (dict, list)):
+                continue
+            if id(value) in seen:
+                # Copy shallowly - the shared children of the copy are
+                # copied when the copy is visited
+                value = node[key] = copy.copy(value)
+            seen.add(id(value))
+            stack.append(value)
+
+def _layer_value(layer, keys):
+    """Get the value a settings layer contributes to a node.
+
+    Returns _MISSING when the layer does not define the node and
+    _SHADOWED when the layer overwrites an ancestor of the node with a
+    value which is not a dictionary.
+
+    """
+
+    for key in keys:
+        if not isinstance(layer, dict):
+            return _SHADOWED
+        layer = layer.get(key, _MISSING)
+        if layer is _MISSING:
+            return _MISSING
+
+    return layer
+
+def _update_settings(settings, index, keys, value, copied=None):
+    """Set or remove a setting and update the index accordingly.
+
+    Sets the setting with the given keys like set_recursively() or
+    removes it when the value is _MISSING.  Only the entries of the
+    replaced node and its descendants are updated in the index.
+
+    When 'copied' is given - a dictionary mapping the ids of already
+    copied dictionaries to the dictionaries - the dictionaries along
+    the path are copied before they are modified.  This way settings
+    sharing their dictionaries with other settings can be updated.
+
+    """
+
+    # Find the node which is going to be replaced:
+    # either the last key or the first intermediate node
+    # which is missing or not a dictionary
+    node = settings
+    for depth, key in enumerate(keys, 1):
+        old_value = node.get(key, _MISSING)
+        if depth == len(keys) or not isinstance(old_value, dict):
+            break
+        if copied is not None and not id(old_value) in copied:
+            old_value = node[key] = dict(old_value)
+            copied[id(old_value)] = old_value
+            index['.'.join(keys[:depth])] = old_value
+        node = old_value
+
+    if value is _MISSING and (depth < len(keys) or old_value is _MISSING):
+        # Nothing to remove
+        return
+
+    prefix = '.'.join(keys[:depth])
+
+    if old_value is not _MISSING:
+        for keychain, _ in flatten_recursively(old_value, prefix):
+            index.pop(keychain, None)
+        index.pop(prefix, None)
+
+    if value is _MISSING:
+        del node[key]
+        return
+
+    # Create the missing intermediate dictionaries
+    for key in reversed(keys[depth:]):
+        value = {key: value}
+
+    node[keys[depth - 1]] = value
+    index[prefix] = value
+    index.update(flatten_recursively(value, prefix))
+
+def _validation_points(settings, changes):
+    """Find the subtrees to be validated after applying changes.
+
+    For every change this is the first node along its keys which is
+    created or replaced - or the parent of a removed setting.  Nodes
+    inside of other nodes to be validated are dropped.  'settings' are
+    the settings before the changes have been applied.
+
+    """
+
+    points = set()
+    for keys, value in changes:
+        if value is _MISSING:
+            points.add(keys[:-1])
+            continue
+        node = settings
+        for depth, key in enumerate(keys, 1):
+            node = node.get(key, _MISSING)
+            if depth == len(keys) or not isinstance(node, dict):
+                break
+        points.add(keys[:depth])
+
+    return [
+        keys for keys in points
+        if not any(keys[:depth] in points for depth in range(len(keys)))
+    ]
+
+def _replace_setting(node, keys, value):
+    """Return a copy of a dictionary with the setting at keys replaced.
+
+    Only the dictionaries along the keys are copied.
+
+    """
+
+    root = node = dict(node)
+    for key in keys[:-1]:
+        node[key] = dict(node[key])
+        node = node[key]
+    node[keys[-1]] = value
+
+    return root
+
+def _changes_trie(changes):
+    """Arrange changes in a trie of their keys.
+
+    'changes' is an iterable of (keys, value) pairs.  Every trie node
+    is a list of the value set for the node (or _MISSING) and a
+    dictionary mapping keys to the child nodes.  A later change
+    replaces the earlier changes of the same node and its descendants
+    - as when the changes would be applied one after another.
+
+    """
+
+    trie = [_MISSING, {}]
+    for keys, value in changes:
+        node = trie
+        for key in keys:
+            child = node[1].get(key)
+            if child is None:
+                child = node[1][key] = [_MISSING, {}]
+            node = child
+        node[0] = value
+        node[1] = {}
+
+    return trie
+
+def _update_settings_many(settings, index, changes, copied):
+    """Set many settings and update the index accordingly.
+
+    Has the same effect as calling _update_settings() for all (keys,
+    value) pairs in 'changes' one after another.  But the changes are
+    arranged in a trie first; this way every dictionary along the
+    shared prefixes of the keys is visited - and copied - only once.
+
+    """
+
+    # Use an explicit stack instead of recursion
+    stack = [(settings, None, _changes_trie(changes)[1])]
+    while stack:
+        node, prefix, children = stack.pop()
+
+        for key, (value, grandchildren) in children.items():
+            keychain = key if prefix is None else prefix + '.' + key
+            old_value = node.get(key, _MISSING)
+
+            if value is _MISSING:
+                if isinstance(old_value, dict):
+                    # Only descendants are changed
+                    if not id(old_value) in copied:
+                        old_value = node[key] = dict(old_value)
+                        copied[id(old_value)] = old_value
+                        index[keychain] = old_value
+                    stack.append((old_value, keychain, grandchildren))
+                    continue
+                # Like set_recursively() replace
+                # intermediate nodes which are not dictionaries
+                value = {}
+            elif grandchildren:
+                # The descendants of the new value are changed as well
+                value = dict(value) if isinstance(value, dict) else {}
+
+            if old_value is not _MISSING:
+                for old_keychain, _ in flatten_recursively(old_value, keychain):
+                    index.pop(old_keychain, None)
+
+            node[key] = value
+            index[keychain] = value
+            index.update(flatten_recursively(value, keychain))
+
+            if grandchildren:
+                copied[id(value)] = value
+                stack.append((value, keychain, grandchildren))
+
+def _merge_index(index, delta):
+    """Return a copy of an index with the changes of a delta applied."""
+
+    index = dict(index)
+    for keychain, value in delta.items():
+        if value is _MISSING:
+            index.pop(keychain, None)
+        else:
+            index[keychain] = value
+
+    return index
+
+class _IndexChanges:
+    """The changes of a keychain index made by a copy-on-write update.
+
+    Provides the operations _update_settings() uses to update an index.
+    Instead of copying the index the changed entries are recorded in a
+    delta - removed keychains as _MISSING - and the unchanged index is
+    shared with the earlier snapshots.
+
+    """
+
+    __slots__ = ('index', 'delta')
+
+    def __init__(self, index, delta):
+        self.index = index
+        self.delta = dict(delta)
+
+    def __setitem__(self, keychain, value):
+        self.delta[keychain] = value
+
+    def pop(self, keychain, default=None):
+        self.delta[keychain] = _MISSING
+
+    def update(self, items):
+        self.delta.update(items)
+
+## =========================================================
+## Class SettingsSnapshot
+## ---------------------------------------------------------
+
+class SettingsSnapshot:
+    """A version of the settings together with its keychain index.
+
+    In copy-on-write mode (see Settings) snapshots are immutable and
+    can be read without any locking while new versions of the settings
+    are published.  Otherwise the settings and the index of the current
+    snapshot are changed in place by Settings.set_setting().
+
+    Snapshots published by copy-on-write changes share the index of an
+    earlier snapshot and only keep a delta with the changed entries.
+
+    """
+
+    __slots__ = ('settings', '_index', '_delta', 'version')
+
+    def __init__(self, settings, index, version, delta=None):
+        self.settings = settings
+        self._index   = index
+        self._delta   = {} if delta is None else delta
+        self.version  = version
+
+    @property
+    def index(self):
+        """The dictionary mapping the keychains to the settings."""
+
+        if not self._delta:
+            return self._index
+
+        return _merge_index(self._index, self._delta)
+
+    def get_settings(self):
+        """Retrive the dictionary with all settings."""
+
+        return self.settings
+
+    def get_setting(self, keychain):
+        """Retrive a setting"""
+
+        value = self._delta.get(keychain, _UNCHANGED)
+        if value is _UNCHANGED:
+            value = self._index.get(keychain, _MISSING)
+        if value is _MISSING:
+            # Keychains missing in the index are either undefined
+            # or non-canonical list indices as 'list.01'
+            value = get_recursively(self.settings, keychain)
+
+        return value
+
+    def get_settings_many(self, keychains):
+        """Retrive many settings at once.
+
+        Parameters
+        ----------
+        keychains
+            An iterable of keychains or a KeychainBatch compiled with
+            compile_keychains() to be reused for many lookups.
+
+        Returns
+        -------
+        A dictionary mapping the keychains to their settings.
+
+        """
+
+        # Probe the index with the keychains as they are - only the
+        # keychains missing in the index are compiled
+        index = self._index
+        delta = self._delta
+        values = {}
+        missing = []
+        for keychain in keychains:
+            value = delta.get(keychain, _UNCHANGED)
+            if value is _UNCHANGED:
+                value = index.get(keychain, _MISSING)
+            if value is _MISSING:
+                missing.append(keychain)
+            else:
+                values[keychain] = value
+
+        if missing:
+            # Walk the settings tree only once for all keychains
+            # missing in the index
+            values.update(get_recursively_many(self.settings, missing))
+
+        return values
+
+## =========================================================
+## Class SettingsTransaction
+## ---------------------------------------------------------
+
+class SettingsTransaction:
+    """A batch of settings changed atomically.
+
+    The changes are collected by set_setting() and applied all at once
+    by commit() - or discarded by rollback().  Used as a context
+    manager the transaction is committed at the end of the with block
+    unless an exception has been raised.
+
+    A transaction is created with Settings.transaction().
+
+    """
+
+    def __init__(self, settings):
+        """
+        Parameters
+        ----------
+        settings
+            The Settings the transaction belongs to.
+
+        """
+
+        self._settings = settings
+        self._changes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def __len__(self):
+        return len(self._changes)
+
+    def set_setting(self, keychain, value):
+        """Set a setting when the transaction is committed."""
+
+        self._changes.append((compile_keychain(keychain).keys, value))
+
+    def commit(self):
+        """Apply all changes of the transaction at once."""
+
+        changes, self._changes = self._changes, []
+        self._settings._commit_changes(changes)
+
+    def rollback(self):
+        """Discard all changes of the transaction."""
+
+        self._changes = []
 
 ## =========================================================
 ## Class Settings
 ## ---------------------------------------------------------
 
 class Settings:
-    """A simple class to manage project settings"""
+    """A simple class to manage project settings
+
+    Besides the settings tree the class maintains a flat index mapping
+    the keychains of all settings (e.g. 'a.b.c') to their values.  The
+    index is built once when the settings are loaded and kept in sync
+    by set_setting() which turns get_setting() into a single dictionary
+    lookup.  get_settings_many() reads many settings from the same
+    snapshot at once.
+
+    The index is not aware of changes made directly to the dictionaries
+    returned by get_settings() or get_setting().  After such changes
+    reindex_settings() has to be called.
+
+    Optionally the merged settings are cached on disk by a
+    SettingsCache; then the settings files are only parsed and merged
+    again when they have been changed.
+
+    In lazy mode the settings files are not loaded by the constructor
+    but - thread-safely and exactly once - when the settings are
+    accessed for the first time.
+
+    The settings and their index are held by a SettingsSnapshot which
+    is replaced as a whole when the settings are reloaded; this way
+    readers never see partially reloaded settings.  Every change of
+    the settings increments the version of the snapshot.  Settings
+    read in tight loops can be read with an accessor() caching their
+    value until the version changes.
+
+    By default set_setting() changes the settings in place; readers in
+    other threads might see partially created settings.  In
+    copy-on-write mode set_setting() creates a new version of the
+    settings instead - copying only the dictionaries along the path of
+    the setting and recording the changed entries of the index in a
+    delta shared with the unchanged index - and publishes it as a new
+    snapshot.
+    Readers access the current snapshot with a single attribute read
+    and without any locking; snapshot() returns the current snapshot
+    for consistent reads of several settings.
+
+    Many settings can be changed atomically with a single new version
+    by set_settings() or a transaction().
+
+    diff_settings() computes the delta between two versions of the
+    settings which can be applied with patch_settings().
+
+    fingerprint() returns a cached hash of any subtree of the settings
+    which is only computed again along the paths of changed settings.
 
-    def __init__(self, default_settings_file, user_settings_file):
+    The accesses to the settings can be counted and timed with
+    enable_instrumentation().
+
+    Optionally settings are overwritten by environment variables (see
+    EnvironmentOverlay) when the settings are loaded or reloaded and
+    by refresh_environment().  The environment overlay is applied
+    before the settings are validated.
+
+    Optionally the settings are validated against a Schema.  The
+    schema is compiled once; the settings are validated - and
+    converted to the types of the schema - when they are loaded and
+    every changed subtree is validated when settings are set or
+    reloaded.  This way the values returned by get_setting() are
+    already validated.  Invalid changes raise a SchemaError and are
+    not applied.
+
+    Changes of the settings files are detected by polling their stat
+    data either explicitly with reload_settings() or by a watcher
+    thread started with start_watching().  Only the changed files are
+    parsed again and only the changed subtrees are merged and
+    reindexed again.  The reloaded subtrees replace any changes made
+    with set_setting().
+
+    """
+
+    def __init__(self, default_settings_file, user_settings_file,
+                 cache=None, lazy=False, copy_on_write=False,
+                 parsed_settings=None, schema=None, environment=None):
         """
+        Parameters
+        ----------
+        default_settings_file
+            The default settings file.
+        user_settings_file
+            The user settings file overwriting the default settings
+            or None.
+        cache
+            An optional SettingsCache or the path of a cache directory
+            to be used for a SettingsCache.
+        lazy
+            When True the settings files are only loaded when the
+            settings are accessed for the first time.
+        copy_on_write
+            When True the settings are never changed in place but
+            replaced by new versions.
+        parsed_settings
+            An optional dictionary mapping settings files to their
+            already parsed settings.  A copy of them is used instead of
+            loading the files again.
+        schema
+            An optional Schema or the specification of a schema
+            (see Field) the settings are validated against.
+        environment
+            An optional EnvironmentOverlay or the prefix of the
+            environment variables to be used for an EnvironmentOverlay
+            (e.g. 'APP__').
+
         """
-        self.init_settings(default_settings_file, user_settings_file)
-        
-    def init_settings(self, default_settings_file, user_settings_file):
+
+        if schema is not None and not isinstance(schema, Schema):
+            schema = Schema(schema)
+        self.schema = schema
+
+        if environment is not None \
+           and not isinstance(environment, EnvironmentOverlay):
+            environment = EnvironmentOverlay(environment)
+        self.environment = environment
+
+        if cache is not None and not isinstance(cache, SettingsCache):
+            cache = SettingsCache(cache)
+        self.settings_cache = cache
+
+        self._lazy_lock = threading.Lock()
+        self._lazy_settings_files = None
+
+        self._copy_on_write = copy_on_write
+        self._versions = itertools.count()
+
+        # Writers - set_setting() and reload_settings() - are serialized
+        self._write_lock = threading.RLock()
+
+        self._watcher = None
+
+        self.instrumentation = None
+
+        # Cached fingerprints of the settings (see fingerprint())
+        self._fingerprints = {}
+
+        self._parsed_settings = {
+            os.path.abspath(settings_file): settings
+            for settings_file, settings in (parsed_settings or {}).items()
+        }
+
+        self.init_settings(default_settings_file, user_settings_file, lazy)
+
+    def __getattr__(self, name):
+        """Load the settings of a lazy Settings object on first access."""
+
+        # Only called when the attribute is not defined
+        # i.e. when the settings have not been loaded yet
+        if name != '_snapshot' \
+           or self.__dict__.get('_lazy_settings_files') is None:
+            raise AttributeError(name)
+
+        with self._lazy_lock:
+            # The settings might have been loaded by another thread
+            # while waiting for the lock
+            settings_files = self._lazy_settings_files
+            if settings_files is not None:
+                self._publish_settings(self._prepare_settings(
+                    self._load_settings(*settings_files)))
+                self._lazy_settings_files = None
+
+        return self.__dict__[name]
+
+    def init_settings(self, default_settings_file, user_settings_file,
+                      lazy=False):
         """
         """
         
@@ -50,34 +688,258 @@ class Settings:
         
         # Throw an error
         # when the default_settings file does not exist
-        if not os.path.isfile(default_settings_file):
+        if not os.path.exists(default_settings_file):
             raise FileNotFoundError(
                 errno.ENOENT, os.strerror(errno.ENOENT), default_settings_file)
-        
+
+        self._settings_files = (default_settings_file, user_settings_file)
+
+        # Parsed settings files used when reloading them
+        self._settings_layers = None
+
+        if lazy:
+            # Defer loading the settings until they are accessed
+            # the first time (see __getattr__())
+            with self._lazy_lock:
+                self.__dict__.pop('_snapshot', None)
+                self._lazy_settings_files = self._settings_files
+
+        else:
+            self._publish_settings(self._prepare_settings(
+                self._load_settings(default_settings_file, user_settings_file)))
+
+    def _load_settings(self, default_settings_file, user_settings_file):
+        """Load and merge the default and user settings files."""
+
+        # Remember the stat data of the loaded files
+        # to detect when they are changed
+        self._settings_stats = (
+            _stat_settings_file(default_settings_file),
+            _stat_settings_file(user_settings_file),
+        )
+
+        # Use the cached settings
+        # when the settings files have not been changed
+        if self.settings_cache is not None:
+            settings_files = [default_settings_file]
+            if user_settings_file != None:
+                settings_files.append(user_settings_file)
+            fingerprint = self.settings_cache.fingerprint(*settings_files)
+            settings = self.settings_cache.load(fingerprint, _MISSING)
+            if settings is not _MISSING:
+                return settings
+
         # Load the default settings
-        default_settings = self.load_settings_file(default_settings_file)
+        default_settings = self._parse_settings_file(default_settings_file)
 
         if user_settings_file == None \
-            or not os.path.isfile(user_settings_file):
+            or not os.path.exists(user_settings_file):
             # No user settings file given - use the defaults
-            self._settings = default_settings
+            settings = default_settings
     
         else:
             # Load the user settings
             # and use them to overwrite the defaults
-            user_settings = self.load_settings_file(user_settings_file)
-            self._settings = self.merge_settings(default_settings, user_settings)
+            user_settings = self._parse_settings_file(user_settings_file)
+            settings = self.merge_settings(default_settings, user_settings)
+
+        if self.settings_cache is not None:
+            self.settings_cache.store(fingerprint, settings)
+
+        # The parsed settings are only used once
+        self._parsed_settings = {}
+
+        return settings
+
+    def _parse_settings_file(self, settings_file):
+        """Load a settings file - or copy its already parsed settings."""
+
+        settings = self._parsed_settings.get(
+            os.path.abspath(settings_file), _MISSING)
+        if settings is not _MISSING:
+            return copy.deepcopy(settings)
+
+        return self._load_settings_path(settings_file)
+
+    @classmethod
+    async def aload(cls, default_settings_file, user_settings_file,
+                    executor=None, **kwargs):
+        """Create Settings without blocking the event loop.
+
+        The settings files are loaded in an executor.
+
+        Parameters
+        ----------
+        default_settings_file
+            The default settings file.
+        user_settings_file
+            The user settings file or None.
+        executor
+            The concurrent.futures executor to be used; by default the
+            default executor of the event loop.
+        kwargs
+            Further arguments of the Settings constructor.
+
+        Returns
+        -------
+        The Settings.
+
+        """
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(executor, functools.partial(
+            cls, default_settings_file, user_settings_file, **kwargs))
+
+    @classmethod
+    async def aload_many(cls, settings_files, max_concurrency=8,
+                         executor=None, **kwargs):
+        """Create many Settings without blocking the event loop.
+
+        The settings files are loaded in an executor - with at most
+        'max_concurrency' files at the same time.  Default settings
+        files shared by several Settings are only loaded once.
+
+        Parameters
+        ----------
+        settings_files
+            A list of (default_settings_file, user_settings_file) pairs.
+        max_concurrency
+            The maximal number of files loaded at the same time.
+        executor
+            The concurrent.futures executor to be used; by default the
+            default executor of the event loop.
+        kwargs
+            Further arguments of the Settings constructor.
+
+        Returns
+        -------
+        The list of Settings in the order of 'settings_files'.
+
+        """
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        # Tasks parsing the default settings files
+        parsed_default_settings = {}
+
+        async def parse_default_settings_file(default_settings_file):
+            async with semaphore:
+                return await loop.run_in_executor(
+                    executor, cls._load_settings_path, default_settings_file)
+
+        async def load(default_settings_file, user_settings_file):
+            if default_settings_file == None \
+               or not os.path.exists(default_settings_file):
+                # Let the constructor throw the error
+                parsed_settings = {}
+
+            else:
+                path = os.path.abspath(default_settings_file)
+                if path not in parsed_default_settings:
+                    parsed_default_settings[path] = asyncio.ensure_future(
+                        parse_default_settings_file(path))
+                parsed_settings = {
+                    path: await parsed_default_settings[path]
+                }
+
+            async with semaphore:
+                return await loop.run_in_executor(executor, functools.partial(
+                    cls, default_settings_file, user_settings_file,
+                    parsed_settings=parsed_settings, **kwargs))
+
+        return await asyncio.gather(*(
+            load(default_settings_file, user_settings_file)
+            for default_settings_file, user_settings_file in settings_files
+        ))
 
     @staticmethod
-    def load_settings_file(settings_file):
-        """Load a yaml settings file"""
-            
-        if os.path.isfile(settings_file):
-            with open(settings_file, 'r') as fh:
-                return yaml.load(fh)
-        else:
+    def load_settings_file(settings_file, loader=None, prefixes=None):
+        """Load a settings file
+
+        The format of the settings file is determined by its suffix
+        (see newskylabs.utils.settings_formats): besides yaml, json,
+        marshal and - when tomllib is available - toml settings files
+        can be loaded.  Settings files with other suffixes are loaded
+        as yaml files.
+
+        Parameters
+        ----------
+        settings_file
+            The settings file.
+        loader
+            The yaml loader class used for yaml settings files.  By
+            default YAML_LOADER is used which is the libyaml based
+            yaml.CSafeLoader when available and yaml.SafeLoader
+            otherwise (see YAML_BACKEND).
+        prefixes
+            An optional list of keychain prefixes as 'service.db'.
+            When given only the subtrees of the settings selected by
+            the prefixes are loaded.  In yaml settings files all other
+            settings are skipped without constructing them.  See
+            newskylabs.utils.settings_partial.load_partial_settings().
+
+        Returns
+        -------
+        The loaded settings or None when the file does not exist.
+
+        """
+
+        if loader is None:
+            loader = YAML_LOADER
+
+        if not os.path.isfile(settings_file):
             return None
 
+        settings_format = get_settings_format(settings_file)
+
+        with open(settings_file, 'rb') as fh:
+            if settings_format is not YAML_FORMAT:
+                settings = settings_format.load(fh)
+                if prefixes is not None:
+                    settings = select_settings(settings, prefixes)
+                return settings
+            if prefixes is not None:
+                return load_partial_settings(fh, prefixes, loader)
+            return yaml.load(fh, Loader=loader)
+
+    @staticmethod
+    def load_settings_dir(settings_dir, executor='thread', max_workers=None):
+        """Load the settings of a settings directory.
+
+        The settings files of the directory are parsed in
+        parallel and merged like by merge_settings() in lexical order
+        of their names (see settings_dir.load_settings_dir()).
+
+        Parameters
+        ----------
+        settings_dir
+            The settings directory.
+        executor
+            'thread' to parse the files with a thread pool, 'process'
+            to use a process pool or a concurrent.futures executor.
+        max_workers
+            The maximal number of threads or processes of the pool.
+
+        Returns
+        -------
+        The merged settings.
+
+        """
+
+        return load_settings_dir(settings_dir, Settings.load_settings_file,
+                                 executor, max_workers)
+
+    @classmethod
+    def _load_settings_path(cls, settings_path):
+        """Load a settings file or directory."""
+
+        if os.path.isdir(settings_path):
+            return cls.load_settings_dir(settings_path)
+
+        return cls.load_settings_file(settings_path)
+
     @staticmethod
     def merge_settings(defaults, overwrite):
         """Recursively merge 'overwrite' settings into the 'default' settings.
@@ -88,6 +950,9 @@ class Settings:
         The function is destructive: the original values are reused and
         thereby manipulated by the function.
 
+        The merge is done without recursion, so arbitrarily deep
+        settings can be merged.
+
         Parameters
         ----------
         defaults
@@ -101,48 +966,785 @@ class Settings:
 
         """
 
-        if isinstance(overwrite, dict) \
-           and isinstance(defaults, dict):
-            # When overwrite is a dictionary
-            # and defaults as well
-            
-            # Start from the defaults
-            merged = defaults
+        if not isinstance(overwrite, dict) \
+           or not isinstance(defaults, dict):
+            # When not both, overwrite and defaults, are dictionaries
+            # the 'overwrite' settings are used
+            return overwrite
+
+        # Start from the defaults and merge in the overwritten settings;
+        # instead of recursion an explicit stack of the pairs of
+        # dictionaries still to be merged is used
+        stack = [(defaults, overwrite)]
+        while stack:
+            merged, overwrite = stack.pop()
 
-            # And merge in the overwritten settings
             for key, value in overwrite.items():
-            
-                if key in defaults:
-                    # Recursively merge the values of keys 
-                    # exising in both: defaults and overwrite
-                    merged[key] = Settings.merge_settings(merged[key], value)
-                
-                else:
-                    # Extend the settings with new settings 
-                    # only defined in the 'overwrite' settings
-                    merged[key] = value
 
-        else:
-            # In all other cases the 'overwrite' settings
-            # are used
-            merged = overwrite
+                if key in merged:
+                    default = merged[key]
+                    if isinstance(value, dict) \
+                       and isinstance(default, dict):
+                        # Merge the dictionaries of keys
+                        # existing in both: defaults and overwrite
+                        stack.append((default, value))
+                        continue
+
+                # Extend or overwrite the settings with the values
+                # which are not merged
+                merged[key] = value
+
+        return defaults
+
+    @staticmethod
+    def merged_settings(defaults, overwrite):
+        """Non-destructive variant of merge_settings().
+
+        Returns the same merged settings as merge_settings() without
+        modifying 'defaults' or 'overwrite'.  Only the dictionaries
+        along the paths of the 'overwrite' settings which exist in
+        both are copied; all other subtrees are shared with the
+        original settings.  The time and memory needed are therefore
+        proportional to the size of 'overwrite' rather than the size of
+        'defaults'.
+
+        As the merged settings share subtrees with the original
+        settings they should not be modified in place - use them as
+        input of merge_settings() or set_setting() only after copying
+        them.
+
+        Parameters
+        ----------
+        defaults
+            The default settings.
+        overwrite
+            The overwrite settings.
+
+        Returns
+        -------
+        The merged settings.
+
+        """
+
+        if not isinstance(overwrite, dict) \
+           or not isinstance(defaults, dict):
+            return overwrite
+
+        # Copy the defaults dictionaries - but not their values
+        merged = dict(defaults)
+
+        stack = [(merged, defaults, overwrite)]
+        while stack:
+            merged_node, defaults_node, overwrite_node = stack.pop()
+
+            for key, value in overwrite_node.items():
+
+                if key in defaults_node:
+                    default = defaults_node[key]
+                    if isinstance(value, dict) \
+                       and isinstance(default, dict):
+                        merged_node[key] = dict(default)
+                        stack.append((merged_node[key], default, value))
+                        continue
+
+                merged_node[key] = value
 
         return merged
 
+    def _publish_settings(self, settings, index=None):
+        """Replace the current snapshot of the settings.
+
+        'index' is the index of the settings, the _IndexChanges of a
+        copy-on-write update or None when the index has to be built.
+
+        """
+
+        delta = None
+        if index is None:
+            _unshare_settings(settings)
+            index = dict(flatten_recursively(settings))
+            # The fingerprints of the replaced settings are not used anymore
+            self._fingerprints = {}
+        elif isinstance(index, _IndexChanges):
+            index, delta = index.index, index.delta
+            if len(delta) ** 2 > len(index):
+                # The delta is copied by every change and the index
+                # when merging the delta: merging once the delta has
+                # grown beyond the square root of the size of the
+                # index keeps the cost of both low
+                index, delta = _merge_index(index, delta), None
+
+        self._snapshot = SettingsSnapshot(
+            settings, index, next(self._versions), delta)
+
+    def _prepare_settings(self, settings):
+        """Overlay loaded settings with the environment and validate them."""
+
+        return self._validate_settings(self._overlay_environment(settings))
+
+    def _overlay_environment(self, settings):
+        """Overwrite settings with the environment variables.
+
+        Only the dictionaries along the paths of the overwritten
+        settings are copied; the given settings are not changed.
+
+        """
+
+        if self.environment is None or not isinstance(settings, dict):
+            return settings
+
+        changes = self.environment.changes(all=True)
+        if not changes:
+            return settings
+
+        settings = dict(settings)
+        _update_settings_many(settings, {}, changes, {id(settings): settings})
+
+        return settings
+
+    def refresh_environment(self, rescan=False):
+        """Apply the changed environment variables to the settings.
+
+        Only the environment variables found when the environment was
+        scanned the last time are read and only the changed values are
+        set - at once as a single new version.  Variables removed from
+        the environment do not change the settings.
+
+        Parameters
+        ----------
+        rescan
+            When True the environment is scanned again for new
+            variables first.
+
+        Returns
+        -------
+        True when the settings have been changed.
+
+        """
+
+        if self.environment is None:
+            raise TypeError('The settings have no environment overlay!')
+
+        with self._write_lock:
+            if rescan:
+                self.environment.scan()
+            changes = self.environment.changes()
+            self._commit_changes(changes)
+
+        return bool(changes)
+
+    def _validate_settings(self, settings):
+        """Validate all settings against the schema."""
+
+        if self.schema is None:
+            return settings
+
+        return self.schema.validate(settings)
+
+    def _validate_setting(self, settings, keys, value):
+        """Validate a single change before it is applied to the settings.
+
+        Returns the keys and value of the validated change.  The
+        changed setting is validated together with the intermediate
+        settings created by the change.
+
+        """
+
+        point, = _validation_points(settings, [(keys, value)])
+        for key in reversed(keys[len(point):]):
+            value = {key: value}
+
+        ancestor = self.schema.validation_point(point)
+        if len(ancestor) < len(point):
+            # The setting can only be validated together with an
+            # ancestor: validate a copy of the ancestor with the change
+            value = _replace_setting(
+                _layer_value(settings, ancestor), point[len(ancestor):], value)
+            point = ancestor
+
+        return point, self.schema.validate_setting(point, value)
+
+    def _validate_changes(self, old_settings, settings, index, changes,
+                          copied):
+        """Validate the subtrees changed by applying changes.
+
+        'old_settings' are the settings before and 'settings' the
+        copied settings after applying the changes.  Returns the
+        validated settings and their index or None when the index has
+        to be rebuilt.
+
+        """
+
+        if self.schema is None:
+            return settings, index
+
+        points = {
+            self.schema.validation_point(keys)
+            for keys in _validation_points(old_settings, changes)
+        }
+        for keys in points:
+            if any(keys[:depth] in points for depth in range(len(keys))):
+                # Validated with an ancestor
+                continue
+            if not keys:
+                return self.schema.validate(settings), None
+            value = _layer_value(settings, keys)
+            if value is _MISSING or value is _SHADOWED:
+                continue
+            validated = self.schema.validate_setting(keys, value)
+            if validated is not value:
+                _update_settings(settings, index, keys, validated, copied)
+
+        return settings, index
+
     def get_settings(self):
         """Retrive the dictionary with all settings."""
     
-        return self._settings
+        return self._snapshot.settings
+
+    def reindex_settings(self):
+        """Rebuild the keychain index of the settings."""
+
+        with self._write_lock:
+            self._publish_settings(
+                self._validate_settings(self._snapshot.settings))
 
     def set_setting(self, keychain, value):
         """Set a setting."""
-    
-        set_recursively(self._settings, keychain, value)
-    
+
+        keys = compile_keychain(keychain).keys
+
+        with self._write_lock:
+            snapshot = self._snapshot
+            if not isinstance(snapshot.settings, dict):
+                raise TypeError(
+                    'Settings can only be set in a dictionary!')
+
+            if self._copy_on_write:
+                self._apply_changes(snapshot, [(keys, value)])
+            else:
+                if self.schema is not None:
+                    keys, value = self._validate_setting(
+                        snapshot.settings, keys, value)
+                index = snapshot.index
+                _update_settings(snapshot.settings, index, keys, value)
+                # The dictionaries along the keys have been changed in place
+                invalidate_fingerprints(self._fingerprints, keys)
+                self._publish_settings(snapshot.settings, index)
+
+    def set_settings(self, settings):
+        """Set many settings at once.
+
+        The settings are set atomically - either all or none of them -
+        and the version of the settings is only incremented once.
+
+        Parameters
+        ----------
+        settings
+            A dictionary mapping keychains to values or an iterable of
+            (keychain, value) pairs.  They are set in the given order.
+
+        """
+
+        if isinstance(settings, dict):
+            settings = settings.items()
+
+        with self.transaction() as transaction:
+            for keychain, value in settings:
+                transaction.set_setting(keychain, value)
+
+    def transaction(self):
+        """Return a new SettingsTransaction.
+
+        All changes made with the set_setting() method of the
+        transaction are applied atomically when the transaction is
+        committed:
+
+            with settings.transaction() as transaction:
+                transaction.set_setting('service.db.host', 'db1')
+                transaction.set_setting('service.db.port', 5432)
+
+        """
+
+        return SettingsTransaction(self)
+
+    def _commit_changes(self, changes):
+        """Apply the changes of a transaction and publish them.
+
+        'changes' is a list of (keys, value) pairs.  The changes are
+        applied to a copy of the current snapshot - copying only the
+        dictionaries along the paths of the changes - and the result is
+        published as a single new version, even when the settings are
+        not in copy-on-write mode.  This way either all or none of the
+        changes take effect.
+
+        """
+
+        if not changes:
+            return
+
+        with self._write_lock:
+            snapshot = self._snapshot
+            if not isinstance(snapshot.settings, dict):
+                raise TypeError(
+                    'Settings can only be set in a dictionary!')
+
+            settings = dict(snapshot.settings)
+            index = _IndexChanges(snapshot._index, snapshot._delta)
+            copied = {id(settings): settings}
+
+            _update_settings_many(settings, index, changes, copied)
+            settings, index = self._validate_changes(
+                snapshot.settings, settings, index, changes, copied)
+
+            self._publish_settings(settings, index)
+
     def get_setting(self, keychain):
         """Retrive a setting"""
-    
-        return get_recursively(self._settings, keychain)
+
+        snapshot = self._snapshot
+
+        value = snapshot._delta.get(keychain, _UNCHANGED)
+        if value is _UNCHANGED:
+            value = snapshot._index.get(keychain, _MISSING)
+        if value is _MISSING:
+            # Keychains missing in the index are either undefined
+            # or non-canonical list indices as 'list.01'
+            value = get_recursively(snapshot.settings, keychain)
+
+        return value
+
+    def get_settings_many(self, keychains):
+        """Retrive many settings at once.
+
+        All settings are read from the same snapshot of the settings.
+        See SettingsSnapshot.get_settings_many().
+
+        """
+
+        return self._snapshot.get_settings_many(keychains)
+
+    def accessor(self, keychain):
+        """Return a function reading a single setting.
+
+        For settings read in tight loops: the function looks the
+        setting up once and caches its value together with the
+        snapshot it was read from.  Calling the function only checks
+        that the snapshot - i.e. the version of the settings - is still
+        the same; only after set_setting() or a reload published a new
+        version the setting is looked up again.
+
+            port = settings.accessor('service.db.port')
+            ...
+            connect(port())
+
+        Reads through accessors are not instrumented (see
+        enable_instrumentation()).  As get_setting() accessors do not
+        see changes made directly to the settings dictionaries.
+
+        Parameters
+        ----------
+        keychain
+            The keychain of the setting.
+
+        Returns
+        -------
+        A function without arguments returning the current value of
+        the setting.
+
+        """
+
+        keychain = compile_keychain(keychain)
+
+        # The snapshot the cached value has been read from and the value
+        state = (None, None)
+
+        def get_setting():
+            nonlocal state
+            snapshot = self._snapshot
+            cached_snapshot, value = state
+            if snapshot is cached_snapshot:
+                return value
+            value = snapshot.get_setting(keychain)
+            state = (snapshot, value)
+            return value
+
+        get_setting.keychain = keychain
+
+        return get_setting
+
+    def fingerprint(self, keychain=None):
+        """Return the fingerprint of a setting.
+
+        Settings with the same fingerprint are equal - comparing the
+        fingerprints of a subtree before and after reloading the
+        settings is a cheap way to check whether the subtree has been
+        changed.  The fingerprints of all dictionaries and lists are
+        computed as a Merkle tree once and cached; after changes only
+        the fingerprints along the changed paths are computed again.
+
+        Parameters
+        ----------
+        keychain
+            The keychain of the setting; by default the fingerprint
+            of all settings is returned.
+
+        Returns
+        -------
+        The fingerprint as bytes.
+
+        """
+
+        snapshot = self._snapshot
+
+        if keychain is None:
+            value = snapshot.settings
+        else:
+            value = snapshot.get_setting(keychain)
+
+        return fingerprint(value, self._fingerprints, keychain)
+
+    def diff_settings(self, other):
+        """Compute the delta between the settings and other settings.
+
+        See newskylabs.utils.diff.diff_settings() for the format of
+        the delta.  When comparing two Settings objects the already
+        cached fingerprints (see fingerprint()) are used to skip
+        identical subtrees.
+
+        Parameters
+        ----------
+        other
+            Another Settings object or a settings dictionary.
+
+        Returns
+        -------
+        The list of operations turning the settings into the other
+        settings.
+
+        """
+
+        settings = self._snapshot.settings
+
+        if isinstance(other, Settings):
+            fingerprints = (self._fingerprints, other._fingerprints)
+            other = other.get_settings()
+        else:
+            fingerprints = None
+
+        return diff_settings(settings, other, fingerprints)
+
+    def patch_settings(self, delta):
+        """Apply a delta computed by diff_settings().
+
+        The delta is applied atomically as a single new version - like
+        reloaded settings, only the dictionaries along the paths of
+        the changes are copied.  The values of the delta are copied as
+        well.
+
+        """
+
+        changes = [
+            (keys, value if value is _MISSING else copy.deepcopy(value))
+            for keys, value in delta_changes(delta, _MISSING)
+        ]
+
+        with self._write_lock:
+            self._apply_changes(self._snapshot, changes)
+
+    def write_mapped_settings(self, mapped_file):
+        """Write the settings to a mapped settings file.
+
+        The file can be mapped into memory and read without loading
+        the settings by any number of processes with MappedSettings.
+        See newskylabs.utils.settings_mmap.
+
+        """
+
+        write_mapped_settings(self._snapshot.settings, mapped_file)
+
+    def snapshot(self):
+        """Return the current snapshot of the settings.
+
+        In copy-on-write mode the snapshot is immutable; all settings
+        read from it belong to the same version of the settings.
+
+        """
+
+        return self._snapshot
+
+    def get_version(self):
+        """Return the version of the settings.
+
+        The version is incremented with every change of the settings.
+
+        """
+
+        return self._snapshot.version
+
+    def enable_instrumentation(self, sample_interval=0):
+        """Start counting the accesses to the settings.
+
+        Parameters
+        ----------
+        sample_interval
+            When not 0 the latency of every sample_interval-th call of
+            get_setting() is measured.
+
+        Returns
+        -------
+        The SettingsInstrumentation - also available as the attribute
+        'instrumentation' - whose report() method reports the hot
+        keys, the settings which have never been read and the misses.
+
+        """
+
+        self.disable_instrumentation()
+
+        instrumentation = SettingsInstrumentation(sample_interval)
+        instrumentation.instrument(self)
+        self.instrumentation = instrumentation
+
+        return instrumentation
+
+    def disable_instrumentation(self):
+        """Stop counting the accesses to the settings.
+
+        The counts of the last instrumentation are kept in the
+        attribute 'instrumentation'.
+
+        """
+
+        if self.instrumentation is not None:
+            self.instrumentation.uninstrument()
+
+    def reload_settings(self):
+        """Reload the settings files when they have been changed.
+
+        Only the changed settings files are parsed again.  Their
+        changes are merged into the settings and the index is updated
+        incrementally.  The reloaded settings are published as a new
+        snapshot at once.
+
+        Returns
+        -------
+        True when the settings have been changed.
+
+        """
+
+        with self._write_lock:
+            stats = tuple(map(_stat_settings_file, self._settings_files))
+
+            old_layers = self._settings_layers
+            if old_layers is not None and stats == self._settings_stats:
+                return False
+
+            new_layers = self._load_settings_layers(
+                stats, (None, None) if old_layers is None else old_layers)
+            changed = self._reload_settings_layers(
+                self._snapshot, old_layers, new_layers, stats)
+
+            # Only remember the parsed settings files after their
+            # changes have been applied - and validated - successfully;
+            # this way failed reloads are retried with the next reload
+            self._settings_layers = new_layers
+            self._settings_stats = stats
+
+            return changed
+
+    def _reload_settings_layers(self, snapshot, old_layers, new_layers, stats):
+        """Apply the changes of reloaded settings layers to a snapshot.
+
+        'old_layers' are the settings layers parsed before or None when
+        the settings files are parsed the first time.  Returns True when
+        the settings have been changed.
+
+        """
+
+        if old_layers is None:
+            # The settings files have been parsed a first time to be
+            # able to compare them with later versions
+            if stats == self._settings_stats:
+                return False
+            # The files have been changed since the settings were
+            # loaded: compare them with the current settings
+            settings = self._merge_settings_layers(new_layers)
+            if not isinstance(settings, dict) \
+               or not isinstance(snapshot.settings, dict):
+                self._publish_settings(self._prepare_settings(settings))
+                return True
+            # Compare the validated settings - as the current ones
+            settings = self._prepare_settings(settings)
+            changes = _diff_settings(snapshot.settings, settings)
+            self._apply_changes(snapshot, changes)
+            return bool(changes)
+
+        if not self._can_merge_incrementally(old_layers) \
+           or not self._can_merge_incrementally(new_layers) \
+           or not isinstance(snapshot.settings, dict):
+            self._publish_settings(
+                self._prepare_settings(self._merge_settings_layers(new_layers)))
+            return True
+
+        # Find the changed nodes
+        changes = set()
+        for old_layer, new_layer in zip(old_layers, new_layers):
+            if old_layer is not new_layer:
+                changes.update(
+                    keys for keys, _ in _diff_settings(
+                        {} if old_layer is _MISSING else old_layer,
+                        {} if new_layer is _MISSING else new_layer))
+
+        # Merge the new values of the changed nodes
+        default_layer, user_layer = new_layers
+        if user_layer is _MISSING:
+            user_layer = {}
+        merged_changes = []
+        for keys in sorted(changes):
+            user_value = _layer_value(user_layer, keys)
+            if user_value is _SHADOWED:
+                # Overwritten by a user setting of an ancestor
+                continue
+            default_value = _layer_value(default_layer, keys)
+            if default_value is _SHADOWED:
+                default_value = _MISSING
+            if user_value is _MISSING:
+                value = default_value
+            elif default_value is _MISSING:
+                value = user_value
+            else:
+                value = self.merged_settings(default_value, user_value)
+            # Do not share the values with the parsed settings
+            # which are changed in place by set_setting()
+            if value is not _MISSING:
+                value = copy.deepcopy(value)
+            merged_changes.append((keys, value))
+
+        if self.environment is not None:
+            # The environment still overwrites the reloaded settings
+            merged_changes.extend(self.environment.changes(all=True))
+
+        self._apply_changes(snapshot, merged_changes)
+        return True
+
+    def _load_settings_layers(self, stats, old_layers=(None, None)):
+        """Parse the changed settings files.
+
+        Returns the parsed default and user settings files; when the
+        user settings file does not exist _MISSING is used instead.
+        Unchanged files are not parsed again.
+
+        """
+
+        layers = []
+        for settings_file, old_stat, stat, old_layer in zip(
+                self._settings_files, self._settings_stats, stats,
+                old_layers):
+            if old_layer is not None and stat == old_stat:
+                layers.append(old_layer)
+            elif stat is None:
+                layers.append(_MISSING)
+            else:
+                layers.append(self._load_settings_path(settings_file))
+
+        return layers
+
+    @staticmethod
+    def _can_merge_incrementally(layers):
+        """Check if the changes of settings layers can be merged one by one."""
+
+        return all(
+            isinstance(layer, dict) for layer in layers
+            if layer is not _MISSING
+        ) and layers[0] is not _MISSING
+
+    def _merge_settings_layers(self, layers):
+        """Merge parsed settings layers into new settings."""
+
+        # Keep the _MISSING marker of missing files
+        default_layer, user_layer = copy.deepcopy(
+            layers, {id(_MISSING): _MISSING})
+
+        if default_layer is _MISSING:
+            default_layer = None
+
+        if user_layer is _MISSING:
+            return default_layer
+
+        return self.merge_settings(default_layer, user_layer)
+
+    def _apply_changes(self, snapshot, changes):
+        """Apply changes to a copy of a snapshot and publish it.
+
+        'changes' is a list of (keys, value) pairs; values which are
+        _MISSING are removed.  Only the dictionaries along the paths of
+        the changes are copied.
+
+        """
+
+        if not changes:
+            return
+
+        for keys, value in changes:
+            if not keys:
+                # The settings are replaced as a whole
+                self._publish_settings(self._validate_settings(value))
+                return
+
+        if not isinstance(snapshot.settings, dict):
+            raise TypeError(
+                'Settings can only be set in a dictionary!')
+
+        settings = dict(snapshot.settings)
+        index = _IndexChanges(snapshot._index, snapshot._delta)
+        copied = {id(settings): settings}
+
+        for keys, value in changes:
+            _update_settings(settings, index, keys, value, copied)
+
+        settings, index = self._validate_changes(
+            snapshot.settings, settings, index, changes, copied)
+
+        self._publish_settings(settings, index)
+
+    def start_watching(self, interval=1.0):
+        """Start a thread reloading the settings files when changed.
+
+        The stat data of the settings files is polled every 'interval'
+        seconds.  Errors when reloading the settings - as syntax errors
+        in a partially written file - are logged and the reload is
+        retried with the next poll.
+
+        """
+
+        self.stop_watching()
+
+        # Parse the settings files once
+        # to compare them with later versions
+        self.reload_settings()
+
+        stop = threading.Event()
+
+        def watch():
+            while not stop.wait(interval):
+                try:
+                    self.reload_settings()
+                except Exception:
+                    logger.exception('Reloading the settings failed')
+
+        thread = threading.Thread(
+            target=watch, name='settings-watcher', daemon=True)
+        self._watcher = (thread, stop)
+        thread.start()
+
+    def stop_watching(self):
+        """Stop the thread started with start_watching()."""
+
+        if self._watcher is not None:
+            thread, stop = self._watcher
+            self._watcher = None
+            stop.set()
+            thread.join()
 
 ## =========================================================
 ## =========================================================
@@ -0,0 +1,155 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/settings_cache.py:
+
+On-disk cache for parsed and merged settings.
+
+"""
+
+import hashlib
+import os
+import pickle
+
+from newskylabs.utils.generic import atomic_write
+from newskylabs.utils.settings_dir import list_settings_dir
+
+# Format version of the cache files;
+# to be incremented whenever the format changes
+CACHE_FORMAT_VERSION = 1
+
+## =========================================================
+## Class SettingsCache
+## ---------------------------------------------------------
+
+class SettingsCache:
+    """An on-disk cache for parsed and merged settings.
+
+    The settings are stored in pickle files in a cache directory.  The
+    cache file of a list of settings files is determined by their
+    paths; the cached settings are only used when the paths, mtimes,
+    sizes and content hashes of the settings files - their
+    fingerprint - are still the same as when the settings were stored.
+
+    The number of cache hits, misses and invalidations are counted in
+    the attributes 'hits', 'misses' and 'invalidations'.  Misses
+    include the invalidations, i.e. the lookups where a cache file
+    existed but was outdated.
+
+    Cache files are written atomically, so concurrent processes can
+    safely share a cache directory.
+
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Parameters
+        ----------
+        cache_dir
+            The cache directory.  It is created when not existing.
+
+        """
+
+        self.cache_dir = cache_dir
+
+        self.hits          = 0
+        self.misses        = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def fingerprint(*settings_files):
+        """Compute the fingerprint of a list of settings files.
+
+        Missing files are part of the fingerprint as well; this way
+        creating them invalidates the cached settings.  Settings
+        directories are represented by the settings files they contain.
+
+        """
+
+        fingerprint = []
+        for settings_file in settings_files:
+            path = os.path.abspath(settings_file)
+
+            if os.path.isdir(path):
+                # Settings directories are represented
+                # by the fingerprint of their settings files
+                files = list_settings_dir(path)
+                fingerprint.append(
+                    (path, None, None, SettingsCache.fingerprint(*files)))
+                continue
+
+            try:
+                with open(path, 'rb') as fh:
+                    stat = os.fstat(fh.fileno())
+                    digest = hashlib.sha256(fh.read()).hexdigest()
+                fingerprint.append(
+                    (path, stat.st_mtime_ns, stat.st_size, digest))
+            except FileNotFoundError:
+                fingerprint.append((path, None, None, None))
+
+        return tuple(fingerprint)
+
+    def cache_file(self, fingerprint):
+        """Return the cache file used for a fingerprint."""
+
+        paths = '\0'.join(path for path, _, _, _ in fingerprint)
+        name = hashlib.sha256(paths.encode('utf-8')).hexdigest()
+
+        return os.path.join(self.cache_dir, name + '.pickle')
+
+    def load(self, fingerprint, default=None):
+        """Load the settings cached for a fingerprint.
+
+        Returns 'default' when no valid settings are cached.
+
+        """
+
+        cache_file = self.cache_file(fingerprint)
+
+        try:
+            with open(cache_file, 'rb') as fh:
+                version, cached_fingerprint, settings = pickle.load(fh)
+
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+
+        except Exception:
+            # Corrupt or incompatible cache file
+            version, cached_fingerprint = None, None
+
+        if version != CACHE_FORMAT_VERSION \
+           or cached_fingerprint != fingerprint:
+            self.misses += 1
+            self.invalidations += 1
+            return default
+
+        self.hits += 1
+        return settings
+
+    def store(self, fingerprint, settings):
+        """Store the settings for a fingerprint."""
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        with atomic_write(self.cache_file(fingerprint)) as fh:
+            pickle.dump((CACHE_FORMAT_VERSION, fingerprint, settings),
+                        fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+## =========================================================
+## =========================================================
+
+## fin.
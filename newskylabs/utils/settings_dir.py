@@ -0,0 +1,193 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/settings_dir.py:
+
+Utilities to load settings split into the fragment files of a
+settings directory (conf.d style).
+
+"""
+
+import concurrent.futures
+import os
+
+from newskylabs.utils.settings_formats import settings_file_suffixes
+
+## =========================================================
+## Settings directories
+## ---------------------------------------------------------
+
+def list_settings_dir(settings_dir):
+    """List the settings files of a settings directory.
+
+    Returns the paths of the files with the suffix of one of the
+    registered settings formats (see settings_file_suffixes()) in
+    lexical order.  Hidden files - as the backup files of editors -
+    are ignored.
+
+    """
+
+    suffixes = settings_file_suffixes()
+
+    return [
+        os.path.join(settings_dir, name)
+        for name in sorted(os.listdir(settings_dir))
+        if not name.startswith('.')
+        and name.lower().endswith(suffixes)
+        and os.path.isfile(os.path.join(settings_dir, name))
+    ]
+
+class _ReplacingDict(dict):
+    """A dictionary replacing the settings it is merged into.
+
+    Merging settings is not associative: when 'b' overwrites a
+    dictionary in 'a' with a value which is not a dictionary and 'c'
+    overwrites it again with a dictionary, merging 'a' with the result
+    of merging 'b' and 'c' has to replace the dictionary of 'a'
+    instead of merging it.  The merged dictionary is marked by being a
+    _ReplacingDict.
+
+    """
+
+def _merge_fragments(defaults, overwrite):
+    """Associatively merge two settings fragments.
+
+    Destructive like Settings.merge_settings(), but marking the
+    dictionaries which overwrite values which are not dictionaries as
+    _ReplacingDict.  This way fragments can be merged in any grouping.
+
+    """
+
+    if not isinstance(overwrite, dict) \
+       or isinstance(overwrite, _ReplacingDict):
+        return overwrite
+
+    if not isinstance(defaults, dict):
+        return _ReplacingDict(overwrite)
+
+    stack = [(defaults, overwrite)]
+    while stack:
+        merged, overwrite = stack.pop()
+
+        for key, value in overwrite.items():
+
+            if key in merged and isinstance(value, dict) \
+               and not isinstance(value, _ReplacingDict):
+                default = merged[key]
+                if isinstance(default, dict):
+                    stack.append((default, value))
+                    continue
+                value = _ReplacingDict(value)
+
+            merged[key] = value
+
+    return defaults
+
+def _unmark_fragments(settings):
+    """Replace all _ReplacingDict in merged settings by plain dictionaries."""
+
+    if isinstance(settings, _ReplacingDict):
+        settings = dict(settings)
+
+    stack = [settings]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if isinstance(value, _ReplacingDict):
+                    value = node[key] = dict(value)
+                stack.append(value)
+        elif isinstance(node, list):
+            stack.extend(node)
+
+    return settings
+
+def merge_settings_fragments(fragments):
+    """Merge a list of settings fragments by a pairwise tree reduction.
+
+    The result is the same as merging the fragments one after the
+    other with Settings.merge_settings() - the later fragments
+    overwriting the earlier ones.  Fragments which are None - loaded
+    from empty files - are ignored.  The fragments are reused and
+    thereby manipulated by the function.
+
+    """
+
+    fragments = [fragment for fragment in fragments if fragment is not None]
+    if not fragments:
+        return None
+
+    while len(fragments) > 1:
+        fragments = [
+            _merge_fragments(*fragments[i:i + 2])
+            if i + 1 < len(fragments) else fragments[i]
+            for i in range(0, len(fragments), 2)
+        ]
+
+    return _unmark_fragments(fragments[0])
+
+def load_settings_dir(settings_dir, load_settings_file,
+                      executor='thread', max_workers=None):
+    """Load the settings of a settings directory.
+
+    The settings files are parsed in parallel and merged in lexical
+    order of their names with merge_settings_fragments().
+
+    Parameters
+    ----------
+    settings_dir
+        The settings directory.
+    load_settings_file
+        The function used to parse a settings file - it has to be
+        picklable when using a process pool.
+    executor
+        'thread' to parse the files with a thread pool, 'process' to
+        use a process pool or a concurrent.futures executor.  As the
+        yaml parser holds the GIL, only a process pool scales with the
+        number of cores.
+    max_workers
+        The maximal number of threads or processes of the pool.
+
+    Returns
+    -------
+    The merged settings.
+
+    """
+
+    settings_files = list_settings_dir(settings_dir)
+
+    if len(settings_files) <= 1 or executor is None:
+        fragments = list(map(load_settings_file, settings_files))
+
+    elif isinstance(executor, concurrent.futures.Executor):
+        fragments = list(executor.map(load_settings_file, settings_files))
+
+    else:
+        if executor == 'thread':
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+        elif executor == 'process':
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers)
+        else:
+            raise ValueError('Unknown executor: {}'.format(executor))
+        with pool:
+            fragments = list(pool.map(load_settings_file, settings_files))
+
+    return merge_settings_fragments(fragments)
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,184 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/settings_env.py:
+
+Overlay of settings by environment variables.
+
+"""
+
+import os
+
+import yaml
+
+# Used to parse the values of environment variables
+# like plain yaml scalars
+_RESOLVER = yaml.resolver.Resolver()
+_CONSTRUCTOR = yaml.constructor.SafeConstructor()
+
+## =========================================================
+## Parsing environment variables
+## ---------------------------------------------------------
+
+def parse_environment_value(value):
+    """Parse the value of an environment variable.
+
+    The value is parsed like a plain yaml scalar: '5433' is parsed as
+    5433, 'true' as True, '' and '~' as None etc.  Values which cannot
+    be parsed are returned unchanged as strings.
+
+    """
+
+    tag = _RESOLVER.resolve(yaml.ScalarNode, value, (True, False))
+
+    # Tags without a constructor - as the merge tag of '<<' and the
+    # value tag of '=' - are kept as strings
+    constructor = _CONSTRUCTOR.yaml_constructors.get(tag)
+    if constructor is None:
+        return value
+
+    node = yaml.ScalarNode(tag, value)
+    try:
+        # Only call the stateless constructor of the scalar type
+        return constructor(_CONSTRUCTOR, node)
+    except (ValueError, yaml.YAMLError):
+        return value
+
+## =========================================================
+## Class EnvironmentOverlay
+## ---------------------------------------------------------
+
+class EnvironmentOverlay:
+    """Settings overwritten by environment variables.
+
+    The names of the environment variables starting with a prefix are
+    mapped to the keys of the settings they overwrite by splitting them
+    at a separator: with the prefix 'APP__' the variable APP__DB__PORT
+    overwrites the setting 'db.port'.
+
+    The mapping is built once by scan() - the only method looking at
+    all environment variables.  changes() only reads the mapped
+    variables and only parses the values which have been changed.
+    Variables added to the environment later are only found after
+    scan() has been called again.
+
+    """
+
+    def __init__(self, prefix, separator='__', lowercase=True, environ=None):
+        """
+        Parameters
+        ----------
+        prefix
+            The prefix of the environment variables.
+        separator
+            The separator of the keys in the variable names.
+        lowercase
+            When True the keys are converted to lower case.
+        environ
+            The environment; by default os.environ.
+
+        """
+
+        if not prefix:
+            raise ValueError('The prefix of the environment variables '
+                             'must not be empty!')
+
+        self.prefix    = prefix
+        self.separator = separator
+        self.lowercase = lowercase
+        self.environ   = os.environ if environ is None else environ
+
+        # The mapping of variable names to keys
+        self.mapping = {}
+
+        # The raw and parsed values of the variables
+        # returned by the last call of changes()
+        self._values = {}
+
+        self.scan()
+
+    def keys(self, name):
+        """Return the keys overwritten by a variable or None."""
+
+        if not name.startswith(self.prefix):
+            return None
+
+        keychain = name[len(self.prefix):]
+        if self.lowercase:
+            keychain = keychain.lower()
+
+        keys = tuple(keychain.split(self.separator))
+        if not all(keys):
+            # Empty keys as in APP__DB____PORT
+            return None
+
+        return keys
+
+    def scan(self):
+        """Rebuild the mapping of the variable names to keys."""
+
+        mapping = {}
+        for name in list(self.environ):
+            keys = self.keys(name)
+            if keys is not None:
+                mapping[name] = keys
+
+        self.mapping = mapping
+
+    def changes(self, all=False):
+        """Return the settings changed by the environment variables.
+
+        Parameters
+        ----------
+        all
+            When True all settings overwritten by the environment
+            variables are returned - otherwise only the ones which
+            have been changed since the last call.
+
+        Returns
+        -------
+        A list of (keys, value) pairs.  Variables overwriting the same
+        setting as a variable with a shorter name (e.g. APP__DB and
+        APP__DB__PORT) come after it.
+
+        """
+
+        environ = self.environ
+        values = self._values
+
+        changes = []
+        for name, keys in self.mapping.items():
+            raw = environ.get(name)
+            if raw is None:
+                # Removed variables do not change the settings
+                values.pop(name, None)
+                continue
+            cached = values.get(name)
+            if cached is None or cached[0] != raw:
+                cached = values[name] = (raw, parse_environment_value(raw))
+            elif not all:
+                continue
+            changes.append((keys, cached[1]))
+
+        # Apply the variables overwriting ancestors first
+        changes.sort(key=lambda change: len(change[0]))
+
+        return changes
+
+## =========================================================
+## =========================================================
+
+## fin.
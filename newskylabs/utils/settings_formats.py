@@ -0,0 +1,206 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/settings_formats.py:
+
+A registry of settings file formats keyed by file extension.
+
+"""
+
+import json
+import marshal
+import os
+
+import yaml
+
+from newskylabs.utils.generic import atomic_write
+
+# tomllib is only part of the standard library since python 3.11
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+## =========================================================
+## YAML loader
+## ---------------------------------------------------------
+
+# Use the fast libyaml based loader and dumper
+# when PyYAML has been built with libyaml
+try:
+    from yaml import CSafeLoader as YAML_LOADER
+    from yaml import CSafeDumper as YAML_DUMPER
+    YAML_BACKEND = 'libyaml'
+except ImportError:
+    from yaml import SafeLoader as YAML_LOADER
+    from yaml import SafeDumper as YAML_DUMPER
+    YAML_BACKEND = 'python'
+
+## =========================================================
+## Class SettingsFormat
+## ---------------------------------------------------------
+
+class SettingsFormat:
+    """A settings file format."""
+
+    def __init__(self, name, suffixes, load, dump=None):
+        """
+        Parameters
+        ----------
+        name
+            The name of the format as 'json'.
+        suffixes
+            The suffixes of the settings files as ('.json',).
+        load
+            A function loading the settings from a file opened in
+            binary mode.
+        dump
+            An optional function writing settings to a file opened in
+            binary mode; formats without dump function are read-only.
+
+        """
+
+        self.name     = name
+        self.suffixes = tuple(suffixes)
+        self.load     = load
+        self.dump     = dump
+
+    def __repr__(self):
+        return 'SettingsFormat({!r})'.format(self.name)
+
+## =========================================================
+## Formats
+## ---------------------------------------------------------
+
+def _load_yaml(fh):
+    return yaml.load(fh, Loader=YAML_LOADER)
+
+def _dump_yaml(settings, fh):
+    yaml.dump(settings, fh, Dumper=YAML_DUMPER, encoding='utf-8')
+
+def _load_json(fh):
+    return json.load(fh)
+
+def _dump_json(settings, fh):
+    fh.write(json.dumps(settings, separators=(',', ':')).encode('utf-8'))
+
+# Header of marshal settings files: a magic number and the version of
+# the marshal format as marshal files are only readable by python
+# versions supporting their version
+_MARSHAL_MAGIC = b'NSLMRSH'
+
+def _load_marshal(fh):
+    header = fh.read(len(_MARSHAL_MAGIC) + 1)
+    if len(header) != len(_MARSHAL_MAGIC) + 1 \
+       or header[:-1] != _MARSHAL_MAGIC:
+        raise ValueError('Not a marshal settings file!')
+    if header[-1] > marshal.version:
+        raise ValueError(
+            'Unsupported marshal version: {}'.format(header[-1]))
+    # marshal.loads() of the whole file is much faster than marshal.load()
+    return marshal.loads(fh.read())
+
+def _dump_marshal(settings, fh):
+    fh.write(_MARSHAL_MAGIC + bytes([marshal.version]))
+    marshal.dump(settings, fh)
+
+YAML_FORMAT = SettingsFormat('yaml', ('.yaml', '.yml'),
+                             _load_yaml, _dump_yaml)
+
+JSON_FORMAT = SettingsFormat('json', ('.json',), _load_json, _dump_json)
+
+MARSHAL_FORMAT = SettingsFormat('marshal', ('.marshal',),
+                                _load_marshal, _dump_marshal)
+
+# TOML can only be read by the standard library
+TOML_FORMAT = None if tomllib is None \
+    else SettingsFormat('toml', ('.toml',), tomllib.load)
+
+## =========================================================
+## Registry
+## ---------------------------------------------------------
+
+# The registered formats by suffix
+_FORMATS = {}
+
+def register_settings_format(settings_format):
+    """Register a settings format for its suffixes.
+
+    Formats registered later replace the formats registered for the
+    same suffixes before.
+
+    """
+
+    for suffix in settings_format.suffixes:
+        _FORMATS[suffix.lower()] = settings_format
+
+def settings_file_suffixes():
+    """Return the suffixes of all registered settings formats."""
+
+    return tuple(_FORMATS)
+
+def get_settings_format(settings_file, default=YAML_FORMAT):
+    """Return the format of a settings file determined by its suffix.
+
+    Settings files with an unknown suffix are supposed to have the
+    'default' format.
+
+    """
+
+    suffix = os.path.splitext(settings_file)[1].lower()
+
+    return _FORMATS.get(suffix, default)
+
+for settings_format in (YAML_FORMAT, JSON_FORMAT, MARSHAL_FORMAT,
+                        TOML_FORMAT):
+    if settings_format is not None:
+        register_settings_format(settings_format)
+
+## =========================================================
+## Writing settings files
+## ---------------------------------------------------------
+
+def write_settings_file(settings, settings_file, settings_format=None):
+    """Write settings to a settings file.
+
+    The file is written atomically.
+
+    Parameters
+    ----------
+    settings
+        The settings.
+    settings_file
+        The path of the settings file.
+    settings_format
+        The SettingsFormat to be used; by default the format is
+        determined by the suffix of the settings file.
+
+    """
+
+    if settings_format is None:
+        settings_format = get_settings_format(settings_file)
+
+    if settings_format.dump is None:
+        raise ValueError('Settings cannot be written in the {} format!'
+                         .format(settings_format.name))
+
+    with atomic_write(settings_file) as fh:
+        settings_format.dump(settings, fh)
+
+## =========================================================
+## =========================================================
+
+## fin.
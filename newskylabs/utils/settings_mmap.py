@@ -0,0 +1,337 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/settings_mmap.py:
+
+Settings stored in a flat binary file to be shared by processes with
+mmap.
+
+"""
+
+import marshal
+import mmap
+import pickle
+import struct
+import zlib
+
+from newskylabs.utils.generic import (
+    atomic_write,
+    compile_keychain,
+    flatten_recursively,
+)
+
+# Format version of the mapped settings files;
+# to be incremented whenever the format changes
+MAPPED_FORMAT_VERSION = 2
+
+## =========================================================
+## File format
+## ---------------------------------------------------------
+##
+## A mapped settings file consists of
+##
+## - a header,
+## - a table with a record for every keychain of the settings -
+##   including the keychains of dictionaries and lists and the empty
+##   keychain of the settings themselves - sorted by the tuples of
+##   the UTF-8 encoded keys of the keychains; this way the
+##   descendants of a keychain follow it in a contiguous range of
+##   records: sorting the plain keychains would put a sibling like
+##   'db-replica' between 'db' and 'db.host', as '-' sorts before
+##   '.',
+## - a hash table with the record numbers (starting with 1) of the
+##   keychains at the position of the CRC32 of the keychain - or the
+##   next free position,
+## - the data: the UTF-8 encoded keychains and the encoded values of
+##   the leaves.
+##
+## All offsets are relative to the start of the file.
+##
+## ---------------------------------------------------------
+
+_MAGIC = b'NSLSMAP\0'
+
+# Magic, format version, number of records, number of hash buckets,
+# offset of the table, offset of the hash table
+_HEADER = struct.Struct('<8sIIIQQ')
+
+# Keychain offset and size, value offset and size, tag.
+# The value size of lists is their length.
+_RECORD = struct.Struct('<QIQIB')
+
+_BUCKET = struct.Struct('<I')
+
+# Record tags
+_MARSHAL = 0
+_PICKLE  = 1
+_DICT    = 2
+_LIST    = 3
+
+def _encode_value(value):
+    """Encode the value of a leaf and return its tag and data."""
+
+    try:
+        return _MARSHAL, marshal.dumps(value)
+    except ValueError:
+        # Values which cannot be marshalled as dates
+        return _PICKLE, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _decode_value(tag, data):
+    """Decode the value of a leaf."""
+
+    if tag == _MARSHAL:
+        return marshal.loads(data)
+    return pickle.loads(data)
+
+## =========================================================
+## Writing mapped settings files
+## ---------------------------------------------------------
+
+def write_mapped_settings(settings, mapped_file):
+    """Write settings to a mapped settings file.
+
+    The settings are stored by their keychains; dictionary keys which
+    cannot be part of a keychain (see flatten_recursively()) are
+    dropped and the keys of the decoded dictionaries are sorted.  The
+    file is written atomically.
+
+    Parameters
+    ----------
+    settings
+        The settings tree.
+    mapped_file
+        The path of the mapped settings file.
+
+    """
+
+    entries = [(b'', settings)]
+    entries.extend(
+        (keychain.encode('utf-8'), value)
+        for keychain, value in flatten_recursively(settings)
+    )
+    # Sort by the keys of the keychains - not by the keychains
+    # themselves - this way every subtree is a contiguous block of
+    # records even when siblings as 'db-replica' sort before 'db.host'
+    entries.sort(key=lambda entry: entry[0].split(b'.'))
+
+    buckets = 1
+    while buckets < 2 * len(entries):
+        buckets *= 2
+
+    table_offset = _HEADER.size
+    buckets_offset = table_offset + len(entries) * _RECORD.size
+    data_offset = buckets_offset + buckets * _BUCKET.size
+
+    records = bytearray()
+    hash_table = [0] * buckets
+    data = bytearray()
+
+    for number, (keychain, value) in enumerate(entries, 1):
+        key_offset = data_offset + len(data)
+        data += keychain
+
+        if isinstance(value, dict):
+            tag, value_size, encoded = _DICT, 0, b''
+        elif isinstance(value, list):
+            tag, value_size, encoded = _LIST, len(value), b''
+        else:
+            tag, encoded = _encode_value(value)
+            value_size = len(encoded)
+        value_offset = data_offset + len(data)
+        data += encoded
+
+        records += _RECORD.pack(
+            key_offset, len(keychain), value_offset, value_size, tag)
+
+        # Open addressing with linear probing
+        bucket = zlib.crc32(keychain) & (buckets - 1)
+        while hash_table[bucket]:
+            bucket = (bucket + 1) & (buckets - 1)
+        hash_table[bucket] = number
+
+    header = _HEADER.pack(_MAGIC, MAPPED_FORMAT_VERSION, len(entries),
+                          buckets, table_offset, buckets_offset)
+
+    # Processes which have mapped the old file keep reading it
+    with atomic_write(mapped_file, fsync=True) as fh:
+        fh.write(header)
+        fh.write(records)
+        fh.write(struct.pack('<{}I'.format(buckets), *hash_table))
+        fh.write(data)
+
+## =========================================================
+## Class MappedSettings
+## ---------------------------------------------------------
+
+class MappedSettings:
+    """Read-only settings mapped from a mapped settings file.
+
+    The file is mapped into memory with mmap; the pages of the file
+    are shared by all processes mapping the same file.  A setting is
+    found with the hash table of the file and only its value is
+    decoded - there is no settings tree in the memory of the process.
+
+    """
+
+    def __init__(self, mapped_file):
+        """
+        Parameters
+        ----------
+        mapped_file
+            The path of a file written by write_mapped_settings().
+
+        """
+
+        self.mapped_file = mapped_file
+
+        with open(mapped_file, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._size, self._buckets, \
+            self._table_offset, self._buckets_offset \
+            = _HEADER.unpack_from(self._mmap, 0)
+
+        if magic != _MAGIC or version != MAPPED_FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(
+                'Not a mapped settings file: {}'.format(mapped_file))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """Return the number of keychains."""
+
+        return self._size - 1
+
+    def close(self):
+        """Unmap the mapped settings file."""
+
+        self._mmap.close()
+
+    def _record(self, number):
+        """Return the record with the given number (starting with 0)."""
+
+        return _RECORD.unpack_from(
+            self._mmap, self._table_offset + number * _RECORD.size)
+
+    def _key(self, record):
+        key_offset, key_size = record[0], record[1]
+        return self._mmap[key_offset:key_offset + key_size]
+
+    def _find(self, keychain):
+        """Return the number of the record of a keychain or None."""
+
+        mask = self._buckets - 1
+        bucket = zlib.crc32(keychain) & mask
+        while True:
+            number, = _BUCKET.unpack_from(
+                self._mmap, self._buckets_offset + bucket * _BUCKET.size)
+            if not number:
+                return None
+            record = self._record(number - 1)
+            if self._key(record) == keychain:
+                return number - 1
+            bucket = (bucket + 1) & mask
+
+    def _decode(self, number):
+        """Decode the value of the record with the given number."""
+
+        record = self._record(number)
+        _, _, value_offset, value_size, tag = record
+
+        if tag == _DICT:
+            return self._decode_subtree(number, {})
+        if tag == _LIST:
+            return self._decode_subtree(number, [None] * value_size)
+
+        return _decode_value(
+            tag, self._mmap[value_offset:value_offset + value_size])
+
+    def _decode_subtree(self, number, root):
+        """Decode the descendants of a dictionary or list record."""
+
+        keychain = self._key(self._record(number))
+        prefix = keychain + b'.' if keychain else b''
+
+        # The descendants follow in a contiguous block sorted by
+        # their keys; parents come before their children
+        nodes = {keychain: root}
+        for number in range(number + 1, self._size):
+            record = self._record(number)
+            key = self._key(record)
+            if not key.startswith(prefix):
+                break
+
+            _, _, value_offset, value_size, tag = record
+            if tag == _DICT:
+                value = nodes[key] = {}
+            elif tag == _LIST:
+                value = nodes[key] = [None] * value_size
+            else:
+                value = _decode_value(
+                    tag, self._mmap[value_offset:value_offset + value_size])
+
+            parent, _, child = key.rpartition(b'.')
+            node = nodes[parent]
+            if isinstance(node, list):
+                node[int(child)] = value
+            else:
+                node[child.decode('utf-8')] = value
+
+        return root
+
+    def get_settings(self):
+        """Decode and return all settings."""
+
+        return self._decode(0)
+
+    def get_setting(self, keychain):
+        """Retrive a setting.
+
+        Only the value of the setting is decoded.
+
+        """
+
+        number = self._find(keychain.encode('utf-8'))
+        if number is not None:
+            return self._decode(number)
+
+        # Keychains which are not in the file are either undefined or
+        # non-canonical list indices as 'list.01': follow the keychain
+        # step by step like get_recursively()
+        number = 0
+        path = None
+        for key, index in compile_keychain(keychain).steps:
+            tag = self._record(number)[4]
+            if tag == _LIST and index is not None:
+                key = str(index)
+            elif tag != _DICT:
+                return None
+            path = key if path is None else path + '.' + key
+            number = self._find(path.encode('utf-8'))
+            if number is None:
+                return None
+
+        return self._decode(number)
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,305 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/utils/settings_partial.py:
+
+Loading only selected subtrees of yaml settings files.
+
+"""
+
+import functools
+
+from yaml.composer import Composer, ComposerError
+from yaml.events import (
+    AliasEvent,
+    MappingStartEvent,
+    MappingEndEvent,
+    SequenceStartEvent,
+    SequenceEndEvent,
+    StreamEndEvent,
+)
+
+from newskylabs.utils.generic import compile_keychain
+
+# Marker for nodes without selected subtrees
+_MISSING = object()
+
+_MERGE_TAG = 'tag:yaml.org,2002:merge'
+
+_START_EVENTS = (MappingStartEvent, SequenceStartEvent)
+_END_EVENTS = (MappingEndEvent, SequenceEndEvent)
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def _prefix_trie(prefixes):
+    """Arrange keychain prefixes in a trie.
+
+    Every trie node is a list of a flag telling whether the subtree of
+    the node is selected, a dictionary mapping dictionary keys to the
+    child nodes and a dictionary mapping list indices to the child
+    nodes.
+
+    """
+
+    trie = [False, {}, {}]
+    for prefix in prefixes:
+        node = trie
+        for key, index in compile_keychain(prefix).steps:
+            if node[0]:
+                # An ancestor is selected already
+                break
+            child = node[1].get(key)
+            if child is None:
+                child = node[1][key] = [False, {}, {}]
+                if index is not None:
+                    node[2].setdefault(index, child)
+            node = child
+        else:
+            node[0] = True
+
+    return trie
+
+@functools.lru_cache(maxsize=None)
+def _partial_loader_class(loader):
+    """Return a loader class which can compose single nodes.
+
+    The libyaml based loaders compose the nodes of a document in C;
+    the composer of PyYAML is used to compose the selected nodes from
+    the events of their parser.
+
+    """
+
+    if issubclass(loader, Composer):
+        return loader
+
+    class PartialLoader(Composer, loader):
+        def __init__(self, stream):
+            loader.__init__(self, stream)
+            Composer.__init__(self)
+
+    return PartialLoader
+
+def _construct_node(loader):
+    """Compose and construct the next node."""
+
+    return loader.construct_document(loader.compose_node(None, None))
+
+def _skip_node(loader):
+    """Skip the next node without composing or constructing it."""
+
+    depth = 0
+    while True:
+        event = loader.peek_event()
+        if getattr(event, 'anchor', None) is not None \
+           and not isinstance(event, AliasEvent):
+            # Anchored nodes are composed
+            # as they might be referenced by aliases later
+            loader.compose_node(None, None)
+        else:
+            loader.get_event()
+            if isinstance(event, _START_EVENTS):
+                depth += 1
+            elif isinstance(event, _END_EVENTS):
+                depth -= 1
+        if depth == 0:
+            return
+
+def _select_value(value, trie):
+    """Select the subtrees of an already constructed value."""
+
+    if trie[0]:
+        return value
+
+    if isinstance(value, dict):
+        selected = {}
+        for key, child in trie[1].items():
+            if key in value:
+                child_value = _select_value(value[key], child)
+                if child_value is not _MISSING:
+                    selected[key] = child_value
+        return selected
+
+    if isinstance(value, list):
+        selected = []
+        for index, child in sorted(trie[2].items()):
+            if index < len(value):
+                child_value = _select_value(value[index], child)
+                if child_value is not _MISSING:
+                    selected.extend([None] * (index - len(selected)))
+                    selected.append(child_value)
+        return selected
+
+    return _MISSING
+
+def _load_node(loader, trie):
+    """Load the selected subtrees of the next node."""
+
+    if trie[0]:
+        return _construct_node(loader)
+
+    event = loader.peek_event()
+
+    if isinstance(event, AliasEvent) or event.anchor is not None:
+        # Referenced and anchored nodes are constructed as a whole
+        return _select_value(_construct_node(loader), trie)
+
+    if isinstance(event, MappingStartEvent):
+        loader.get_event()
+        selected = {}
+        keys = set()
+        merged = []
+        while not loader.check_event(MappingEndEvent):
+            key_node = loader.compose_node(None, None)
+            if key_node.tag == _MERGE_TAG:
+                merged.append(_construct_node(loader))
+                continue
+            key = loader.construct_document(key_node)
+            keys.add(key)
+            child = trie[1].get(key) if isinstance(key, str) else None
+            if child is None:
+                _skip_node(loader)
+            else:
+                value = _load_node(loader, child)
+                if value is not _MISSING:
+                    selected[key] = value
+        loader.get_event()
+
+        # Merge keys ('<<') do not overwrite the keys of the mapping;
+        # earlier merged mappings overwrite later ones
+        for merged_value in merged:
+            if not isinstance(merged_value, list):
+                merged_value = [merged_value]
+            for mapping in merged_value:
+                if not isinstance(mapping, dict):
+                    continue
+                for key, value in _select_value(mapping, trie).items():
+                    if not key in keys:
+                        keys.add(key)
+                        selected[key] = value
+
+        return selected
+
+    if isinstance(event, SequenceStartEvent):
+        loader.get_event()
+        selected = []
+        index = 0
+        while not loader.check_event(SequenceEndEvent):
+            child = trie[2].get(index)
+            if child is None:
+                _skip_node(loader)
+            else:
+                value = _load_node(loader, child)
+                if value is not _MISSING:
+                    selected.extend([None] * (index - len(selected)))
+                    selected.append(value)
+            index += 1
+        loader.get_event()
+        return selected
+
+    # Scalars do not contain any subtrees
+    _skip_node(loader)
+    return _MISSING
+
+## =========================================================
+## Loading selected subtrees
+## ---------------------------------------------------------
+
+def select_settings(settings, prefixes):
+    """Select subtrees of already loaded settings.
+
+    Returns the same partial settings as load_partial_settings() for
+    settings loaded as a whole - e.g. from settings files in other
+    formats than yaml.
+
+    """
+
+    settings = _select_value(settings, _prefix_trie(prefixes))
+
+    if settings is _MISSING:
+        return None
+
+    return settings
+
+def load_partial_settings(stream, prefixes, loader):
+    """Load only the selected subtrees of a yaml settings stream.
+
+    The yaml events of the stream are followed along the keychain
+    prefixes; only the nodes of the selected subtrees are composed
+    and constructed, all other nodes are skipped.  Anchored nodes are
+    composed as well - as they might be referenced by the selected
+    subtrees.
+
+    The selected subtrees are returned at their place in the settings
+    tree with all other settings left out:
+
+        get_recursively(partial_settings, prefix)
+            == get_recursively(settings, prefix)
+
+    for every prefix.  Lists along the prefixes are padded with None
+    before the selected items.
+
+    Parameters
+    ----------
+    stream
+        The yaml stream - a file opened in binary mode or a string.
+    prefixes
+        An iterable of keychain prefixes as 'service.db'.
+    loader
+        The yaml loader class - one of the safe loaders.
+
+    Returns
+    -------
+    The partial settings or None when the stream is empty or its root
+    node is neither a mapping nor a sequence.
+
+    """
+
+    trie = _prefix_trie(prefixes)
+
+    partial_loader = _partial_loader_class(loader)(stream)
+    try:
+        # Stream start
+        partial_loader.get_event()
+
+        if partial_loader.check_event(StreamEndEvent):
+            return None
+
+        document = partial_loader.get_event()
+        settings = _load_node(partial_loader, trie)
+        partial_loader.get_event()
+
+        # Like yaml.load() only accept a single document
+        if not partial_loader.check_event(StreamEndEvent):
+            event = partial_loader.get_event()
+            raise ComposerError(
+                'expected a single document in the stream',
+                document.start_mark, 'but found another document',
+                event.start_mark)
+
+    finally:
+        partial_loader.dispose()
+
+    if settings is _MISSING:
+        return None
+
+    return settings
+
+## =========================================================
+## =========================================================
+
+## fin.
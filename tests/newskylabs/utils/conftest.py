@@ -0,0 +1,73 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/conftest.py:
+
+Utilities shared by the tests of newskylabs/utils.
+
+The utilities are provided as fixtures, as conftest.py cannot be
+imported by the tests with every import mode of pytest.
+
+"""
+
+import os
+import pytest
+import yaml
+
+from newskylabs.utils.generic import flatten_recursively
+
+## =========================================================
+## Test utilities
+## ---------------------------------------------------------
+
+def _write_settings_file(settings, settings_file):
+    with open(settings_file, 'w') as fh:
+        yaml.dump(settings, fh)
+
+def _touch(settings_file, settings):
+    """Rewrite a settings file making sure that its stat data changes."""
+
+    stat = os.stat(settings_file)
+    _write_settings_file(settings, settings_file)
+    os.utime(settings_file, ns=(stat.st_atime_ns,
+                                stat.st_mtime_ns + 10**9))
+
+def _assert_index_in_sync(settings):
+    """Check that the keychain index matches the settings."""
+
+    snapshot = settings._snapshot
+    assert snapshot.index == dict(flatten_recursively(snapshot.settings))
+
+## =========================================================
+## Fixtures
+## ---------------------------------------------------------
+
+@pytest.fixture
+def write_settings_file():
+    return _write_settings_file
+
+@pytest.fixture
+def touch():
+    return _touch
+
+@pytest.fixture
+def assert_index_in_sync():
+    return _assert_index_in_sync
+
+## =========================================================
+## =========================================================
+
+## fin.
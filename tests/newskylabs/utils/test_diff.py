@@ -0,0 +1,243 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_diff.py:
+
+Tests for newskylabs/utils/diff.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_diff.py
+
+"""
+
+import copy
+import json
+import random
+
+import pytest
+import yaml
+
+from newskylabs.utils.generic import get_recursively
+from newskylabs.utils.settings import Settings
+
+
+## =========================================================
+## Test fixtures
+## ---------------------------------------------------------
+
+OLD = {
+    'db': {'host': 'db1', 'port': 5432, 'options': {'ssl': True}},
+    'routes': [{'path': '/'}],
+    'debug': False,
+    'removed': {'a': 1},
+}
+
+NEW = {
+    'db': {'host': 'db2', 'port': 5432, 'options': {'ssl': True},
+           'pool': {'size': 10}},
+    'routes': [{'path': '/'}, {'path': '/x'}],
+    'debug': 0,
+    'files': {'a.yaml': 1},
+}
+
+def random_settings(rnd, depth=3):
+    """Make random settings sharing many keys and values"""
+
+    settings = {}
+    for key in rnd.sample('abcdef', rnd.randint(0, 5)):
+        choice = rnd.random()
+        if depth and choice < 0.5:
+            settings[key] = random_settings(rnd, depth - 1)
+        elif choice < 0.6:
+            settings[key] = [rnd.randint(0, 2)]
+        else:
+            settings[key] = rnd.choice([0, 1, 1.0, '1', None, True])
+    return settings
+
+## =========================================================
+## Tests for diff_settings()
+## ---------------------------------------------------------
+
+from newskylabs.utils.diff import (
+    ADD,
+    REMOVE,
+    REPLACE,
+    diff_settings,
+    patch_settings,
+)
+
+def test_diff_settings():
+
+    delta = diff_settings(OLD, NEW)
+    assert sorted(delta, key=lambda op: op[1]) == [
+        (REPLACE, 'db.host', 'db2'),
+        (ADD, 'db.pool', {'size': 10}),
+        (REPLACE, 'debug', 0),
+        (ADD, 'files', {'a.yaml': 1}),
+        (REMOVE, 'removed', None),
+        (REPLACE, 'routes', [{'path': '/'}, {'path': '/x'}]),
+    ]
+    assert diff_settings(OLD, copy.deepcopy(OLD)) == []
+
+    # Keys which cannot be part of a keychain
+    assert diff_settings({'x': {'a.b': 1}}, {'x': {'a.b': 2}}) \
+        == [(REPLACE, 'x', {'a.b': 2})]
+    assert diff_settings({1: 1}, {1: 2}) == [(REPLACE, None, {1: 2})]
+
+    # Settings which are not dictionaries
+    assert diff_settings(None, {'a': 1}) == [(REPLACE, None, {'a': 1})]
+    assert diff_settings({'a': 1}, None) == [(REPLACE, None, None)]
+    assert diff_settings(['a'], ['b']) == [(REPLACE, None, ['b'])]
+    assert diff_settings(['a'], ['a']) == []
+    assert diff_settings(None, None) == []
+    assert diff_settings(1, True) == [(REPLACE, None, True)]
+
+    # Deltas can be shipped as json
+    assert json.loads(json.dumps(delta)) == [list(op) for op in delta]
+
+def test_diff_settings_fingerprints():
+
+    old = {'a': {'x': 1}, 'b': {'x': 1}}
+    new = {'a': {'x': 2}, 'b': {'x': 2}}
+
+    # Subtrees with the same cached fingerprints are skipped
+    old_cache = {'a': (old['a'], b'1'), 'b': (old['b'], b'1')}
+    new_cache = {'a': (new['a'], b'1'), 'b': (new['b'], b'2')}
+    assert diff_settings(old, new, (old_cache, new_cache)) \
+        == [(REPLACE, 'b.x', 2)]
+
+    # Fingerprints of other objects are not used
+    new_cache['a'] = ({'x': 2}, b'1')
+    assert len(diff_settings(old, new, (old_cache, new_cache))) == 2
+
+def test_patch_settings():
+
+    settings = copy.deepcopy(OLD)
+    assert patch_settings(settings, diff_settings(OLD, NEW)) is settings
+    assert settings == NEW
+
+    assert patch_settings({}, [(REPLACE, None, {'a': 1})]) == {'a': 1}
+    assert patch_settings({'a': 1}, [(REMOVE, 'b.c', None)]) == {'a': 1}
+
+    with pytest.raises(ValueError):
+        patch_settings({}, [('move', 'a', 1)])
+    with pytest.raises(ValueError):
+        patch_settings({}, [(REMOVE, None, None)])
+
+    # Patching the old settings with the delta gives the new ones
+    rnd = random.Random(0)
+    for _ in range(200):
+        old = random_settings(rnd)
+        new = random_settings(rnd)
+        delta = diff_settings(old, new)
+        patched = patch_settings(copy.deepcopy(old), delta)
+        assert patched == new
+        assert all(type(value) is type(patched[key])
+                   for key, value in new.items())
+        assert diff_settings(patched, new) == []
+        # Only the highest changed nodes are changed
+        keychains = [keychain for _, keychain, _ in delta]
+        assert not any(other.startswith(keychain + '.')
+                       for keychain in keychains for other in keychains)
+        for op, keychain, value in delta:
+            old_value = get_recursively(old, keychain)
+            if op == ADD:
+                assert old_value is None
+            elif op == REMOVE:
+                assert get_recursively(new, keychain) is None
+            else:
+                assert old_value != value or type(old_value) != type(value)
+
+## =========================================================
+## Tests for Settings.diff_settings() and Settings.patch_settings()
+## ---------------------------------------------------------
+
+def test_Settings_diff_settings(tmpdir, assert_index_in_sync):
+
+    settings_files = []
+    for name, dic in (('old.yaml', OLD), ('new.yaml', NEW)):
+        settings_file = str(tmpdir.join(name))
+        with open(settings_file, 'w') as fh:
+            yaml.dump(dic, fh)
+        settings_files.append(settings_file)
+
+    for copy_on_write in (False, True):
+        old = Settings(settings_files[0], None, copy_on_write=copy_on_write)
+        new = Settings(settings_files[1], None)
+
+        delta = sorted(old.diff_settings(new), key=str)
+        assert sorted(diff_settings(OLD, NEW), key=str) == delta
+        assert sorted(old.diff_settings(NEW), key=str) == delta
+
+        # Cached fingerprints are used
+        old.fingerprint()
+        new.fingerprint()
+        assert sorted(old.diff_settings(new), key=str) == delta
+
+        version = old.get_version()
+        old.patch_settings(delta)
+        assert old.get_settings() == NEW
+        assert old.get_version() == version + 1
+        assert_index_in_sync(old)
+        assert old.diff_settings(new) == []
+
+        # The values of the delta are copied
+        old.get_setting('db.pool')['size'] = 20
+        assert new.get_setting('db.pool.size') == 10
+
+    # Removed settings which are already missing are ignored
+    missing_file = str(tmpdir.join('missing.yaml'))
+    with open(missing_file, 'w') as fh:
+        yaml.dump({'a': {'b': 1}}, fh)
+    delta = [(REMOVE, 'a.x', None), (REMOVE, 'a.b.c', None),
+             (REMOVE, 'x', None)]
+    for copy_on_write in (False, True):
+        settings = Settings(missing_file, None, copy_on_write=copy_on_write)
+        settings.patch_settings(delta)
+        assert settings.get_settings() == {'a': {'b': 1}}
+        assert settings.get_settings() \
+            == patch_settings({'a': {'b': 1}}, delta)
+        assert_index_in_sync(settings)
+
+    # Settings which are not dictionaries - as empty settings files
+    empty_file = str(tmpdir.join('empty.yaml'))
+    list_file = str(tmpdir.join('list.yaml'))
+    open(empty_file, 'w').close()
+    with open(list_file, 'w') as fh:
+        yaml.dump(['a'], fh)
+
+    for copy_on_write in (False, True):
+        empty = Settings(empty_file, None, copy_on_write=copy_on_write)
+        new = Settings(settings_files[1], None)
+        assert empty.get_settings() is None
+
+        delta = empty.diff_settings(new)
+        assert delta == [(REPLACE, None, NEW)]
+        empty.patch_settings(delta)
+        assert empty.get_settings() == NEW
+        assert empty.get_setting('db.pool.size') == 10
+
+        delta = empty.diff_settings(Settings(list_file, None))
+        assert delta == [(REPLACE, None, ['a'])]
+        empty.patch_settings(delta)
+        assert empty.get_settings() == ['a']
+        assert empty.diff_settings(['a']) == []
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,168 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_fingerprint.py:
+
+Tests for newskylabs/utils/fingerprint.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_fingerprint.py
+
+"""
+
+import copy
+
+import pytest
+import yaml
+
+from newskylabs.utils.frozen import freeze
+from newskylabs.utils.settings import Settings
+
+## =========================================================
+## Test fixtures
+## ---------------------------------------------------------
+
+SETTINGS = {
+    'db': {'host': 'db1', 'port': 5432, 'options': {'ssl': True}},
+    'routes': [{'path': '/'}, {'path': '/x'}],
+    'tags': {'a', 'b'},
+    'x.y': 1,
+    1: 'one',
+}
+
+@pytest.fixture()
+def settings_file(tmpdir):
+    """Create a settings file"""
+
+    settings_file = str(tmpdir.join('settings.yaml'))
+    settings = copy.deepcopy(SETTINGS)
+    del settings['tags']
+    with open(settings_file, 'w') as fh:
+        yaml.dump(settings, fh)
+
+    return settings_file
+
+## =========================================================
+## Tests for fingerprint()
+## ---------------------------------------------------------
+
+from newskylabs.utils.fingerprint import (
+    fingerprint,
+    invalidate_fingerprints,
+)
+
+def test_fingerprint():
+
+    settings = copy.deepcopy(SETTINGS)
+    digest = fingerprint(settings)
+    assert isinstance(digest, bytes) and len(digest) == 16
+
+    # Equal settings have the same fingerprint
+    assert fingerprint(copy.deepcopy(settings)) == digest
+    assert fingerprint(dict(reversed(list(settings.items())))) == digest
+    assert fingerprint(freeze({'a': [1, 2]})) == fingerprint({'a': (1, 2)})
+
+    # Different settings have different fingerprints
+    fingerprints = set()
+    for value in ({}, [], {'a': 1}, {'a': 1.0}, {'a': '1'}, {'a': True},
+                  {'a': None}, {'b': 1}, {'a': [1]}, {'a': [[1]]},
+                  {'a': {'a': 1}}, [1, 2], [2, 1], [[1], 2], [1, [2]],
+                  'a', 1, None):
+        fingerprints.add(fingerprint(value))
+    assert len(fingerprints) == 18
+
+def test_fingerprint_cache():
+
+    settings = copy.deepcopy(SETTINGS)
+    cache = {}
+    digest = fingerprint(settings, cache)
+
+    # Only the dictionaries and lists with keychains are cached
+    assert sorted(map(str, cache)) \
+        == ['None', 'db', 'db.options', 'routes', 'routes.0', 'routes.1']
+    assert cache['db'][0] is settings['db']
+    assert fingerprint(settings, cache) == digest
+
+    # Cached fingerprints of replaced objects are not used
+    settings['db'] = dict(settings['db'], port=1)
+    invalidate_fingerprints(cache, ())
+    changed = fingerprint(settings, cache)
+    assert changed != digest
+    assert changed == fingerprint(settings)
+
+    # Objects changed in place have to be invalidated
+    settings['db']['options']['ssl'] = False
+    assert fingerprint(settings, cache) == changed
+    invalidate_fingerprints(cache, ('db', 'options', 'ssl'))
+    assert fingerprint(settings, cache) == fingerprint(settings)
+
+    # Fingerprints of subtrees
+    cache = {}
+    db = fingerprint(settings['db'], cache, 'db')
+    assert db == fingerprint(settings['db'])
+    assert 'db.options' in cache
+    assert fingerprint(settings, cache) == fingerprint(settings)
+
+## =========================================================
+## Tests for Settings.fingerprint()
+## ---------------------------------------------------------
+
+def test_Settings_fingerprint(settings_file):
+
+    for copy_on_write in (False, True):
+        settings = Settings(settings_file, None, copy_on_write=copy_on_write)
+
+        digest = settings.fingerprint()
+        db = settings.fingerprint('db')
+        assert digest == fingerprint(settings.get_settings())
+        assert db == fingerprint(settings.get_setting('db'))
+        assert settings.fingerprint('routes.1') \
+            == fingerprint({'path': '/x'})
+        assert settings.fingerprint('db.port') == fingerprint(5432)
+        assert settings.fingerprint('missing') == fingerprint(None)
+
+        # Changed settings
+        settings.set_setting('db.options.ssl', False)
+        assert settings.fingerprint() != digest
+        assert settings.fingerprint('db') != db
+        assert settings.fingerprint('db') \
+            == fingerprint(settings.get_setting('db'))
+        assert settings.fingerprint() \
+            == fingerprint(settings.get_settings())
+
+        # Unchanged settings
+        routes = settings.fingerprint('routes')
+        settings.set_setting('db.options.ssl', True)
+        assert settings.fingerprint() == digest
+        assert settings.fingerprint('db') == db
+        assert settings.fingerprint('routes') == routes
+
+        settings.set_settings({'db.port': 1, 'x': 2})
+        assert settings.fingerprint() \
+            == fingerprint(settings.get_settings())
+        assert settings.fingerprint('routes') == routes
+
+        # Settings changed in place have to be reindexed
+        settings.get_setting('db')['port'] = 2
+        settings.reindex_settings()
+        assert settings.fingerprint('db') \
+            == fingerprint(settings.get_setting('db'))
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,168 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_frozen.py:
+
+Tests for newskylabs/utils/frozen.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_frozen.py
+
+"""
+
+import copy
+import pickle
+import sys
+
+import pytest
+
+from newskylabs.utils.generic import (
+    get_recursively,
+    get_recursively_many,
+    flatten_recursively,
+)
+
+## =========================================================
+## Tests for FrozenDict
+## ---------------------------------------------------------
+
+from newskylabs.utils.frozen import FrozenDict
+
+def test_FrozenDict():
+
+    frozen = FrozenDict({'a': 1, 'b': [2]})
+    assert frozen['a'] == 1
+    assert frozen.get('b') == [2]
+    assert frozen.get('c') == None
+    assert 'a' in frozen and not 'c' in frozen
+    assert list(frozen) == ['a', 'b']
+    assert len(frozen) == 2
+    assert dict(frozen.items()) == {'a': 1, 'b': [2]}
+    with pytest.raises(KeyError):
+        frozen['c']
+
+    assert frozen == {'a': 1, 'b': [2]}
+    assert FrozenDict([('b', 2), ('a', 1)]) == FrozenDict({'a': 1, 'b': 2})
+    assert hash(FrozenDict([('b', 2), ('a', 1)])) \
+        == hash(FrozenDict({'a': 1, 'b': 2}))
+    assert FrozenDict({'a': 1}) != FrozenDict({'a': 2})
+
+    # Large frozen dictionaries
+    items = [('key{}'.format(i), i) for i in range(100)]
+    frozen_large = FrozenDict(items)
+    assert all(frozen_large[key] == value for key, value in items)
+    assert frozen_large.get('key100', -1) == -1
+    assert frozen_large == dict(items)
+
+    assert pickle.loads(pickle.dumps(frozen)) == frozen
+
+    with pytest.raises(TypeError):
+        frozen['a'] = 2
+
+## =========================================================
+## Tests for freeze() and thaw()
+## ---------------------------------------------------------
+
+from newskylabs.utils.frozen import freeze, thaw
+
+def test_freeze():
+
+    settings = {
+        'tenants': {
+            'a': {'db': {'host': 'db1', 'port': 5432}, 'tags': ['x', 'y']},
+            'b': {'db': {'host': 'db1', 'port': 5432}, 'tags': ['x', 'y']},
+            'c': {'db': {'host': 'db2', 'port': 5432}, 'flags': {1, 2}},
+        },
+        'one': 1,
+        'true': True,
+        'none': None,
+    }
+    original = copy.deepcopy(settings)
+
+    frozen = freeze(settings)
+    assert settings == original
+    assert thaw(frozen) == settings
+
+    assert isinstance(frozen, FrozenDict)
+    assert frozen['tenants']['a']['tags'] == ('x', 'y')
+    assert frozen['tenants']['c']['flags'] == frozenset({1, 2})
+
+    # Lookups work on the frozen settings
+    for keychain, value in flatten_recursively(settings):
+        assert thaw(get_recursively(frozen, keychain)) == value
+    assert dict(flatten_recursively(thaw(frozen))) \
+        == dict(flatten_recursively(settings))
+    assert get_recursively(frozen, 'tenants.a.tags.1') == 'y'
+    assert get_recursively(frozen, 'tenants.a.undefined') == None
+    assert get_recursively_many(frozen, ['one', 'tenants.b.db.port']) \
+        == {'one': 1, 'tenants.b.db.port': 5432}
+
+    # Identical subtrees and values are only stored once
+    tenants = frozen['tenants']
+    assert tenants['a'] is tenants['b']
+    assert tenants['a']['db']['port'] is tenants['c']['db']['port']
+    assert tenants['a']['db']._shape is tenants['c']['db']._shape
+
+    # Equal values of different types are not merged
+    frozen = freeze({'a': {'x': 1}, 'b': {'x': True}, 'c': {'x': 1.0}})
+    assert type(frozen['a']['x']) is int
+    assert type(frozen['b']['x']) is bool
+    assert type(frozen['c']['x']) is float
+
+    # Keys are interned
+    key = ''.join(['inter', 'ned'])
+    assert freeze({key: 1}).keys()[0] is sys.intern('interned')
+
+    # A memo shares subtrees between settings trees
+    memo = {}
+    frozen1 = freeze({'db': {'host': 'db1'}}, memo)
+    frozen2 = freeze({'x': {'host': 'db1'}}, memo)
+    assert frozen1['db'] is frozen2['x']
+
+    # Equal values which are not identical are not merged by a memo
+    memo = {}
+    freeze({'a': [0.0, (1, 2), {1}], True: 'a'}, memo)
+    frozen = freeze({'a': [-0.0, (1.0, 2), {1.0}], 1: 'a'}, memo)
+    assert str(frozen['a'][0]) == '-0.0'
+    assert type(frozen['a'][1][0]) is float
+    assert type(next(iter(frozen['a'][2]))) is float
+    assert type(frozen.keys()[1]) is int
+
+    # Unhashable leaves are not deduplicated
+    frozen = freeze({'a': [bytearray(b'x')], 'b': [bytearray(b'x')]})
+    assert frozen['a'] == frozen['b'] and not frozen['a'] is frozen['b']
+
+    # Scalars and deeply nested settings
+    assert freeze(1) == 1
+    assert freeze(None) == None
+    deep = node = {}
+    for _ in range(10000):
+        node = node.setdefault('x', {})
+    frozen = freeze(deep)
+    assert get_recursively(frozen, '.'.join(['x'] * 10000)) == {}
+    thawed = thaw(frozen)
+    assert get_recursively(thawed, '.'.join(['x'] * 10000)) == {}
+
+    recursive = []
+    recursive.append(recursive)
+    with pytest.raises(ValueError):
+        freeze(recursive)
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -24,12 +24,40 @@ pytest tests/newskylabs/utils/test_generic.py
 
 """
 
+import os
+import stat
+
 import pytest
 
 ## =========================================================
 ## Tests
 ## ---------------------------------------------------------
 
+## =========================================================
+## Tests for compile_keychain()
+## ---------------------------------------------------------
+
+from newskylabs.utils.generic import compile_keychain, Keychain
+from newskylabs.utils.generic import _compile_keychain
+
+def test_compile_keychain():
+
+    keychain = compile_keychain('servers.0.port')
+    assert isinstance(keychain, Keychain)
+    assert keychain == 'servers.0.port'
+    assert keychain.keys == ('servers', '0', 'port')
+    assert keychain.steps == (('servers', None), ('0', 0), ('port', None))
+
+    # Compiled keychains are cached
+    assert compile_keychain('servers.0.port') is keychain
+    assert compile_keychain(keychain) is keychain
+
+    # Compiled keychains can be used as dictionary keys
+    assert {'servers.0.port': 1}[keychain] == 1
+
+    # Only decimal digits are list indices
+    assert compile_keychain('a.²').steps == (('a', None), ('²', None))
+
 ## =========================================================
 ## Tests for set_recursively()
 ## ---------------------------------------------------------
@@ -53,6 +81,10 @@ def test_set_recursively():
     set_recursively(structure, 'one.two', 2)
     assert structure == {'foo': {'bar': {'baz': 321}}, 'one': {'two': 2}}
 
+    set_recursively(structure, compile_keychain('one.three'), 3)
+    assert structure == {'foo': {'bar': {'baz': 321}},
+                         'one': {'two': 2, 'three': 3}}
+
 ## =========================================================
 ## Tests for get_recursively()
 ## ---------------------------------------------------------
@@ -73,6 +105,142 @@ def test_get_recursively():
     assert get_recursively(structure, 'one') == {'two': 2}
     assert get_recursively(structure, 'one.two') == 2
 
+    structure = {'servers': [{'port': 80}, {'port': 8080}]}
+
+    assert get_recursively(structure, 'servers.1.port') == 8080
+    assert get_recursively(structure, 'servers.01.port') == 8080
+    assert get_recursively(structure, 'servers.2.port') == None
+    assert get_recursively(structure, 'servers.x.port') == None
+    assert get_recursively(structure, compile_keychain('servers.0.port')) == 80
+
+    # Plain and compiled keychains are followed the same way;
+    # plain keychains are not cached
+    currsize = _compile_keychain.cache_info().currsize
+    for keychain in ('servers', 'servers.0', 'servers.01.port', 'servers.-1',
+                     'servers.²', 'servers.1.port.x', 'x.y'):
+        assert get_recursively(structure, keychain) \
+            == get_recursively(structure, Keychain(keychain))
+    assert _compile_keychain.cache_info().currsize == currsize
+
+## =========================================================
+## Tests for get_recursively_many()
+## ---------------------------------------------------------
+
+from newskylabs.utils.generic import get_recursively_many, compile_keychains
+
+def test_get_recursively_many():
+
+    structure = {
+        'service': {'db': {'primary': {'host': 'db1', 'port': 5432}}},
+        'servers': [{'port': 80}, {'port': 8080}],
+    }
+    keychains = [
+        'service.db.primary.host', 'service.db.primary.port',
+        'service.db', 'service.db.replica.host', 'undefined',
+        'servers.1.port', 'servers.01.port', 'servers.2.port',
+        'service.db.primary.host',
+    ]
+
+    expected = {keychain: get_recursively(structure, keychain)
+                for keychain in keychains}
+    assert get_recursively_many(structure, keychains) == expected
+    assert get_recursively_many(structure, iter(keychains)) == expected
+    assert get_recursively_many(structure, []) == {}
+    assert get_recursively_many(None, ['a.b']) == {'a.b': None}
+
+    # Compiled keychain batches can be reused
+    batch = compile_keychains(keychains)
+    assert compile_keychains(batch) is batch
+    assert len(batch) == len(keychains)
+    assert get_recursively_many(structure, batch) == expected
+    structure['service']['db']['primary']['port'] = 5433
+    assert get_recursively_many(structure, batch)['service.db.primary.port'] \
+        == 5433
+
+    # Shared prefixes are stored only once
+    children, _ = batch.trie
+    assert set(children) == {('service', None), ('undefined', None),
+                             ('servers', None)}
+
+## =========================================================
+## Tests for flatten_recursively()
+## ---------------------------------------------------------
+
+from newskylabs.utils.generic import flatten_recursively
+
+def test_flatten_recursively():
+
+    assert dict(flatten_recursively(None)) == {}
+    assert dict(flatten_recursively({})) == {}
+
+    structure = {'foo': {'bar': {'baz': 321}}, 'one': [1, {'two': 2}]}
+    assert dict(flatten_recursively(structure)) == {
+        'foo':         {'bar': {'baz': 321}},
+        'foo.bar':     {'baz': 321},
+        'foo.bar.baz': 321,
+        'one':         [1, {'two': 2}],
+        'one.0':       1,
+        'one.1':       {'two': 2},
+        'one.1.two':   2,
+    }
+
+    # Keys which cannot be part of a keychain are skipped
+    structure = {1: 'int', 'a.b': 'dot', 'c': 'ok'}
+    assert dict(flatten_recursively(structure)) == {'c': 'ok'}
+
+    # Prefixed keychains
+    structure = {'a': {'b': 1}}
+    assert dict(flatten_recursively(structure, 'x')) == {
+        'x.a':   {'b': 1},
+        'x.a.b': 1,
+    }
+
+    # All generated keychains resolve to their values
+    structure = {'a': [{'b': [1, 2]}, 3], 'c': {'d': None}}
+    for keychain, value in flatten_recursively(structure):
+        assert get_recursively(structure, keychain) is value
+
+## =========================================================
+## Tests for atomic_write()
+## ---------------------------------------------------------
+
+from newskylabs.utils.generic import atomic_write
+
+def test_atomic_write(tmpdir, monkeypatch):
+
+    path = str(tmpdir.join('file'))
+
+    umask = os.umask(0o022)
+    try:
+        with atomic_write(path) as fh:
+            fh.write(b'old')
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+        with atomic_write(path, mode=0o600, fsync=True) as fh:
+            fh.write(b'new')
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    finally:
+        os.umask(umask)
+
+    with open(path, 'rb') as fh:
+        assert fh.read() == b'new'
+
+    # The umask of the process is never changed
+    def umask(mask):
+        raise AssertionError('the umask must not be changed')
+    monkeypatch.setattr(os, 'umask', umask)
+    with atomic_write(path) as fh:
+        fh.write(b'new')
+
+    # Failed writes leave the file unchanged
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as fh:
+            fh.write(b'partial')
+            raise RuntimeError()
+    with open(path, 'rb') as fh:
+        assert fh.read() == b'new'
+    assert os.listdir(str(tmpdir)) == ['file']
+
 ## =========================================================
 ## =========================================================
 
@@ -0,0 +1,159 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_instrumentation.py:
+
+Tests for newskylabs/utils/instrumentation.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_instrumentation.py
+
+"""
+
+import pytest
+import yaml
+
+from newskylabs.utils.diff import REPLACE
+from newskylabs.utils.settings import Settings
+
+## =========================================================
+## Test fixtures
+## ---------------------------------------------------------
+
+@pytest.fixture()
+def settings(tmpdir):
+    """Create Settings"""
+
+    settings_file = str(tmpdir.join('settings.yaml'))
+    with open(settings_file, 'w') as fh:
+        yaml.dump({
+            'service': {'db': {'host': 'db1', 'port': 5432}, 'debug': False},
+            'routes': [{'path': '/'}, {'path': '/x'}],
+            'unused': 1,
+        }, fh)
+
+    return Settings(settings_file, None)
+
+## =========================================================
+## Tests for SettingsInstrumentation
+## ---------------------------------------------------------
+
+from newskylabs.utils.instrumentation import SettingsInstrumentation
+
+def test_SettingsInstrumentation(settings):
+
+    # Not instrumented settings use the methods of their class
+    assert settings.instrumentation == None
+    assert not 'get_setting' in vars(settings)
+
+    instrumentation = settings.enable_instrumentation()
+    assert isinstance(instrumentation, SettingsInstrumentation)
+    assert settings.instrumentation is instrumentation
+
+    for _ in range(3):
+        assert settings.get_setting('service.db.host') == 'db1'
+    assert settings.get_setting('service.db.user') == None
+    assert settings.get_setting('routes.0') == {'path': '/'}
+    assert settings.get_settings_many(['service.db.port', 'undefined']) \
+        == {'service.db.port': 5432, 'undefined': None}
+    settings.set_setting('service.debug', True)
+    settings.set_settings({'service.debug': False, 'new': 1})
+    assert settings.get_setting('service.debug') == False
+
+    report = instrumentation.report(top=2)
+    assert report['reads'] == 8
+    assert report['writes'] == 3
+    assert report['misses'] == 2
+    assert report['miss_rate'] == 2 / 8
+    assert report['hot_keys'][0] == ('service.db.host', 3)
+    assert len(report['hot_keys']) == 2
+    assert report['hot_writes'][0] == ('service.debug', 2)
+    assert dict(report['missed_keys']) \
+        == {'service.db.user': 1, 'undefined': 1}
+    assert report['latencies'] == {}
+
+    # Reading a setting reads all its descendants
+    assert report['never_read'] == ['new', 'routes.1.path', 'unused']
+
+    # The counts are kept when the instrumentation is disabled
+    settings.disable_instrumentation()
+    assert not 'get_setting' in vars(settings)
+    settings.get_setting('unused')
+    assert instrumentation.report()['reads'] == 8
+    assert instrumentation.report()['never_read'] \
+        == ['new', 'routes.1.path', 'unused']
+    assert instrumentation.never_read(settings) \
+        == ['new', 'routes.1.path', 'unused']
+
+    instrumentation.reset()
+    assert instrumentation.report()['reads'] == 0
+
+    with pytest.raises(RuntimeError):
+        instrumentation = settings.enable_instrumentation()
+        instrumentation.instrument(settings)
+
+def test_SettingsInstrumentation_writes(settings, tmpdir, monkeypatch):
+
+    # All ways of setting settings are counted as writes
+    monkeypatch.setenv('APP__SERVICE__DEBUG', 'false')
+    settings = Settings(str(tmpdir.join('settings.yaml')), None,
+                        environment='APP__')
+    instrumentation = settings.enable_instrumentation()
+
+    with settings.transaction() as transaction:
+        transaction.set_setting('service.db.host', 'db2')
+        transaction.set_setting('unused', 2)
+    settings.patch_settings([(REPLACE, 'unused', 3)])
+    monkeypatch.setenv('APP__SERVICE__DEBUG', 'true')
+    assert settings.refresh_environment()
+    assert settings.get_settings()['service'] \
+        == {'db': {'host': 'db2', 'port': 5432}, 'debug': True}
+    assert settings.get_settings()['unused'] == 3
+
+    assert dict(instrumentation.writes) \
+        == {'service.db.host': 1, 'unused': 2, 'service.debug': 1}
+
+    # Reloaded settings are not counted
+    settings.reload_settings()
+    assert instrumentation.report()['writes'] == 4
+
+    settings.disable_instrumentation()
+    assert not '_commit_changes' in vars(settings)
+    assert not 'patch_settings' in vars(settings)
+
+def test_SettingsInstrumentation_sampling(settings):
+
+    instrumentation = settings.enable_instrumentation(sample_interval=2)
+    for _ in range(10):
+        settings.get_setting('service.db.host')
+    settings.get_setting('unused')
+
+    latencies = instrumentation.report()['latencies']
+    assert list(latencies) == ['service.db.host']
+    assert latencies['service.db.host']['samples'] == 5
+    assert 0 < latencies['service.db.host']['mean_ns'] \
+        <= latencies['service.db.host']['max_ns']
+
+    # Enabling the instrumentation again starts a new instrumentation
+    assert settings.enable_instrumentation() is not instrumentation
+    settings.get_setting('unused')
+    assert instrumentation.report()['reads'] == 11
+
+## =========================================================
+## =========================================================
+
+## fin.
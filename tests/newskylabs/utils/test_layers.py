@@ -0,0 +1,160 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_layers.py:
+
+Tests for newskylabs/utils/layers.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_layers.py
+
+"""
+
+import copy
+
+import pytest
+
+from newskylabs.utils.generic import flatten_recursively, get_recursively
+from newskylabs.utils.settings import Settings
+
+## =========================================================
+## Test utilities
+## ---------------------------------------------------------
+
+def merge_layers(layers):
+    """Merge the layers with Settings.merge_settings()."""
+
+    merged = None
+    for name, layer in layers:
+        if layer is not None:
+            merged = layer if merged is None else \
+                Settings.merge_settings(merged, layer)
+
+    return merged
+
+## =========================================================
+## Tests for LayeredSettings
+## ---------------------------------------------------------
+
+from newskylabs.utils.layers import LayeredSettings
+
+LAYERS = [
+    ('defaults', {
+        'a': 1,
+        'b': {'ba': 1, 'bb': {'bba': 1}},
+        'c': {'ca': 1},
+        'd': [1, {'da': 1}],
+        'e': {'ea': {'eaa': 1}},
+    }),
+    ('site', {
+        'b': {'bb': {'bbb': 2}},
+        'c': 2,
+        'e': {'ea': 2},
+    }),
+    ('user', None),
+    ('environment', {
+        'b': {'bc': 3},
+        'c': {'cb': 3},
+        'e': {'ea': {'eab': 3}},
+    }),
+    ('command-line', {
+        'a': {'aa': 4},
+        'd': [4],
+    }),
+]
+
+def test_LayeredSettings():
+
+    layers = copy.deepcopy(LAYERS)
+    settings = LayeredSettings(layers)
+    assert settings.layer_names() == [name for name, _ in LAYERS]
+
+    expected = merge_layers(copy.deepcopy(LAYERS))
+    assert settings.get_settings() == expected
+    assert list(settings.get_settings()) == list(expected)
+
+    keychains = [keychain for keychain, _ in flatten_recursively(expected)]
+    keychains += ['undefined', 'a.undefined', 'c.ca', 'e.ea.eaa', 'd.1.da']
+    for keychain in keychains:
+        assert settings.get_setting(keychain) \
+            == get_recursively(expected, keychain), keychain
+
+    # The layers are not modified
+    assert layers == LAYERS
+
+    # Merged dictionaries are cached
+    assert settings.get_setting('b') is settings.get_setting('b')
+
+def test_LayeredSettings_change_layers():
+
+    settings = LayeredSettings(copy.deepcopy(LAYERS))
+    assert settings.get_setting('b.bb') == {'bba': 1, 'bbb': 2}
+
+    settings.set_layer('site', {'b': {'bb': 2}})
+    assert settings.get_setting('b.bb') == 2
+    assert settings.get_setting('c.ca') == 1
+
+    settings.remove_layer('environment')
+    assert settings.get_setting('b') == {'ba': 1, 'bb': 2}
+
+    settings.set_layer('request', {'b': {'bb': {'x': 5}}})
+    assert settings.layer_names() == [
+        'defaults', 'site', 'user', 'command-line', 'request']
+    assert settings.get_setting('b.bb') == {'x': 5}
+    assert settings.get_layer('request') == {'b': {'bb': {'x': 5}}}
+
+def test_LayeredSettings_new_child():
+
+    settings = LayeredSettings(copy.deepcopy(LAYERS))
+
+    child1 = settings.new_child('request', {'a': 5})
+    child2 = settings.new_child('request', {'b': {'ba': 6}})
+
+    assert child1.get_setting('a') == 5
+    assert child1.get_setting('b.ba') == 1
+    assert child2.get_setting('a') == {'aa': 4}
+    assert child2.get_setting('b.ba') == 6
+    assert settings.get_setting('b.ba') == 1
+    assert settings.layer_names() == [name for name, _ in LAYERS]
+
+def test_LayeredSettings_empty():
+
+    settings = LayeredSettings()
+    assert settings.get_settings() == None
+    assert settings.get_setting('a') == None
+
+    settings = LayeredSettings([('defaults', None)])
+    assert settings.get_settings() == None
+    assert settings.get_setting('a') == None
+
+def test_LayeredSettings_non_dict_layers():
+
+    # Layers which are not dictionaries overwrite all lower layers
+    for layer in (['x'], 'x'):
+        settings = LayeredSettings([('a', layer), ('b', {'k': 1})])
+        assert settings.get_settings() == {'k': 1}
+        assert settings.get_setting('k') == 1
+        assert settings.get_setting('z') == None
+
+        settings = LayeredSettings([('a', {'k': 1}), ('b', layer)])
+        assert settings.get_settings() == layer
+        assert settings.get_setting('k') == None
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,375 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_schema.py:
+
+Tests for newskylabs/utils/schema.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_schema.py
+
+"""
+
+import os
+import time
+
+import pytest
+import yaml
+
+from newskylabs.utils.settings import Settings
+from newskylabs.utils.schema import Schema, Field, SchemaError
+
+
+## =========================================================
+## Test fixtures
+## ---------------------------------------------------------
+
+@pytest.fixture()
+def schema_spec():
+    """Create a schema specification"""
+
+    return {
+        'service': {
+            'db': {
+                'host': str,
+                'port': Field(int, minimum=1, maximum=65535),
+                'timeout': Field(float, default=5.0),
+            },
+            'debug': Field(bool, default=False),
+            'level': Field(str, choices=('info', 'debug'), required=False),
+        },
+        'routes': [{'path': str, 'weight': Field(int, default=1)}],
+        'tenants': Field({'*': {'quota': int}}, default={}),
+    }
+
+@pytest.fixture()
+def settings_file(tmpdir, write_settings_file):
+    """Create a settings file"""
+
+    settings_file = str(tmpdir.join('settings.yaml'))
+    write_settings_file({
+        'service': {'db': {'host': 'db1', 'port': '5432'}, 'debug': 'yes'},
+        'routes': [{'path': '/'}, {'path': '/x', 'weight': 3}],
+        'tenants': {'acme': {'quota': 10}},
+        'other': [1, 2],
+    }, settings_file)
+
+    return settings_file
+
+## =========================================================
+## Tests for Schema
+## ---------------------------------------------------------
+
+def test_Schema_validate(schema_spec):
+
+    schema = Schema(schema_spec)
+
+    settings = {
+        'service': {'db': {'host': 'db1', 'port': '5432'}, 'debug': 'yes'},
+        'routes': [{'path': '/'}, {'path': '/x', 'weight': 3}],
+        'other': [1, 2],
+    }
+    validated = schema.validate(settings)
+    assert validated == {
+        'service': {
+            'db': {'host': 'db1', 'port': 5432, 'timeout': 5.0},
+            'debug': True,
+        },
+        'routes': [{'path': '/', 'weight': 1}, {'path': '/x', 'weight': 3}],
+        'tenants': {},
+        'other': [1, 2],
+    }
+
+    # The validated settings are not changed
+    assert settings['service']['db']['port'] == '5432'
+    assert not 'tenants' in settings
+
+    # Only changed nodes are copied
+    assert validated['other'] is settings['other']
+    assert validated['routes'][1] is settings['routes'][1]
+    assert schema.validate(validated) is validated
+
+    # Mutable defaults are not shared
+    assert schema.validate(settings)['tenants'] is not validated['tenants']
+
+    # Errors
+    def error(settings):
+        with pytest.raises(SchemaError) as info:
+            schema.validate(settings)
+        return str(info.value)
+
+    db = {'host': 'db1', 'port': 5432}
+    assert error({'service': {'db': {'port': 1}}, 'routes': []}) \
+        == 'service.db.host: missing required setting'
+    assert error({'service': {'db': dict(db, port='x')}, 'routes': []}) \
+        == "service.db.port: expected an integer, got 'x'"
+    assert error({'service': {'db': dict(db, port=0)}, 'routes': []}) \
+        == 'service.db.port: 0 is less than 1'
+    assert error({'service': {'db': db, 'level': 'x'}, 'routes': []}) \
+        == "service.level: 'x' is not one of ('info', 'debug')"
+    assert error({'service': {'db': db}, 'routes': [{'path': None}]}) \
+        == 'routes.0.path: expected a string, got NoneType'
+    assert error({'service': {'db': db}, 'routes': [],
+                  'tenants': {'acme': {'quota': 'many'}}}) \
+        == "tenants.acme.quota: expected an integer, got 'many'"
+    assert error({'service': [], 'routes': []}) \
+        == 'service: expected a dictionary, got list'
+    assert isinstance(SchemaError('x'), ValueError)
+
+def test_Schema_specs():
+
+    assert Schema(int).validate(' 7 ') == 7
+    assert Schema(int).validate(7.0) == 7
+    for value in (True, 7.5, None, '7.5'):
+        with pytest.raises(SchemaError):
+            Schema(int).validate(value)
+
+    assert Schema(float).validate(1) == 1.0
+    assert Schema(str).validate(1.5) == '1.5'
+    assert Schema(bool).validate('Off') is False
+    assert Schema(bool).validate(1) is True
+    with pytest.raises(SchemaError):
+        Schema(bool).validate('maybe')
+
+    assert Schema(Field(int, nullable=True)).validate(None) is None
+    assert Schema(None).validate({'a': 1}) == {'a': 1}
+    assert Schema(tuple).validate((1,)) == (1,)
+    with pytest.raises(SchemaError):
+        Schema(tuple).validate([1])
+
+    # Functions converting values
+    assert Schema(os.path.normpath).validate('a//b') == 'a/b'
+    with pytest.raises(SchemaError):
+        Schema(lambda value: int(value)).validate('x')
+
+    with pytest.raises(TypeError):
+        Schema([int, str])
+    with pytest.raises(TypeError):
+        Schema(1)
+    with pytest.raises(SchemaError):
+        Schema(Field(int, default='x'))
+
+def test_Schema_validate_setting(schema_spec):
+
+    schema = Schema(schema_spec)
+
+    assert schema.validate_setting(('service', 'db', 'port'), '80') == 80
+    assert schema.validate_setting(('service', 'db'), {'host': 'h', 'port': 1}) \
+        == {'host': 'h', 'port': 1, 'timeout': 5.0}
+    assert schema.validate_setting(('tenants', 'x', 'quota'), '1') == 1
+
+    # Settings without schema are not validated
+    assert schema.validate_setting(('other', 'x'), 'y') == 'y'
+    assert schema.validate_setting(('service', 'db', 'port', 'x'), 'y') == 'y'
+
+    with pytest.raises(SchemaError) as info:
+        schema.validate_setting(('service', 'db'), {'port': 1})
+    assert info.value.keychain == 'service.db.host'
+
+    # Settings inside of nodes without children in the schema
+    assert schema.validation_point(('service', 'db', 'port')) \
+        == ('service', 'db', 'port')
+    assert schema.validation_point(('service', 'db', 'port', 'x')) \
+        == ('service', 'db', 'port')
+    assert schema.validation_point(('routes', '0', 'path')) == ('routes',)
+    assert schema.validation_point(('tenants', 'x', 'quota')) \
+        == ('tenants', 'x', 'quota')
+    assert schema.validation_point(('other', 'x')) == ('other', 'x')
+
+## =========================================================
+## Tests for Settings with a schema
+## ---------------------------------------------------------
+
+def test_Settings_schema(schema_spec, settings_file, assert_index_in_sync):
+
+    for copy_on_write in (False, True):
+        settings = Settings(settings_file, None,
+                            copy_on_write=copy_on_write, schema=schema_spec)
+        assert isinstance(settings.schema, Schema)
+
+        # Validated when loaded
+        assert settings.get_setting('service.db.port') == 5432
+        assert settings.get_setting('service.db.timeout') == 5.0
+        assert settings.get_setting('service.debug') is True
+        assert settings.get_setting('routes.0.weight') == 1
+        assert_index_in_sync(settings)
+
+        # Validated when set
+        settings.set_setting('service.db.port', '6543')
+        assert settings.get_setting('service.db.port') == 6543
+        settings.set_setting('tenants.other.quota', '5')
+        assert settings.get_setting('tenants.other') == {'quota': 5}
+        settings.set_setting('service.db', {'host': 'db2', 'port': 1})
+        assert settings.get_setting('service.db.timeout') == 5.0
+        settings.set_setting('x.y', 'z')
+        assert settings.get_setting('x.y') == 'z'
+        assert_index_in_sync(settings)
+
+        # Invalid settings are not set
+        version = settings.get_version()
+        for keychain, value in (('service.db.port', 'x'),
+                                ('service.db', {'port': 1}),
+                                ('tenants.new', {}),
+                                ('routes', [{}])):
+            with pytest.raises(SchemaError):
+                settings.set_setting(keychain, value)
+        assert settings.get_version() == version
+        assert settings.get_setting('service.db') \
+            == {'host': 'db2', 'port': 1, 'timeout': 5.0}
+
+        # Transactions
+        with settings.transaction() as transaction:
+            transaction.set_setting('tenants.new.quota', '1')
+            transaction.set_setting('service.db.port', '2')
+        assert settings.get_setting('tenants.new.quota') == 1
+        assert settings.get_setting('service.db.port') == 2
+        assert_index_in_sync(settings)
+
+        with pytest.raises(SchemaError):
+            settings.set_settings({'service.db.port': 3,
+                                   'service.db.host': None})
+        assert settings.get_setting('service.db.port') == 2
+
+        # Reindexing validates the changed settings
+        settings.get_setting('service.db')['port'] = '4'
+        settings.reindex_settings()
+        assert settings.get_setting('service.db.port') == 4
+
+def test_Settings_schema_leaf_nodes(tmpdir, write_settings_file,
+                                    assert_index_in_sync):
+
+    def check_db(db):
+        unknown = set(db) - {'host', 'port'}
+        if unknown:
+            raise ValueError('unknown settings: {}'.format(sorted(unknown)))
+        return dict(db, port=int(db.get('port', 0)))
+
+    settings_file = str(tmpdir.join('settings.yaml'))
+    write_settings_file({'db': {'host': 'h', 'port': '1'},
+                         'log': {'level': 'info'}}, settings_file)
+
+    for copy_on_write in (False, True):
+        settings = Settings(settings_file, None, copy_on_write=copy_on_write,
+                            schema={'db': check_db,
+                                    'log': Field(dict, choices=(
+                                        {'level': 'info'},
+                                        {'level': 'debug'}))})
+        assert settings.get_setting('db') == {'host': 'h', 'port': 1}
+
+        # Settings inside of a node validated as a whole are validated
+        # together with the node
+        settings.set_setting('db.port', '2')
+        assert settings.get_setting('db.port') == 2
+        settings.set_setting('log.level', 'debug')
+        assert settings.get_setting('log') == {'level': 'debug'}
+
+        version = settings.get_version()
+        for keychain, value in (('db.bogus', 1),
+                                ('db.port', 'x'),
+                                ('log.level', 'trace'),
+                                ('log.x.y', 1)):
+            with pytest.raises(SchemaError):
+                settings.set_setting(keychain, value)
+            with pytest.raises(SchemaError):
+                settings.set_settings({keychain: value})
+        assert settings.get_version() == version
+        assert settings.get_setting('db') == {'host': 'h', 'port': 2}
+
+        assert_index_in_sync(settings)
+
+def test_Settings_schema_reload_settings(schema_spec, settings_file,
+                                         write_settings_file, touch,
+                                         assert_index_in_sync):
+
+    with open(settings_file) as fh:
+        dic = yaml.safe_load(fh)
+
+    settings = Settings(settings_file, None, schema=schema_spec)
+
+    # Reloaded settings are validated
+    dic['service']['db']['port'] = '80'
+    touch(settings_file, dic)
+    assert settings.reload_settings() == True
+    assert settings.get_setting('service.db.port') == 80
+
+    # Removed settings with defaults are set to their default
+    dic['service']['debug'] = 'no'
+    touch(settings_file, dic)
+    assert settings.reload_settings() == True
+    assert settings.get_setting('service.debug') is False
+    del dic['service']['debug']
+    touch(settings_file, dic)
+    assert settings.reload_settings() == True
+    assert settings.get_setting('service.debug') is False
+
+    # Invalid settings are not reloaded
+    dic['service']['db']['port'] = 'x'
+    touch(settings_file, dic)
+    with pytest.raises(SchemaError):
+        settings.reload_settings()
+    assert settings.get_setting('service.db.port') == 80
+    assert_index_in_sync(settings)
+
+    # Invalid settings files
+    write_settings_file({'service': {}}, settings_file)
+    with pytest.raises(SchemaError):
+        Settings(settings_file, None, schema=schema_spec)
+
+def test_Settings_schema_reload_settings_retried(tmpdir, monkeypatch,
+                                                 write_settings_file, touch):
+
+    settings_file = str(tmpdir.join('settings.yaml'))
+    schema = {'db': {'port': int, 'host': str}}
+
+    # Rejected changes are not used to compare later changes with
+    write_settings_file({'db': {'port': 1, 'host': 'a'}}, settings_file)
+    settings = Settings(settings_file, None, schema=schema)
+    assert settings.reload_settings() == False
+    touch(settings_file, {'db': {'port': 'bad', 'host': 'b'}})
+    with pytest.raises(SchemaError):
+        settings.reload_settings()
+    assert settings.get_settings() == {'db': {'port': 1, 'host': 'a'}}
+    touch(settings_file, {'db': {'port': 2, 'host': 'b'}})
+    assert settings.reload_settings() == True
+    assert settings.get_settings() == {'db': {'port': 2, 'host': 'b'}}
+
+    # Failed reloads are retried with the next poll
+    apply_changes = Settings._apply_changes
+    failures = []
+    def failing_apply_changes(self, snapshot, changes):
+        if not failures:
+            failures.append(changes)
+            raise SchemaError('temporary failure')
+        return apply_changes(self, snapshot, changes)
+    monkeypatch.setattr(Settings, '_apply_changes', failing_apply_changes)
+
+    settings.start_watching(interval=0.001)
+    try:
+        touch(settings_file, {'db': {'port': 3, 'host': 'c'}})
+        deadline = time.monotonic() + 5
+        while settings.get_setting('db.port') != 3 \
+              and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert len(failures) == 1
+        assert settings.get_settings() == {'db': {'port': 3, 'host': 'c'}}
+    finally:
+        settings.stop_watching()
+
+## =========================================================
+## =========================================================
+
+## fin.
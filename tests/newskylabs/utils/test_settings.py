@@ -24,6 +24,8 @@ pytest tests/newskylabs/utils/test_settings.py
 
 """
 
+import sys
+
 import pytest
 
 ## =========================================================
@@ -32,56 +34,9 @@ import pytest
 
 from newskylabs.utils.settings import Settings
 
-def test_Settings_merge_settings():
-
-    dic1 = 'whatever'
-    dic2 = 'overwrite-setting'
-    assert Settings.merge_settings(dic1, dic2) == 'overwrite-setting'
-
-    dic1 = 'whatever'
-    dic2 = []
-    assert Settings.merge_settings(dic1, dic2) == []
-
-    dic1 = 'whatever'
-    dic2 = {}
-    assert Settings.merge_settings(dic1, dic2) == {}
-
-    dic1 = 'whatever'
-    dic2 = [1, 2, 3]
-    assert Settings.merge_settings(dic1, dic2) == [1, 2, 3]
-
-    dic1 = 'whatever'
-    dic2 = {'a': 1, 'b': 2, 'c': 3}
-    assert Settings.merge_settings(dic1, dic2) == {'a': 1, 'b': 2, 'c': 3}
-
-    dic1 = {'a': 1}
-    dic2 = {'b': 2}
-    assert Settings.merge_settings(dic1, dic2) == {'a': 1, 'b': 2}
-
-    dic1 = {'a': 'whatever'}
-    dic2 = {'a': 'overwrite-setting'}
-    assert Settings.merge_settings(dic1, dic2) == {'a': 'overwrite-setting'}
-
-    dic1 = {'a': 1}
-    dic2 = {'a': {'b': 2}}
-    assert Settings.merge_settings(dic1, dic2) == {'a': {'b': 2}}
-
-    dic1 = {'a': {'b': 2}}
-    dic2 = {'a': 1}
-    assert Settings.merge_settings(dic1, dic2) == {'a': 1}
-
-    dic1 = {'a': {'b': 1}}
-    dic2 = {'c': {'b': 2}}
-    assert Settings.merge_settings(dic1, dic2) == {'a': {'b': 1},
-                                                   'c': {'b': 2}}
-
-    dic1 = {'a': {'b': 1}}
-    dic2 = {'a': {'c': 2}}
-    assert Settings.merge_settings(dic1, dic2) == {'a': {'b': 1, 'c': 2}}
-
-    dic1 = {'a': {'b': 'whatever'}}
-    dic2 = {'a': {'b': 'overwrite-setting'}}
-    assert Settings.merge_settings(dic1, dic2) == {'a': {'b': 'overwrite-setting'}}
+def merge_settings_cases():
+    """Return a list of fresh (defaults, overwrite, merged) test cases
+    for Settings.merge_settings()."""
 
     dic1 = {'a': 1,
             'c': 1,
@@ -143,10 +98,129 @@ def test_Settings_merge_settings():
             },
     }
 
-    assert Settings.merge_settings(dic1, dic2) == dic3
+    return [
+        ('whatever', 'overwrite-setting',
+         'overwrite-setting'),
+        ('whatever', [],
+         []),
+        ('whatever', {},
+         {}),
+        ('whatever', [1, 2, 3],
+         [1, 2, 3]),
+        ('whatever', {'a': 1, 'b': 2, 'c': 3},
+         {'a': 1, 'b': 2, 'c': 3}),
+        ({'a': 1}, {'b': 2},
+         {'a': 1, 'b': 2}),
+        ({'a': 'whatever'}, {'a': 'overwrite-setting'},
+         {'a': 'overwrite-setting'}),
+        ({'a': 1}, {'a': {'b': 2}},
+         {'a': {'b': 2}}),
+        ({'a': {'b': 2}}, {'a': 1},
+         {'a': 1}),
+        ({'a': {'b': 1}}, {'c': {'b': 2}},
+         {'a': {'b': 1}, 'c': {'b': 2}}),
+        ({'a': {'b': 1}}, {'a': {'c': 2}},
+         {'a': {'b': 1, 'c': 2}}),
+        ({'a': {'b': 'whatever'}}, {'a': {'b': 'overwrite-setting'}},
+         {'a': {'b': 'overwrite-setting'}}),
+        (dic1, dic2, dic3),
+    ]
+
+def test_Settings_merge_settings():
+
+    for defaults, overwrite, merged in merge_settings_cases():
+        assert Settings.merge_settings(defaults, overwrite) == merged
+
+def test_Settings_merge_settings_deep():
+
+    # Deeper than the recursion limit
+    depth = sys.getrecursionlimit() * 2
+
+    def make_tree(leaf):
+        tree = node = {}
+        for _ in range(depth):
+            node['x'] = {}
+            node = node['x']
+        node.update(leaf)
+        return tree
+
+    for merge_settings in [Settings.merge_settings, Settings.merged_settings]:
+        merged = merge_settings(make_tree({'a': 1}), make_tree({'b': 2}))
+
+        # Comparing the trees with == would exceed the recursion limit
+        for _ in range(depth):
+            assert list(merged) == ['x']
+            merged = merged['x']
+        assert merged == {'a': 1, 'b': 2}
 
 ## =========================================================
-## Tests for Settings.merge_settings()
+## Tests for Settings.merged_settings()
+## ---------------------------------------------------------
+
+def test_Settings_merged_settings():
+
+    for defaults, overwrite, merged in merge_settings_cases():
+        defaults_copy  = copy.deepcopy(defaults)
+        overwrite_copy = copy.deepcopy(overwrite)
+        assert Settings.merged_settings(defaults, overwrite) == merged
+
+        # The original settings are not modified
+        assert defaults  == defaults_copy
+        assert overwrite == overwrite_copy
+
+    # Unchanged subtrees are shared
+    defaults  = {'a': {'aa': {'aaa': 1}}, 'b': {'ba': 1}, 'c': [1]}
+    overwrite = {'a': {'ab': 2}, 'd': {'da': 2}}
+    merged = Settings.merged_settings(defaults, overwrite)
+    assert merged == {'a': {'aa': {'aaa': 1}, 'ab': 2},
+                      'b': {'ba': 1},
+                      'c': [1],
+                      'd': {'da': 2}}
+    assert merged is not defaults
+    assert merged['a'] is not defaults['a']
+    assert merged['a']['aa'] is defaults['a']['aa']
+    assert merged['b'] is defaults['b']
+    assert merged['c'] is defaults['c']
+    assert merged['d'] is overwrite['d']
+
+## =========================================================
+## Tests for Settings.load_settings_file()
+## ---------------------------------------------------------
+
+from newskylabs.utils.settings import YAML_LOADER, YAML_BACKEND
+
+def test_Settings_load_settings_file(tmpdir):
+
+    assert YAML_BACKEND in ('libyaml', 'python')
+    if YAML_BACKEND == 'libyaml':
+        assert YAML_LOADER is yaml.CSafeLoader
+    else:
+        assert YAML_LOADER is yaml.SafeLoader
+
+    settings_file = tmpdir.join('settings.yaml')
+    settings_file.write('a: 1\nb: [x, "y"]\nc: {d: null}\n')
+
+    expected = {'a': 1, 'b': ['x', 'y'], 'c': {'d': None}}
+    assert Settings.load_settings_file(str(settings_file)) == expected
+    assert Settings.load_settings_file(
+        str(settings_file), loader=yaml.SafeLoader) == expected
+
+    assert Settings.load_settings_file(str(tmpdir.join('missing'))) == None
+
+    # Loading selected subtrees only
+    assert Settings.load_settings_file(
+        str(settings_file), prefixes=['b.1', 'c']) \
+        == {'b': [None, 'y'], 'c': {'d': None}}
+    assert Settings.load_settings_file(
+        str(tmpdir.join('missing')), prefixes=['a']) == None
+
+    # Only standard yaml tags are accepted
+    settings_file.write('a: !!python/name:os.system\n')
+    with pytest.raises(yaml.constructor.ConstructorError):
+        Settings.load_settings_file(str(settings_file))
+
+## =========================================================
+## Tests for Settings
 ## ---------------------------------------------------------
 
 from newskylabs.utils.settings import Settings
@@ -155,11 +229,17 @@ from newskylabs.utils.settings import Settings
 ## Test utilities
 ## ---------------------------------------------------------
 
+import asyncio
+import copy
+import os
+import random
+import threading
+import time
 import yaml
 
-def write_settings_file(dic, settings_file):
-    with open(settings_file, 'w') as stream:
-        yaml.dump(dic, stream)
+from newskylabs.utils.generic import flatten_recursively, compile_keychains, \
+    get_recursively
+
 
 def cat_settings_file(settings_file):
     print(">>> {}:".format(settings_file))
@@ -171,7 +251,7 @@ def cat_settings_file(settings_file):
 ## ---------------------------------------------------------
 
 @pytest.fixture()
-def test_settings1(tmpdir):
+def test_settings1(tmpdir, write_settings_file):
     """Create a default settings test file"""
 
     # Test default settings
@@ -349,12 +429,639 @@ def test_Settings1(test_settings1):
     ]:
         assert settings.get_setting(keychain) == expected_value
 
+def test_Settings1_index(test_settings1, assert_index_in_sync):
+
+    default_settings_file = test_settings1['default-settings-file']
+    user_settings_file    = test_settings1['user-settings-file']
+
+    settings = Settings(default_settings_file, user_settings_file)
+    assert_index_in_sync(settings)
+
+    for keychain, value in [
+            ('a', 0),
+            ('a.b', 1),
+            ('d.d.x', 2),
+            ('d', {'e': [1, {'f': 2}]}),
+            ('d.e.1.f', 3),
+            ('new.new', {'x': [1, 2]}),
+    ]:
+        settings.set_setting(keychain, value)
+        assert settings.get_setting(keychain) == value
+        assert_index_in_sync(settings)
+
+    assert settings.get_setting('a') == {'b': 1}
+    assert settings.get_setting('d.d') == None
+    assert settings.get_setting('d.e') == {'1': {'f': 3}}
+    assert settings.get_setting('new.new.x.1') == 2
+
+    # Non-canonical keychains are resolved as well
+    assert settings.get_setting('new.new.x.01') == 2
+
+    # Changes made directly to the settings need a reindex
+    settings.get_settings()['z'] = {'z': 26}
+    settings.reindex_settings()
+    assert settings.get_setting('z.z') == 26
+
+def test_Settings1_accessor(test_settings1):
+
+    default_settings_file = test_settings1['default-settings-file']
+    user_settings_file    = test_settings1['user-settings-file']
+
+    for copy_on_write in (False, True):
+        settings = Settings(default_settings_file, user_settings_file,
+                            copy_on_write=copy_on_write)
+
+        get_c = settings.accessor('d.c')
+        get_list_item = settings.accessor('d.d.01')
+        get_missing = settings.accessor('x.y')
+        assert get_c.keychain == 'd.c'
+
+        assert get_c() == 3
+        assert get_c() == 3
+        assert get_list_item() == 5
+        assert get_missing() == None
+
+        # Changes are seen after the version changed
+        settings.set_setting('d.c', 4)
+        assert get_c() == 4
+        settings.set_settings({'d.c': 5, 'x.y': 6})
+        assert get_c() == 5
+        assert get_missing() == 6
+        settings.set_setting('d', {'d': [7, 8]})
+        assert get_c() == None
+        assert get_list_item() == 8
+
+        # Changes made directly to the settings need a reindex
+        settings.get_setting('d')['c'] = 9
+        assert get_c() == None
+        settings.reindex_settings()
+        assert get_c() == 9
+
+    # Lazy settings are loaded when accessed for the first time
+    settings = Settings(default_settings_file, user_settings_file, lazy=True)
+    get_a = settings.accessor('a')
+    assert not '_snapshot' in settings.__dict__
+    assert get_a() == 1
+
+def test_Settings_anchors(tmpdir, assert_index_in_sync):
+
+    # Yaml anchors, aliases and merge keys share dictionaries
+    settings_file = str(tmpdir.join('anchors.yaml'))
+    with open(settings_file, 'w') as fh:
+        fh.write('base: &b {db: {host: h, port: 1}, list: [1]}\n'
+                 'svc: {<<: *b}\n'
+                 'alias: *b\n')
+
+    for copy_on_write in (False, True):
+        settings = Settings(settings_file, None, copy_on_write=copy_on_write)
+        alias = settings.fingerprint('alias')
+
+        settings.set_setting('base.db.port', 2)
+        assert settings.get_setting('base.db.port') == 2
+        for keychain in ('svc.db.port', 'alias.db.port'):
+            assert settings.get_setting(keychain) == 1
+            assert settings.get_setting(keychain) \
+                == get_recursively(settings.get_settings(), keychain)
+        assert settings.fingerprint('alias') == alias
+        assert settings.get_setting('alias.list') \
+            is not settings.get_setting('base.list')
+
+        assert_index_in_sync(settings)
+
+def test_Settings1_get_settings_many(test_settings1):
+
+    default_settings_file = test_settings1['default-settings-file']
+    user_settings_file    = test_settings1['user-settings-file']
+
+    settings = Settings(default_settings_file, user_settings_file)
+
+    keychains = ['a', 'b', 'd.a', 'd.b', 'd.d.0', 'd.d.01', 'd.x', 'x.y']
+    expected = {keychain: settings.get_setting(keychain)
+                for keychain in keychains}
+    assert expected['d.d.01'] == 5
+    assert settings.get_settings_many(keychains) == expected
+    assert settings.get_settings_many(iter(keychains)) == expected
+
+    # A compiled batch of keychains sees later changes
+    batch = compile_keychains(keychains)
+    settings.set_setting('d.a', 0)
+    assert settings.get_settings_many(batch)['d.a'] == 0
+    assert settings.snapshot().get_settings_many(batch) \
+        == settings.get_settings_many(keychains)
+
+def test_Settings1_set_settings(test_settings1, assert_index_in_sync):
+
+    default_settings_file = test_settings1['default-settings-file']
+    user_settings_file    = test_settings1['user-settings-file']
+
+    assignments = [
+        ('d.a', 0),
+        ('d.d.x', 2),
+        ('a.b', 1),
+        ('a', 5),
+        ('a.c', {'x': 1}),
+        ('a.c.y', 2),
+        ('new.new', {'x': [1, 2]}),
+        ('new.new.y', 3),
+        ('d.b', 4),
+    ]
+
+    for copy_on_write in [False, True]:
+        expected = Settings(default_settings_file, user_settings_file,
+                            copy_on_write=copy_on_write)
+        for keychain, value in copy.deepcopy(assignments):
+            expected.set_setting(keychain, value)
+
+        settings = Settings(default_settings_file, user_settings_file,
+                            copy_on_write=copy_on_write)
+        snapshot = settings.snapshot()
+        old_settings = copy.deepcopy(snapshot.settings)
+
+        settings.set_settings(copy.deepcopy(assignments))
+        assert settings.get_settings() == expected.get_settings()
+        assert settings.get_setting('a.c') == {'x': 1, 'y': 2}
+        assert settings.get_version() == snapshot.version + 1
+        assert_index_in_sync(settings)
+
+        # The changes are applied to a copy of the settings
+        assert snapshot.settings == old_settings
+
+    # Random assignments
+    rnd = random.Random(0)
+    keys = ['a', 'b', 'c', 'd']
+    for _ in range(100):
+        assignments = [
+            ('.'.join(rnd.choice(keys) for _ in range(rnd.randint(1, 4))),
+             rnd.choice([1, [2], {'a': 3}, {'b': {'c': 4}}]))
+            for _ in range(rnd.randint(1, 10))
+        ]
+
+        expected = Settings(default_settings_file, user_settings_file)
+        for keychain, value in copy.deepcopy(assignments):
+            expected.set_setting(keychain, value)
+
+        settings = Settings(default_settings_file, user_settings_file)
+        settings.set_settings(copy.deepcopy(assignments))
+        assert settings.get_settings() == expected.get_settings(), assignments
+        assert_index_in_sync(settings)
+
+def test_Settings1_transaction(test_settings1):
+
+    default_settings_file = test_settings1['default-settings-file']
+    user_settings_file    = test_settings1['user-settings-file']
+
+    settings = Settings(default_settings_file, user_settings_file)
+    version = settings.get_version()
+
+    with settings.transaction() as transaction:
+        transaction.set_setting('a', 10)
+        transaction.set_setting('d.a', 11)
+        assert len(transaction) == 2
+        # Nothing is changed before the transaction is committed
+        assert settings.get_setting('a') == 1
+
+    assert settings.get_settings_many(['a', 'd.a']) == {'a': 10, 'd.a': 11}
+    assert settings.get_version() == version + 1
+
+    # Empty transactions do not change the version
+    with settings.transaction():
+        pass
+    assert settings.get_version() == version + 1
+
+    # Transactions are rolled back on exceptions
+    with pytest.raises(RuntimeError):
+        with settings.transaction() as transaction:
+            transaction.set_setting('a', 20)
+            raise RuntimeError()
+    assert settings.get_setting('a') == 10
+
+    # Either all or none of the settings are set
+    with pytest.raises(TypeError):
+        settings.set_settings([('a', 30), (['x'], 31)])
+    assert settings.get_setting('a') == 10
+    assert settings.get_version() == version + 1
+
+    transaction = settings.transaction()
+    transaction.set_setting('a', 40)
+    transaction.rollback()
+    transaction.commit()
+    assert settings.get_setting('a') == 10
+
+def test_Settings1_cache(test_settings1, tmpdir, write_settings_file):
+
+    default_settings_file = str(test_settings1['default-settings-file'])
+    user_settings_file    = str(test_settings1['user-settings-file'])
+    cache_dir             = str(tmpdir.join('cache'))
+
+    settings = Settings(default_settings_file, user_settings_file,
+                        cache=cache_dir)
+    cache = settings.settings_cache
+    assert (cache.hits, cache.misses, cache.invalidations) == (0, 1, 0)
+    expected = settings.get_settings()
+
+    # Settings loaded from the cache
+    settings = Settings(default_settings_file, user_settings_file,
+                        cache=cache)
+    assert (cache.hits, cache.misses, cache.invalidations) == (1, 1, 0)
+    assert settings.get_settings() == expected
+    assert settings.get_setting('d.b') == 2
+
+    # Changes of the settings are not written to the cache
+    settings.set_setting('d.b', 0)
+    settings = Settings(default_settings_file, user_settings_file,
+                        cache=cache)
+    assert settings.get_setting('d.b') == 2
+
+    # Changing a settings file invalidates the cache
+    write_settings_file({'d': {'b': 5}}, user_settings_file)
+    settings = Settings(default_settings_file, user_settings_file,
+                        cache=cache)
+    assert (cache.hits, cache.misses, cache.invalidations) == (2, 2, 1)
+    assert settings.get_setting('d.b') == 5
+    assert settings.get_setting('d.c') == 1
+
+def test_Settings1_lazy(test_settings1, monkeypatch):
+
+    default_settings_file = str(test_settings1['default-settings-file'])
+    user_settings_file    = str(test_settings1['user-settings-file'])
+
+    with pytest.raises(FileNotFoundError) as e_info:
+        settings = Settings('some-non-existing-file', None, lazy=True)
+
+    loaded = []
+    load_settings_file = Settings.load_settings_file
+    def counting_load_settings_file(settings_file, loader=None):
+        loaded.append(settings_file)
+        time.sleep(0.01)
+        return load_settings_file(settings_file, loader)
+    monkeypatch.setattr(Settings, 'load_settings_file',
+                        staticmethod(counting_load_settings_file))
+
+    # The settings files are not loaded by the constructor
+    settings = Settings(default_settings_file, user_settings_file, lazy=True)
+    assert loaded == []
+
+    # ...but exactly once on the first access
+    results = []
+    def get_setting():
+        results.append(settings.get_setting('d.b'))
+
+    threads = [threading.Thread(target=get_setting) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [2] * 8
+    assert loaded == [default_settings_file, user_settings_file]
+
+    for access in [
+            lambda settings: settings.get_settings(),
+            lambda settings: settings.get_setting('a'),
+            lambda settings: settings.set_setting('a', 0),
+    ]:
+        del loaded[:]
+        settings = Settings(default_settings_file, None, lazy=True)
+        assert loaded == []
+        access(settings)
+        assert loaded == [default_settings_file]
+        assert settings.get_setting('d.c') == 1
+        assert len(loaded) == 1
+
+def test_Settings1_reload_settings(test_settings1, touch,
+                                   assert_index_in_sync):
+
+    default_settings_file = str(test_settings1['default-settings-file'])
+    user_settings_file    = str(test_settings1['user-settings-file'])
+
+    settings = Settings(default_settings_file, user_settings_file)
+    version = settings.get_version()
+    settings.set_setting('x', 'runtime')
+
+    # Nothing changed
+    assert settings.reload_settings() == False
+    assert settings.reload_settings() == False
+    assert settings.get_version() == version + 1
+
+    d = settings.get_setting('d')
+    d_d = settings.get_setting('d.d')
+
+    # Change the user settings
+    touch(user_settings_file, {
+        'b': 2,
+        'c': 3,
+        'd': {'b': 20, 'c': 3, 'd': [4, 5, 6]},
+        'e': {'f': 1},
+    })
+    assert settings.reload_settings() == True
+    assert settings.get_version() > version + 1
+    assert settings.get_settings() == {
+        'a': 1,
+        'b': 2,
+        'c': 3,
+        'd': {'a': 1, 'b': 20, 'c': 3, 'd': [4, 5, 6]},
+        'e': {'f': 1},
+        'x': 'runtime',
+    }
+    assert_index_in_sync(settings)
+
+    # Only the changed subtrees are replaced
+    assert settings.get_setting('d') is not d
+    assert settings.get_setting('d.d') is d_d
+    assert d == {'a': 1, 'b': 2, 'c': 3, 'd': [4, 5, 6]}
+
+    # Change the default settings
+    touch(default_settings_file, {'a': {'a': 1}, 'c': 1, 'd': 1})
+    assert settings.reload_settings() == True
+    assert settings.get_settings() == {
+        'a': {'a': 1},
+        'b': 2,
+        'c': 3,
+        'd': {'b': 20, 'c': 3, 'd': [4, 5, 6]},
+        'e': {'f': 1},
+        'x': 'runtime',
+    }
+    assert_index_in_sync(settings)
+
+    # Null values and values overwriting ancestors
+    touch(user_settings_file, {
+        'b': 2,
+        'c': None,
+        'd': {'b': 20, 'c': 3, 'd': [4, 5, 6]},
+        'e': {'f': 1},
+    })
+    assert settings.reload_settings() == True
+    assert settings.get_setting('c') == None
+    assert 'c' in settings.get_settings()
+    touch(default_settings_file, {'a': {'a': 1}, 'c': {'x': 1}, 'd': 1})
+    assert settings.reload_settings() == True
+    assert settings.get_setting('c') == None
+    assert_index_in_sync(settings)
+
+    # Remove the user settings file
+    os.remove(user_settings_file)
+    assert settings.reload_settings() == True
+    assert settings.get_settings() == {
+        'a': {'a': 1},
+        'c': {'x': 1},
+        'd': 1,
+        'x': 'runtime',
+    }
+    assert_index_in_sync(settings)
+
+    # Files which cannot be parsed are not used
+    with open(default_settings_file, 'w') as fh:
+        fh.write('a: [')
+    with pytest.raises(yaml.YAMLError):
+        settings.reload_settings()
+    assert settings.get_setting('a.a') == 1
+
+def test_Settings_reload_settings_removed_leaf(tmpdir, write_settings_file,
+                                               touch, assert_index_in_sync):
+
+    settings_file = str(tmpdir.join('settings.yaml'))
+
+    for copy_on_write in (False, True):
+        write_settings_file({'c': {'c': 1, 'k': 2}}, settings_file)
+        settings = Settings(settings_file, None, copy_on_write=copy_on_write)
+        assert settings.reload_settings() == False
+
+        # A leaf removed from the file is already missing
+        settings.set_setting('c', {'k': 3})
+        touch(settings_file, {'c': {'k': 2}})
+        assert settings.reload_settings() == True
+        assert settings.get_settings() == {'c': {'k': 3}}
+        assert_index_in_sync(settings)
+
+        # Later changes are reloaded
+        touch(settings_file, {'c': {'k': 4}})
+        assert settings.reload_settings() == True
+        assert settings.get_settings() == {'c': {'k': 4}}
+
+def test_Settings1_start_watching(test_settings1, write_settings_file):
+
+    default_settings_file = str(test_settings1['default-settings-file'])
+    user_settings_file    = str(test_settings1['user-settings-file'])
+
+    settings = Settings(default_settings_file, user_settings_file)
+    settings.start_watching(interval=0.001)
+    try:
+        # Readers never see partially reloaded settings
+        errors = []
+        stop = threading.Event()
+        def read():
+            while not stop.is_set():
+                dic = settings.get_settings()
+                if dic['p'] != dic['q']['r']:
+                    errors.append(dic)
+
+        write_settings_file({'p': 0, 'q': {'r': 0}}, user_settings_file)
+        settings.reload_settings()
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        for i in range(1, 20):
+            # Replace the file atomically
+            # to never have the watcher read a partially written file
+            tmp_file = user_settings_file + '.tmp'
+            write_settings_file({'p': i, 'q': {'r': i}, 'i': i}, tmp_file)
+            os.utime(tmp_file, ns=(i * 10**9, i * 10**9))
+            os.replace(tmp_file, user_settings_file)
+            deadline = time.time() + 10
+            while settings.get_setting('i') != i \
+                  and time.time() < deadline:
+                time.sleep(0.001)
+            assert settings.get_setting('i') == i
+        stop.set()
+        reader.join()
+        assert errors == []
+
+    finally:
+        settings.stop_watching()
+
+def test_Settings1_copy_on_write(test_settings1, assert_index_in_sync):
+
+    default_settings_file = str(test_settings1['default-settings-file'])
+    user_settings_file    = str(test_settings1['user-settings-file'])
+
+    settings = Settings(default_settings_file, user_settings_file)
+    cow_settings = Settings(default_settings_file, user_settings_file,
+                            copy_on_write=True)
+
+    snapshot = cow_settings.snapshot()
+    expected = copy.deepcopy(snapshot.get_settings())
+    expected_index = dict(flatten_recursively(expected))
+
+    for keychain, value in [
+            ('a', 0),
+            ('b.b', 2),
+            ('d.a', 0),
+            ('d.b.b', 2),
+            ('d.d', {'a': 1}),
+            ('d.d.b', 2),
+            ('e.e.e', 5),
+    ]:
+        settings.set_setting(keychain, value)
+        cow_settings.set_setting(keychain, value)
+        assert cow_settings.get_settings() == settings.get_settings()
+        assert_index_in_sync(cow_settings)
+
+    # The snapshot has not been changed
+    assert snapshot.get_settings() == expected
+    assert snapshot.index == expected_index
+    assert snapshot.get_setting('d.d') == [4, 5, 6]
+    assert cow_settings.get_setting('d.d') == {'a': 1, 'b': 2}
+    assert cow_settings.snapshot().version > snapshot.version
+
+    # Unchanged subtrees are shared
+    assert cow_settings.get_setting('d.d') is not snapshot.get_setting('d.d')
+    cow_settings.set_setting('x', 1)
+    assert cow_settings.get_setting('d.d') \
+        is cow_settings.snapshot().get_setting('d.d')
+
+def test_Settings1_copy_on_write_index_delta(test_settings1,
+                                             assert_index_in_sync):
+
+    default_settings_file = str(test_settings1['default-settings-file'])
+    user_settings_file    = str(test_settings1['user-settings-file'])
+
+    settings = Settings(default_settings_file, user_settings_file)
+    cow_settings = Settings(default_settings_file, user_settings_file,
+                            copy_on_write=True)
+    for i in range(100):
+        cow_settings.set_setting('n.n{}'.format(i), i)
+        settings.set_setting('n.n{}'.format(i), i)
+
+    # Changes share the index and only keep the changed entries
+    snapshot = cow_settings.snapshot()
+    cow_settings.set_setting('d.a', 0)
+    assert cow_settings.snapshot()._index is snapshot._index
+    assert cow_settings.snapshot()._delta
+
+    # Removed entries shadow the shared index
+    for keychain, value in [('d', 1), ('d.a', 2), ('n', None), ('d', {})]:
+        settings.set_setting(keychain, value)
+        cow_settings.set_setting(keychain, value)
+        for keychain in ('d', 'd.a', 'd.d', 'd.d.0', 'n', 'n.n1'):
+            assert cow_settings.get_setting(keychain) \
+                == settings.get_setting(keychain)
+        assert_index_in_sync(cow_settings)
+        assert cow_settings.get_settings_many(['d.a', 'd.d.0', 'n.n1']) \
+            == settings.get_settings_many(['d.a', 'd.d.0', 'n.n1'])
+
+    # Large deltas are merged into a new index
+    for i in range(100):
+        cow_settings.set_setting('m{}'.format(i), i)
+    assert len(cow_settings.snapshot()._delta) ** 2 \
+        <= len(cow_settings.snapshot()._index)
+    assert snapshot.index == dict(flatten_recursively(snapshot.get_settings()))
+
+def test_Settings1_copy_on_write_stress(test_settings1, assert_index_in_sync):
+
+    default_settings_file = str(test_settings1['default-settings-file'])
+    user_settings_file    = str(test_settings1['user-settings-file'])
+
+    settings = Settings(default_settings_file, user_settings_file,
+                        copy_on_write=True)
+    settings.set_setting('pair', {'x': 0, 'y': 0})
+
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        try:
+            while not stop.is_set():
+                snapshot = settings.snapshot()
+                # Iterating over a dictionary changed by another thread
+                # would raise a RuntimeError
+                for key, value in snapshot.get_settings().items():
+                    pass
+                for key, value in snapshot.get_setting('d').items():
+                    pass
+                if snapshot.get_setting('pair.x') \
+                   != snapshot.get_setting('pair.y'):
+                    errors.append('inconsistent pair')
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+
+    for i in range(2000):
+        settings.set_setting('d.new{}.x'.format(i), i)
+        settings.set_setting('new{}'.format(i % 100), i)
+        settings.set_setting('pair', {'x': i, 'y': i})
+
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    assert errors == []
+    assert settings.get_setting('d.new1999.x') == 1999
+    assert_index_in_sync(settings)
+
+def test_Settings1_aload(test_settings1, tmpdir, monkeypatch,
+                         write_settings_file):
+
+    default_settings_file = str(test_settings1['default-settings-file'])
+    user_settings_file    = str(test_settings1['user-settings-file'])
+
+    expected = Settings(default_settings_file, user_settings_file)
+
+    settings = asyncio.run(
+        Settings.aload(default_settings_file, user_settings_file))
+    assert settings.get_settings() == expected.get_settings()
+
+    # Many tenants sharing the same default settings file
+    user_settings_files = []
+    for i in range(20):
+        user_settings_file_i = str(tmpdir.join('user{}.yaml'.format(i)))
+        write_settings_file({'d': {'b': i}}, user_settings_file_i)
+        user_settings_files.append(user_settings_file_i)
+
+    lock = threading.Lock()
+    loaded = []
+    running = [0, 0]
+    load_settings_file = Settings.load_settings_file
+    def counting_load_settings_file(settings_file, loader=None):
+        with lock:
+            loaded.append(settings_file)
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return load_settings_file(settings_file, loader)
+    monkeypatch.setattr(Settings, 'load_settings_file',
+                        staticmethod(counting_load_settings_file))
+
+    settings = asyncio.run(Settings.aload_many(
+        [(default_settings_file, user_settings_file_i)
+         for user_settings_file_i in user_settings_files],
+        max_concurrency=3))
+
+    assert [s.get_setting('d.b') for s in settings] == list(range(20))
+    assert [s.get_setting('d.a') for s in settings] == [1] * 20
+
+    # The default settings file has been parsed only once
+    assert loaded.count(default_settings_file) == 1
+    assert len(loaded) == 21
+    assert running[1] <= 3
+
+    # The shared default settings are not shared by the Settings
+    settings[0].set_setting('d.a', 0)
+    assert settings[1].get_setting('d.a') == 1
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(Settings.aload_many([('some-non-existing-file', None)]))
+
 ## =========================================================
 ## Test fixtures
 ## ---------------------------------------------------------
 
 @pytest.fixture()
-def test_settings2(tmpdir):
+def test_settings2(tmpdir, write_settings_file):
     """Create a default settings test file"""
 
     # Test default settings
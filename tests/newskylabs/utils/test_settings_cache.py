@@ -0,0 +1,108 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_settings_cache.py:
+
+Tests for newskylabs/utils/settings_cache.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_settings_cache.py
+
+"""
+
+import os
+import threading
+
+import pytest
+
+## =========================================================
+## Tests for SettingsCache
+## ---------------------------------------------------------
+
+from newskylabs.utils.settings_cache import SettingsCache
+
+def test_SettingsCache(tmpdir):
+
+    settings_file = tmpdir.join('settings.yaml')
+    settings_file.write('a: 1\n')
+    missing_file = tmpdir.join('missing.yaml')
+
+    cache = SettingsCache(str(tmpdir.join('cache')))
+
+    fingerprint = cache.fingerprint(str(settings_file), str(missing_file))
+    assert fingerprint[0][0] == str(settings_file)
+    assert fingerprint[0][2] == 5
+    assert fingerprint[1] == (str(missing_file), None, None, None)
+
+    # Miss
+    assert cache.load(fingerprint) == None
+    assert (cache.hits, cache.misses, cache.invalidations) == (0, 1, 0)
+
+    # Hit
+    cache.store(fingerprint, {'a': 1})
+    assert cache.load(fingerprint) == {'a': 1}
+    assert (cache.hits, cache.misses, cache.invalidations) == (1, 1, 0)
+
+    # Invalidation by changing the content
+    settings_file.write('a: 2\n')
+    fingerprint2 = cache.fingerprint(str(settings_file), str(missing_file))
+    assert fingerprint2 != fingerprint
+    assert cache.cache_file(fingerprint2) == cache.cache_file(fingerprint)
+    assert cache.load(fingerprint2, 'default') == 'default'
+    assert (cache.hits, cache.misses, cache.invalidations) == (1, 2, 1)
+
+    # Invalidation by creating a missing file
+    missing_file.write('b: 1\n')
+    assert cache.fingerprint(str(settings_file), str(missing_file)) \
+        != fingerprint2
+
+    # Corrupt cache files are invalidated as well
+    with open(cache.cache_file(fingerprint), 'wb') as fh:
+        fh.write(b'garbage')
+    assert cache.load(fingerprint) == None
+    assert (cache.hits, cache.misses, cache.invalidations) == (1, 3, 2)
+
+def test_SettingsCache_concurrent_store(tmpdir):
+
+    cache_dir = str(tmpdir.join('cache'))
+    settings_file = tmpdir.join('settings.yaml')
+    settings_file.write('a: 1\n')
+
+    fingerprint = SettingsCache.fingerprint(str(settings_file))
+    settings = {'key{}'.format(i): list(range(100)) for i in range(100)}
+
+    def store():
+        for _ in range(20):
+            SettingsCache(cache_dir).store(fingerprint, settings)
+
+    threads = [threading.Thread(target=store) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert SettingsCache(cache_dir).load(fingerprint) == settings
+
+    # No temporary files are left behind
+    assert os.listdir(cache_dir) == [
+        os.path.basename(SettingsCache(cache_dir).cache_file(fingerprint))
+    ]
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,176 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_settings_dir.py:
+
+Tests for newskylabs/utils/settings_dir.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_settings_dir.py
+
+"""
+
+import copy
+import os
+import random
+
+import pytest
+import yaml
+
+from newskylabs.utils.settings import Settings
+
+## =========================================================
+## Test utilities
+## ---------------------------------------------------------
+
+def merge_sequentially(fragments):
+    merged = None
+    for fragment in copy.deepcopy(fragments):
+        if fragment is not None:
+            merged = fragment if merged is None else \
+                Settings.merge_settings(merged, fragment)
+    return merged
+
+def random_fragment(rnd, depth=3):
+    """Make a random settings fragment over a small set of keys."""
+
+    fragment = {}
+    for key in rnd.sample('abcd', rnd.randint(0, 3)):
+        if depth > 0 and rnd.random() < 0.6:
+            fragment[key] = random_fragment(rnd, depth - 1)
+        else:
+            fragment[key] = rnd.choice([1, 2, [3], None])
+    return fragment
+
+## =========================================================
+## Tests for merge_settings_fragments()
+## ---------------------------------------------------------
+
+from newskylabs.utils.settings_dir import merge_settings_fragments
+
+def test_merge_settings_fragments():
+
+    assert merge_settings_fragments([]) == None
+    assert merge_settings_fragments([None]) == None
+    assert merge_settings_fragments([{'a': 1}, None]) == {'a': 1}
+
+    # Merging settings is not associative
+    fragments = [{'x': {'p': 1}}, {'x': 1}, {'x': {'q': 2}}]
+    assert merge_settings_fragments(copy.deepcopy(fragments)) \
+        == merge_sequentially(fragments) == {'x': {'q': 2}}
+
+    fragments = [1, {'x': {'p': 1}}, {'x': {'q': 2}}]
+    assert merge_settings_fragments(copy.deepcopy(fragments)) \
+        == merge_sequentially(fragments) == {'x': {'p': 1, 'q': 2}}
+
+    # The merged settings only consist of plain dictionaries
+    merged = merge_settings_fragments(
+        [{'x': {'p': 1}}, {'x': 1}, {'x': {'q': {'r': 2}}}, {'y': 1}])
+    assert type(merged) is dict
+    assert type(merged['x']) is dict
+    assert type(merged['x']['q']) is dict
+
+    rnd = random.Random(0)
+    for _ in range(500):
+        fragments = [random_fragment(rnd) for _ in range(rnd.randint(1, 9))]
+        assert merge_settings_fragments(copy.deepcopy(fragments)) \
+            == merge_sequentially(fragments), fragments
+
+## =========================================================
+## Tests for load_settings_dir()
+## ---------------------------------------------------------
+
+from newskylabs.utils.settings_dir import list_settings_dir
+
+@pytest.fixture()
+def settings_dir(tmpdir):
+    """Create a settings directory"""
+
+    settings_dir = tmpdir.mkdir('conf.d')
+    for name, fragment in [
+            ('10-base.yaml',  {'a': 1, 'b': {'c': 1, 'd': 1}}),
+            ('20-site.yml',   {'b': {'c': 2}}),
+            ('30-empty.yaml', None),
+            ('40-local.yaml', {'b': {'d': 4}, 'e': [4]}),
+            ('.50-hidden.yaml', {'a': 5}),
+            ('60-ignored.txt',  {'a': 6}),
+    ]:
+        with open(str(settings_dir.join(name)), 'w') as fh:
+            if fragment is not None:
+                yaml.dump(fragment, fh)
+
+    return str(settings_dir)
+
+def test_load_settings_dir(settings_dir):
+
+    assert [path[len(settings_dir) + 1:]
+            for path in list_settings_dir(settings_dir)] \
+        == ['10-base.yaml', '20-site.yml', '30-empty.yaml', '40-local.yaml']
+
+    expected = {'a': 1, 'b': {'c': 2, 'd': 4}, 'e': [4]}
+    for executor in [None, 'thread', 'process']:
+        assert Settings.load_settings_dir(
+            settings_dir, executor=executor, max_workers=2) == expected
+
+    with pytest.raises(ValueError):
+        Settings.load_settings_dir(settings_dir, executor='unknown')
+
+def test_Settings_settings_dir(settings_dir, tmpdir):
+
+    settings = Settings(settings_dir, None)
+    assert settings.get_setting('b.c') == 2
+
+    user_settings_file = str(tmpdir.join('user.yaml'))
+    with open(user_settings_file, 'w') as fh:
+        yaml.dump({'b': {'c': 3}}, fh)
+
+    cache_dir = str(tmpdir.join('cache'))
+    settings = Settings(settings_dir, user_settings_file, cache=cache_dir)
+    assert settings.get_setting('b') == {'c': 3, 'd': 4}
+    settings = Settings(settings_dir, user_settings_file, cache=cache_dir)
+    assert settings.settings_cache.hits == 1
+
+    # Changing a fragment is detected
+    with open(list_settings_dir(settings_dir)[-1], 'w') as fh:
+        yaml.dump({'b': {'d': 5}, 'x': 1}, fh)
+    assert settings.reload_settings() == True
+    assert settings.get_setting('b') == {'c': 3, 'd': 5}
+    assert settings.get_setting('x') == 1
+
+    settings = Settings(settings_dir, user_settings_file, cache=cache_dir)
+    assert settings.settings_cache.invalidations == 1
+    assert settings.get_setting('x') == 1
+
+def test_Settings_settings_dir_vanished_fragment(settings_dir, monkeypatch):
+
+    settings = Settings(settings_dir, None)
+
+    # A fragment deleted between listing the directory and its stat
+    monkeypatch.setattr(
+        'newskylabs.utils.settings.list_settings_dir',
+        lambda path: list_settings_dir(path) + [path + '/99-vanished.yaml'])
+    assert settings.reload_settings() == False
+
+    os.remove(list_settings_dir(settings_dir)[-1])
+    assert settings.reload_settings() == True
+    assert settings.get_setting('b') == {'c': 2, 'd': 1}
+    assert settings.get_setting('e') == None
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,225 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_settings_env.py:
+
+Tests for newskylabs/utils/settings_env.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_settings_env.py
+
+"""
+
+import datetime
+import os
+
+import pytest
+
+from newskylabs.utils.settings import Settings
+
+
+## =========================================================
+## Test fixtures
+## ---------------------------------------------------------
+
+@pytest.fixture()
+def settings_file(tmpdir, write_settings_file):
+    """Create a settings file"""
+
+    settings_file = str(tmpdir.join('settings.yaml'))
+    write_settings_file({
+        'db': {'host': 'db1', 'port': 5432},
+        'debug': False,
+    }, settings_file)
+
+    return settings_file
+
+## =========================================================
+## Tests for parse_environment_value()
+## ---------------------------------------------------------
+
+from newskylabs.utils.settings_env import parse_environment_value
+
+def test_parse_environment_value():
+
+    for value, parsed in (('5433', 5433),
+                          ('-1.5', -1.5),
+                          ('yes', True),
+                          ('false', False),
+                          ('', None),
+                          ('~', None),
+                          ('2019-01-01', datetime.date(2019, 1, 1)),
+                          ('db1', 'db1'),
+                          ('a #b', 'a #b'),
+                          ('[1, 2]', '[1, 2]'),
+                          ('{a: 1}', '{a: 1}'),
+                          ('<<', '<<'),
+                          ('=', '=')):
+        assert parse_environment_value(value) == parsed
+
+## =========================================================
+## Tests for EnvironmentOverlay
+## ---------------------------------------------------------
+
+from newskylabs.utils.settings_env import EnvironmentOverlay
+
+def test_EnvironmentOverlay():
+
+    environ = {
+        'APP__DB__PORT': '5433',
+        'APP__DEBUG': 'true',
+        'APP__DB____X': '1',
+        'APP__': '1',
+        'OTHER__DB__PORT': '1',
+        'PATH': '/bin',
+    }
+    overlay = EnvironmentOverlay('APP__', environ=environ)
+    assert overlay.mapping == {
+        'APP__DB__PORT': ('db', 'port'),
+        'APP__DEBUG': ('debug',),
+    }
+
+    assert overlay.changes() == [(('debug',), True), (('db', 'port'), 5433)]
+    assert overlay.changes() == []
+    assert overlay.changes(all=True) \
+        == [(('debug',), True), (('db', 'port'), 5433)]
+
+    # Only changed variables are returned
+    environ['APP__DB__PORT'] = '5434'
+    assert overlay.changes() == [(('db', 'port'), 5434)]
+
+    # New variables are only found after scanning the environment
+    environ['APP__DB__HOST'] = 'db2'
+    assert overlay.changes() == []
+    overlay.scan()
+    assert overlay.changes() == [(('db', 'host'), 'db2')]
+
+    # Removed variables do not change the settings
+    del environ['APP__DEBUG']
+    assert overlay.changes() == []
+    environ['APP__DEBUG'] = 'true'
+    assert overlay.changes() == [(('debug',), True)]
+
+    # Variables overwriting ancestors come first
+    overlay = EnvironmentOverlay(
+        'X_', separator='_', lowercase=False,
+        environ={'X_a_b_C': '1', 'X_a': '{}', 'X_a_b': 'x'})
+    assert [keys for keys, _ in overlay.changes()] \
+        == [('a',), ('a', 'b'), ('a', 'b', 'C')]
+
+    with pytest.raises(ValueError):
+        EnvironmentOverlay('')
+
+## =========================================================
+## Tests for Settings with an environment overlay
+## ---------------------------------------------------------
+
+def test_Settings_environment(settings_file, monkeypatch,
+                              write_settings_file, touch,
+                              assert_index_in_sync):
+
+    monkeypatch.setenv('APP__DB__PORT', '5433')
+    monkeypatch.setenv('APP__CACHE__SIZE', '10')
+
+    for copy_on_write in (False, True):
+        environ = dict(os.environ)
+        settings = Settings(
+            settings_file, None, copy_on_write=copy_on_write,
+            environment=EnvironmentOverlay('APP__', environ=environ))
+
+        # Applied when loaded
+        assert settings.get_setting('db.port') == 5433
+        assert settings.get_setting('db.host') == 'db1'
+        assert settings.get_setting('cache.size') == 10
+        assert_index_in_sync(settings)
+
+        # Refreshing the environment
+        version = settings.get_version()
+        assert settings.refresh_environment() == False
+        assert settings.get_version() == version
+
+        environ['APP__DB__PORT'] = '5434'
+        environ['APP__DEBUG'] = 'on'
+        assert settings.refresh_environment() == True
+        assert settings.get_setting('db.port') == 5434
+        assert settings.get_setting('debug') == False
+        assert settings.get_version() == version + 1
+        assert settings.refresh_environment(rescan=True) == True
+        assert settings.get_setting('debug') == True
+        assert_index_in_sync(settings)
+
+        # The environment overwrites reloaded settings
+        touch(settings_file, {'db': {'host': 'db2', 'port': 1}, 'debug': False})
+        assert settings.reload_settings() == True
+        assert settings.get_setting('db') == {'host': 'db2', 'port': 5434}
+        assert settings.get_setting('debug') == True
+        touch(settings_file, {'db': {'host': 'db3', 'port': 1}, 'debug': False})
+        assert settings.reload_settings() == True
+        assert settings.get_setting('db') == {'host': 'db3', 'port': 5434}
+        assert settings.get_setting('debug') == True
+        assert_index_in_sync(settings)
+
+        write_settings_file({'db': {'host': 'db1', 'port': 5432},
+                             'debug': False}, settings_file)
+
+    # Environment variables given by their prefix
+    settings = Settings(settings_file, None, environment='APP__')
+    assert isinstance(settings.environment, EnvironmentOverlay)
+    assert settings.get_setting('db.port') == 5433
+
+    # Validated with the settings
+    monkeypatch.setenv('APP__DB__PORT', '5435')
+    settings = Settings(settings_file, None, environment='APP__',
+                        schema={'db': {'host': str, 'port': str},
+                                'debug': bool, '*': None})
+    assert settings.get_setting('db.port') == '5435'
+
+    with pytest.raises(TypeError):
+        Settings(settings_file, None).refresh_environment()
+
+def test_Settings_environment_reload_removed_leaf(settings_file,
+                                                  write_settings_file, touch,
+                                                  assert_index_in_sync):
+
+    environ = {'APP__DB': 'x', 'APP__CACHE__SIZE': '10'}
+
+    for copy_on_write in (False, True):
+        write_settings_file({'db': {'host': 'db1', 'port': 5432},
+                             'cache': {'size': 1, 'ttl': 2}}, settings_file)
+        settings = Settings(
+            settings_file, None, copy_on_write=copy_on_write,
+            environment=EnvironmentOverlay('APP__', environ=environ))
+        assert settings.reload_settings() == False
+        settings.set_setting('cache', {'size': 10})
+
+        # Settings removed below settings replaced by the environment
+        touch(settings_file, {'db': {'host': 'db1'},
+                              'cache': {'size': 1}})
+        assert settings.reload_settings() == True
+        assert settings.get_settings() == {'db': 'x', 'cache': {'size': 10}}
+        assert_index_in_sync(settings)
+
+        touch(settings_file, {'db': {'host': 'db2'},
+                              'cache': {'size': 1, 'ttl': 3}})
+        assert settings.reload_settings() == True
+        assert settings.get_settings() == {'db': 'x',
+                                           'cache': {'size': 10, 'ttl': 3}}
+
+## =========================================================
+## =========================================================
+
+## fin.
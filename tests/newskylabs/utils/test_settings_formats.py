@@ -0,0 +1,156 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_settings_formats.py:
+
+Tests for newskylabs/utils/settings_formats.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_settings_formats.py
+
+"""
+
+import os
+
+import pytest
+
+from newskylabs.utils.settings import Settings
+
+## =========================================================
+## Test fixtures
+## ---------------------------------------------------------
+
+SETTINGS = {
+    'service': {'db': {'host': 'db1', 'port': 5432, 'timeout': 1.5}},
+    'routes': [{'path': '/'}, {'path': '/x'}],
+    'debug': False,
+}
+
+## =========================================================
+## Tests for the settings formats
+## ---------------------------------------------------------
+
+from newskylabs.utils.settings_formats import (
+    SettingsFormat,
+    YAML_FORMAT,
+    JSON_FORMAT,
+    MARSHAL_FORMAT,
+    TOML_FORMAT,
+    get_settings_format,
+    register_settings_format,
+    settings_file_suffixes,
+    write_settings_file,
+)
+
+def test_get_settings_format():
+
+    assert get_settings_format('a/settings.yaml') is YAML_FORMAT
+    assert get_settings_format('settings.yml') is YAML_FORMAT
+    assert get_settings_format('settings.JSON') is JSON_FORMAT
+    assert get_settings_format('settings.marshal') is MARSHAL_FORMAT
+    assert get_settings_format('settings.toml') is TOML_FORMAT \
+        or TOML_FORMAT is None
+    assert get_settings_format('settings.conf') is YAML_FORMAT
+    assert get_settings_format('settings') is YAML_FORMAT
+    assert get_settings_format('settings', None) is None
+
+    assert {'.yaml', '.yml', '.json', '.marshal'} \
+        <= set(settings_file_suffixes())
+
+@pytest.mark.parametrize('suffix', ['.yaml', '.json', '.marshal'])
+def test_write_settings_file(tmpdir, suffix):
+
+    settings_file = str(tmpdir.join('settings' + suffix))
+    write_settings_file(SETTINGS, settings_file)
+
+    assert Settings.load_settings_file(settings_file) == SETTINGS
+    assert Settings.load_settings_file(
+        settings_file, prefixes=['service.db.port', 'routes.1']) == {
+            'service': {'db': {'port': 5432}},
+            'routes': [None, {'path': '/x'}],
+        }
+    assert Settings(settings_file, None).get_setting('routes.1.path') == '/x'
+
+    # Temporary files are removed
+    assert os.listdir(str(tmpdir)) == ['settings' + suffix]
+
+def test_toml_format(tmpdir):
+
+    if TOML_FORMAT is None:
+        pytest.skip('tomllib is not available')
+
+    settings_file = str(tmpdir.join('settings.toml'))
+    with open(settings_file, 'w') as fh:
+        fh.write('debug = false\n'
+                 '[service.db]\n'
+                 'host = "db1"\n'
+                 'port = 5432\n'
+                 'timeout = 1.5\n'
+                 '[[routes]]\n'
+                 'path = "/"\n'
+                 '[[routes]]\n'
+                 'path = "/x"\n')
+
+    assert Settings.load_settings_file(settings_file) == SETTINGS
+
+    # TOML files are read-only
+    with pytest.raises(ValueError):
+        write_settings_file(SETTINGS, settings_file)
+
+def test_marshal_format(tmpdir):
+
+    settings_file = str(tmpdir.join('settings.marshal'))
+    for content in (b'', b'{}', b'NSLMRSH\xff'):
+        with open(settings_file, 'wb') as fh:
+            fh.write(content)
+        with pytest.raises(ValueError):
+            Settings.load_settings_file(settings_file)
+
+def test_register_settings_format(tmpdir, monkeypatch):
+
+    from newskylabs.utils import settings_formats
+    monkeypatch.setattr(settings_formats, '_FORMATS',
+                        dict(settings_formats._FORMATS))
+
+    lines_format = SettingsFormat(
+        'lines', ['.lines'],
+        lambda fh: {'lines': fh.read().decode('utf-8').splitlines()})
+    register_settings_format(lines_format)
+    assert get_settings_format('a.lines') is lines_format
+
+    settings_file = str(tmpdir.join('a.lines'))
+    with open(settings_file, 'w') as fh:
+        fh.write('a\nb\n')
+    assert Settings.load_settings_file(settings_file) \
+        == {'lines': ['a', 'b']}
+
+    # Settings directories load all registered formats
+    settings_dir = tmpdir.mkdir('conf.d')
+    write_settings_file({'a': 1, 'b': 1}, str(settings_dir.join('10.json')))
+    write_settings_file({'b': 2}, str(settings_dir.join('20.yaml')))
+    write_settings_file({'c': 3}, str(settings_dir.join('30.marshal')))
+    with open(str(settings_dir.join('40.lines')), 'w') as fh:
+        fh.write('x\n')
+    with open(str(settings_dir.join('50.txt')), 'w') as fh:
+        fh.write('ignored')
+    assert Settings.load_settings_dir(str(settings_dir)) \
+        == {'a': 1, 'b': 2, 'c': 3, 'lines': ['x']}
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,226 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_settings_mmap.py:
+
+Tests for newskylabs/utils/settings_mmap.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_settings_mmap.py
+
+"""
+
+import datetime
+import gc
+import multiprocessing
+import os
+
+import pytest
+
+from newskylabs.utils.generic import (
+    set_recursively,
+    get_recursively,
+    flatten_recursively,
+)
+
+## =========================================================
+## Tests for write_mapped_settings() and MappedSettings
+## ---------------------------------------------------------
+
+from newskylabs.utils.settings_mmap import (
+    write_mapped_settings,
+    MappedSettings,
+)
+
+def test_MappedSettings(tmpdir):
+
+    settings = {
+        'service': {
+            'db': {'host': 'db1', 'port': 5432, 'replicas': []},
+            'servers': [{'port': 80}, {'port': 8080}, [1, 2]],
+            'empty': {},
+        },
+        'numbers': list(range(12)),
+        'date': datetime.date(2019, 1, 1),
+        'none': None,
+        'unicode': {'ключ': 'значение'},
+        'key.with.dots': 1,
+        1: 'not a keychain',
+    }
+    mapped_file = str(tmpdir.join('settings.map'))
+    write_mapped_settings(settings, mapped_file)
+
+    with MappedSettings(mapped_file) as mapped:
+        assert len(mapped) == len(list(flatten_recursively(settings)))
+
+        expected = dict(settings)
+        del expected['key.with.dots']
+        del expected[1]
+        assert mapped.get_settings() == expected
+
+        for keychain, value in flatten_recursively(settings):
+            assert mapped.get_setting(keychain) == value
+
+        for keychain in ['service.servers.01.port', 'numbers.011',
+                         'undefined', 'service.undefined', 'none.x',
+                         'service.db.host.x', 'service.servers.3',
+                         'service.servers.x', 'numbers.-1']:
+            assert mapped.get_setting(keychain) \
+                == get_recursively(settings, keychain)
+
+    # Siblings with keys sorting between a parent and its children
+    settings = {
+        'db': {'host': 'h', 'port': 1},
+        'db-replica': {'host': 'r', 'port': 2},
+        'db!': [1, {'x': 2}],
+        'numbers': list(range(12)),
+    }
+    write_mapped_settings(settings, mapped_file)
+    with MappedSettings(mapped_file) as mapped:
+        assert mapped.get_settings() == settings
+        assert mapped.get_setting('db') == {'host': 'h', 'port': 1}
+        for keychain, value in flatten_recursively(settings):
+            assert mapped.get_setting(keychain) == value
+
+    # Settings which are not dictionaries
+    write_mapped_settings([1, {'a': 2}], mapped_file)
+    with MappedSettings(mapped_file) as mapped:
+        assert mapped.get_settings() == [1, {'a': 2}]
+        assert mapped.get_setting('1.a') == 2
+
+    write_mapped_settings(None, mapped_file)
+    with MappedSettings(mapped_file) as mapped:
+        assert mapped.get_settings() == None
+        assert mapped.get_setting('a') == None
+
+    not_mapped_file = str(tmpdir.join('settings.yaml'))
+    with open(not_mapped_file, 'w') as fh:
+        fh.write('a: 1\n' * 100)
+    with pytest.raises(ValueError):
+        MappedSettings(not_mapped_file)
+
+def test_Settings_write_mapped_settings(tmpdir):
+
+    from newskylabs.utils.settings import Settings
+
+    settings_file = str(tmpdir.join('settings.yaml'))
+    with open(settings_file, 'w') as fh:
+        fh.write('a: {b: 1, c: [1, 2]}\n')
+
+    settings = Settings(settings_file, None)
+    settings.set_setting('a.d', 3)
+
+    mapped_file = str(tmpdir.join('settings.map'))
+    settings.write_mapped_settings(mapped_file)
+
+    # Processes which mapped the file before keep their version
+    with MappedSettings(mapped_file) as mapped:
+        settings.set_setting('a.b', 2)
+        settings.write_mapped_settings(mapped_file)
+        assert mapped.get_setting('a') == {'b': 1, 'c': [1, 2], 'd': 3}
+        with MappedSettings(mapped_file) as remapped:
+            assert remapped.get_setting('a.b') == 2
+
+## =========================================================
+## Test the memory of forked workers
+## ---------------------------------------------------------
+
+def private_dirty_memory():
+    """Return the private dirty memory of the process in kB."""
+
+    with open('/proc/self/smaps_rollup') as fh:
+        for line in fh:
+            if line.startswith('Private_Dirty:'):
+                return int(line.split()[1])
+
+def make_keychains(leaves):
+    return ['section{}.key{}'.format(i // 100, i) for i in range(leaves)]
+
+def make_settings(leaves):
+    settings = {}
+    for i, keychain in enumerate(make_keychains(leaves)):
+        set_recursively(settings, keychain, 'value{}'.format(i))
+    return settings
+
+def read_settings(get_setting, leaves, connection):
+    """Read all settings in a forked worker and report the memory used."""
+
+    keychains = make_keychains(leaves)
+
+    before = private_dirty_memory()
+    for keychain in keychains:
+        get_setting(keychain)
+    connection.send(private_dirty_memory() - before)
+    connection.close()
+
+def worker_memory(workers, get_setting, leaves):
+    """Return the memory used by forked workers reading all settings."""
+
+    context = multiprocessing.get_context('fork')
+
+    # Keep the garbage collector of the workers
+    # from touching the objects of the parent process
+    gc.freeze()
+
+    connections = []
+    processes = []
+    for _ in range(workers):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=read_settings, args=(get_setting, leaves, sender))
+        process.start()
+        connections.append(receiver)
+        processes.append(process)
+
+    memory = [connection.recv() for connection in connections]
+    for process in processes:
+        process.join()
+
+    gc.unfreeze()
+
+    return memory
+
+@pytest.mark.skipif(
+    not os.path.exists('/proc/self/smaps_rollup')
+    or not 'fork' in multiprocessing.get_all_start_methods(),
+    reason='Needs /proc/self/smaps_rollup and fork()')
+def test_MappedSettings_workers(tmpdir):
+
+    leaves = 50000
+    settings = make_settings(leaves)
+
+    mapped_file = str(tmpdir.join('settings.map'))
+    write_mapped_settings(settings, mapped_file)
+
+    # Reading the settings tree inherited from the parent process
+    # copies the pages of the tree into every worker
+    plain = worker_memory(
+        1, lambda keychain: get_recursively(settings, keychain), leaves)
+    del settings
+    gc.collect()
+
+    # The pages of the mapped settings are shared
+    # and the memory of the workers does not grow with their number
+    with MappedSettings(mapped_file) as mapped:
+        for workers in [1, 4]:
+            memory = worker_memory(workers, mapped.get_setting, leaves)
+            assert max(memory) < plain[0] / 4
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,116 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/newskylabs/utils/test_settings_partial.py:
+
+Tests for newskylabs/utils/settings_partial.py
+
+Usage:
+
+pytest tests/newskylabs/utils/test_settings_partial.py
+
+"""
+
+import pytest
+import yaml
+
+from newskylabs.utils.generic import get_recursively
+
+## =========================================================
+## Test utilities
+## ---------------------------------------------------------
+
+LOADERS = [yaml.SafeLoader]
+if hasattr(yaml, 'CSafeLoader'):
+    LOADERS.append(yaml.CSafeLoader)
+
+SETTINGS = """
+base: &base {host: localhost, port: 1, options: {a: 1}}
+service:
+  db:
+    <<: *base
+    port: 5432
+  cache: {servers: [a, b, {host: c}]}
+  on: 5
+routes: [a, b, {c: d}, e]
+big: {k1: v, k2: [1, 2, 3], k3: &anchor {z: 1}}
+ref: *anchor
+date: 2019-01-01
+"""
+
+## =========================================================
+## Tests for load_partial_settings()
+## ---------------------------------------------------------
+
+from newskylabs.utils.settings_partial import load_partial_settings
+
+@pytest.mark.parametrize('loader', LOADERS)
+def test_load_partial_settings(loader):
+
+    settings = yaml.load(SETTINGS, Loader=loader)
+
+    for prefixes, expected in [
+            (['service.db'],
+             {'service': {'db': {'host': 'localhost', 'port': 5432,
+                                 'options': {'a': 1}}}}),
+            (['service.db.host', 'service.cache.servers.2.host'],
+             {'service': {'db': {'host': 'localhost'},
+                          'cache': {'servers': [None, None, {'host': 'c'}]}}}),
+            (['routes.2.c', 'routes.01'],
+             {'routes': [None, 'b', {'c': 'd'}]}),
+            (['ref.z', 'big.k2'],
+             {'big': {'k2': [1, 2, 3]}, 'ref': {'z': 1}}),
+            (['service', 'service.db'],
+             {'service': settings['service']}),
+            (['date'], {'date': settings['date']}),
+            (['undefined', 'service.db.port.x'], {'service': {'db': {}}}),
+            ([], {}),
+    ]:
+        partial = load_partial_settings(SETTINGS, prefixes, loader)
+        assert partial == expected
+        for prefix in prefixes:
+            assert get_recursively(partial, prefix) \
+                == get_recursively(settings, prefix)
+
+@pytest.mark.parametrize('loader', LOADERS)
+def test_load_partial_settings_skipped(loader):
+
+    # Skipped settings are not constructed
+    partial = load_partial_settings(
+        'a: 1\nb: !!python/name:os.system\n', ['a'], loader)
+    assert partial == {'a': 1}
+
+    with pytest.raises(yaml.constructor.ConstructorError):
+        load_partial_settings(
+            'a: 1\nb: !!python/name:os.system\n', ['b'], loader)
+
+    # Lists as root
+    assert load_partial_settings('[1, {a: 2}]', ['1.a'], loader) \
+        == [None, {'a': 2}]
+
+    assert load_partial_settings('', ['a'], loader) == None
+    assert load_partial_settings('1', ['a'], loader) == None
+
+    with pytest.raises(yaml.composer.ComposerError):
+        load_partial_settings('a: 1\n---\nb: 2\n', ['a'], loader)
+
+    with pytest.raises(yaml.YAMLError):
+        load_partial_settings('a: [1\nb: 2\n', ['b'], loader)
+
+## =========================================================
+## =========================================================
+
+## fin.